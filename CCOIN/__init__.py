@@ -1,3 +1,7 @@
+from .utils.log_config import configure_logging
+
+configure_logging()
+
 from .models.usertask import UserTask
 from .models.user import User
 from .models.airdrop import Airdrop
\ No newline at end of file
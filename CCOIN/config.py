@@ -65,8 +65,85 @@ CACHE_TTL = int(os.getenv("CACHE_TTL", "300"))
 RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
 GLOBAL_RATE_LIMIT = os.getenv("GLOBAL_RATE_LIMIT", "100/minute")
 
+TELEGRAM_API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL", "https://api.telegram.org").rstrip("/")
+TELEGRAM_POOL_SIZE = int(os.getenv("TELEGRAM_POOL_SIZE", "64"))
+TELEGRAM_POOL_TIMEOUT = float(os.getenv("TELEGRAM_POOL_TIMEOUT", "5"))
+UPDATE_QUEUE_WORKERS = int(os.getenv("UPDATE_QUEUE_WORKERS", "8"))
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "10000"))
+UPDATE_DEDUPE_TTL = int(os.getenv("UPDATE_DEDUPE_TTL", "3600"))
+
+# one instance at a time registers the webhook and runs scheduled jobs; a dead leader's lock expires after LEADER_TTL
+LEADER_KEY = os.getenv("LEADER_KEY", "ccoin:leader")
+LEADER_TTL = int(os.getenv("LEADER_TTL", "30"))  # seconds
+
+TELEGRAM_API_RATE = float(os.getenv("TELEGRAM_API_RATE", "20"))  # Bot API calls per second
+TELEGRAM_API_BURST = int(os.getenv("TELEGRAM_API_BURST", "30"))
+
+TELEGRAM_SEND_RATE = float(os.getenv("TELEGRAM_SEND_RATE", "25"))  # messages per second, Telegram allows ~30
+TELEGRAM_SEND_CHAT_INTERVAL = float(os.getenv("TELEGRAM_SEND_CHAT_INTERVAL", "1.0"))  # seconds between messages to one chat
+TELEGRAM_SEND_WORKERS = int(os.getenv("TELEGRAM_SEND_WORKERS", "8"))
+TELEGRAM_SEND_MAX_ATTEMPTS = int(os.getenv("TELEGRAM_SEND_MAX_ATTEMPTS", "5"))
+TELEGRAM_SEND_WAIT_TIMEOUT = float(os.getenv("TELEGRAM_SEND_WAIT_TIMEOUT", "15"))
+BROADCAST_PAGE_SIZE = int(os.getenv("BROADCAST_PAGE_SIZE", "500"))
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN")
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")  # bearer token for /metrics; unset hides the endpoint
+
+REGISTRATION_BATCH_WINDOW = float(os.getenv("REGISTRATION_BATCH_WINDOW", "0.02"))  # seconds to gather /start writes
+REGISTRATION_BATCH_SIZE = int(os.getenv("REGISTRATION_BATCH_SIZE", "200"))
+
+LEDGER_COMPACTION_INTERVAL = int(os.getenv("LEDGER_COMPACTION_INTERVAL", "10"))  # seconds
+LEDGER_COMPACTION_BATCH_SIZE = int(os.getenv("LEDGER_COMPACTION_BATCH_SIZE", "5000"))
+LEDGER_COMPACTION_MAX_BATCHES = int(os.getenv("LEDGER_COMPACTION_MAX_BATCHES", "20"))  # per run
+
+STATS_ROLLUP_INTERVAL = int(os.getenv("STATS_ROLLUP_INTERVAL", "300"))  # seconds between daily_stats refreshes
+
+ACTIVITY_FLUSH_INTERVAL = float(os.getenv("ACTIVITY_FLUSH_INTERVAL", "5"))  # seconds
+ACTIVITY_FLUSH_SIZE = int(os.getenv("ACTIVITY_FLUSH_SIZE", "500"))  # users buffered before an early flush
+
+UNFOLLOW_SWEEP_ENABLED = os.getenv("UNFOLLOW_SWEEP_ENABLED", "true").lower() == "true"
+UNFOLLOW_SWEEP_INTERVAL = int(os.getenv("UNFOLLOW_SWEEP_INTERVAL", "900"))
+UNFOLLOW_SWEEP_BATCH_SIZE = int(os.getenv("UNFOLLOW_SWEEP_BATCH_SIZE", "500"))
+UNFOLLOW_SWEEP_MAX_BATCHES = int(os.getenv("UNFOLLOW_SWEEP_MAX_BATCHES", "40"))  # per run
+UNFOLLOW_SWEEP_CONCURRENCY = int(os.getenv("UNFOLLOW_SWEEP_CONCURRENCY", "10"))
+
+# Phantom connect: the dApp keypair waits this long for the wallet's redirect (Redis, or a bounded local fallback)
+KEYPAIR_TTL = int(os.getenv("KEYPAIR_TTL", "300"))  # seconds
+KEYPAIR_LOCAL_MAX = int(os.getenv("KEYPAIR_LOCAL_MAX", "10000"))
+
+# in-process maintenance jobs (utils/scheduler.py): each interval is spread by +/- JOB_JITTER of itself
+JOB_JITTER = float(os.getenv("JOB_JITTER", "0.1"))
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "600"))  # seconds before a run is reported as stuck
+SOCIAL_CACHE_SWEEP_INTERVAL = int(os.getenv("SOCIAL_CACHE_SWEEP_INTERVAL", "60"))  # expired follow-check results
+SESSION_SWEEP_INTERVAL = int(os.getenv("SESSION_SWEEP_INTERVAL", "300"))  # expired in-memory payment sessions
+
 ENV = os.getenv("ENV", "production")
 DEBUG = ENV == "development"
 
+# Jinja bytecode cache shared by workers; empty disables it
+TEMPLATE_CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR", "/tmp/ccoin-jinja-cache")
+
+# rendered home/earn/airdrop/friends pages, keyed by the user's state version
+RENDER_CACHE_ENABLED = os.getenv("RENDER_CACHE_ENABLED", "false" if DEBUG else "true").lower() == "true"
+RENDER_CACHE_TTL = int(os.getenv("RENDER_CACHE_TTL", "600"))  # seconds a state version lives without writes
+RENDER_CACHE_MAX_BYTES = int(os.getenv("RENDER_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# per-request SQL: warn when one statement repeats this often (N+1) or the total gets this high
+QUERY_REPEAT_THRESHOLD = int(os.getenv("QUERY_REPEAT_THRESHOLD", "5"))
+QUERY_COUNT_THRESHOLD = int(os.getenv("QUERY_COUNT_THRESHOLD", "30"))
+
+# opt-in request profiling (pyinstrument): a sampled fraction, or requests sending X-Profile-Token
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_PATHS = [path for path in os.getenv("PROFILE_PATHS", "").split(",") if path]  # sampling only under these prefixes
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.001"))  # seconds between stack samples
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/ccoin-profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+
+# request tracing: spans for SQL, Redis, RPC and Bot API calls, appended as JSON lines to TRACE_FILE
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))  # 0 disables tracing
+TRACE_FILE = os.getenv("TRACE_FILE", "/tmp/ccoin-traces.jsonl")  # empty keeps traces in memory only
+TRACE_FILE_MAX_BYTES = int(os.getenv("TRACE_FILE_MAX_BYTES", str(100 * 1024 * 1024)))
+TRACE_RECENT = int(os.getenv("TRACE_RECENT", "200"))  # traces kept for /admin/traces
+
 RECAPTCHA_SECRET_KEY = os.getenv("RECAPTCHA_SECRET_KEY", "")
 RECAPTCHA_SITE_KEY = os.getenv("RECAPTCHA_SITE_KEY", "")
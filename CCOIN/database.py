@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, event
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import Pool
@@ -50,13 +50,26 @@ def get_db():
     finally:
         db.close()
 
+def init_db():
+    """Create missing tables; called once at startup, not on import, so importing the app stays cheap"""
+    Base.metadata.create_all(bind=engine)
+
+def get_pool_stats():
+    """Connection pool occupancy; SQLite's pools only report some of it"""
+    stats = {}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        method = getattr(engine.pool, name, None)
+        if method is not None:
+            stats[name] = method()
+    return stats
+
 def get_db_health():
     """
     Check database connection health
     """
     try:
         db = SessionLocal()
-        db.execute("SELECT 1")
+        db.execute(text("SELECT 1"))
         db.close()
         return True
     except Exception as e:
@@ -1,45 +1,59 @@
 import uuid
 import os
-from fastapi import FastAPI, Request, Depends, HTTPException
+import asyncio
+from fastapi import FastAPI, Request, Depends, HTTPException, Query
 from fastapi.responses import FileResponse, HTMLResponse
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from telegram import Update, Bot
-from starlette.responses import RedirectResponse, JSONResponse
+from starlette.responses import RedirectResponse, JSONResponse, Response
 from starlette.middleware.sessions import SessionMiddleware
 from starlette.middleware.trustedhost import TrustedHostMiddleware
-from starlette.middleware.gzip import GZipMiddleware
-from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 from datetime import datetime, timezone
-from CCOIN.database import Base, engine, get_db, get_db_health
+from CCOIN.database import get_db, get_db_health, get_pool_stats, init_db
 from CCOIN.routers import home, load, leaders, friends, earn, airdrop, about, usertasks, users, wallet, commission
 from CCOIN.models.user import User
 from CCOIN.models.transaction import Transaction as TransactionModel 
-from CCOIN.utils.telegram_security import app as telegram_app
+from CCOIN.models.token_ledger import TokenLedger
+from CCOIN.utils.telegram_security import get_application as get_telegram_app
+from CCOIN.utils.update_queue import UpdateQueue
+from CCOIN.utils.telegram_dispatcher import dispatcher as telegram_dispatcher
+from CCOIN.utils.registration import registration_writer
+from CCOIN.utils.leader import leader
+from CCOIN.utils.scheduler import maintenance
+from CCOIN.utils.redis_session import session_store
+from CCOIN.utils.keystore import phantom_keypairs
+from CCOIN.utils.activity import activity_buffer
+from CCOIN.utils.middleware import ResponseHeadersMiddleware, CompressionMiddleware, compression
+from CCOIN.utils.render_cache import render_cache
+from CCOIN.utils import query_stats, user_state
+from CCOIN.utils.profiling import ProfilingMiddleware, list_profiles, profile_path
+from CCOIN.utils import tracing
+from CCOIN.utils.metrics import registry as metrics_registry, Collected, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from CCOIN.tasks.verifiers import verifier_stats
+from CCOIN.utils.static_files import PrecompressedStaticFiles, STATIC_DIR, MANIFEST_PATH, manifest as static_manifest
+from CCOIN.utils.templates import templates, precompile_templates
 from CCOIN.config import (
     BOT_TOKEN, BOT_USERNAME, SECRET_KEY, SOLANA_RPC, CONTRACT_ADDRESS,
     ADMIN_WALLET, REDIS_URL, ENV, CACHE_ENABLED, RATE_LIMIT_ENABLED,
-    GLOBAL_RATE_LIMIT, APP_DOMAIN, TELEGRAM_CHANNEL_USERNAME
+    GLOBAL_RATE_LIMIT, APP_DOMAIN, TELEGRAM_CHANNEL_USERNAME,
+    UNFOLLOW_SWEEP_ENABLED, UNFOLLOW_SWEEP_INTERVAL,
+    UPDATE_QUEUE_WORKERS, UPDATE_QUEUE_SIZE, UPDATE_DEDUPE_TTL, ADMIN_API_TOKEN, METRICS_TOKEN,
+    LEDGER_COMPACTION_INTERVAL, STATS_ROLLUP_INTERVAL,
+    SOCIAL_CACHE_SWEEP_INTERVAL, SESSION_SWEEP_INTERVAL
 )
-from apscheduler.schedulers.background import BackgroundScheduler
-from solana.rpc.async_api import AsyncClient
-from solana.transaction import Transaction as SolanaTransaction
-from solders.system_program import TransferParams, transfer
-from solders.keypair import Keypair
-from solders.pubkey import Pubkey
+from CCOIN.tasks.unfollow_sweeper import sweep_unfollowed_users
+from CCOIN.tasks.ledger_compaction import run_ledger_compaction, backfill_opening_balances
+from CCOIN.tasks import stats_rollup, social_check
 from urllib.parse import parse_qs
 from fastapi_csrf_protect import CsrfProtect
 from fastapi_csrf_protect.exceptions import CsrfProtectError
 from pydantic import BaseModel
 from dotenv import load_dotenv
 from typing import Optional
+from contextlib import asynccontextmanager
 import structlog
-import pytz
 import ipaddress
 import secrets
 import hmac
@@ -50,20 +64,6 @@ import mimetypes
 
 load_dotenv()
 
-structlog.configure(
-    processors=[
-        structlog.processors.TimeStamper(fmt="iso"),
-        structlog.stdlib.add_log_level,
-        structlog.processors.StackInfoRenderer(),
-        structlog.processors.format_exc_info,
-        structlog.processors.JSONRenderer(),
-    ],
-    context_class=dict,
-    logger_factory=structlog.stdlib.LoggerFactory(),
-    wrapper_class=structlog.stdlib.BoundLogger,
-    cache_logger_on_first_use=True,
-)
-
 logger = structlog.get_logger()
 
 RATE_LIMITING_ENABLED = False
@@ -97,7 +97,14 @@ TELEGRAM_IP_RANGES = [
     ipaddress.IPv6Network("2001:b28:f23f::/48"),
 ]
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await startup()
+    yield
+    await shutdown()
+
 app = FastAPI(
+    lifespan=lifespan,
     debug=ENV == "development",
     title="CCoin API",
     version="1.0.0",
@@ -128,20 +135,6 @@ class CsrfSettings(BaseModel):
     cookie_samesite: str = 'lax'
     cookie_secure: bool = ENV == "production"
 
-class StaticFilesCORSMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        response = await call_next(request)
-        
-        if request.url.path.startswith('/static/') or request.url.path == '/metadata.html':
-            response.headers['Access-Control-Allow-Origin'] = '*'
-            response.headers['Access-Control-Allow-Methods'] = 'GET, OPTIONS'
-            response.headers['Access-Control-Allow-Headers'] = '*'
-            response.headers['Cache-Control'] = 'public, max-age=31536000'
-        
-        return response
-
-app.add_middleware(StaticFilesCORSMiddleware)
-
 @CsrfProtect.load_config
 def get_csrf_config():
     return CsrfSettings()
@@ -165,12 +158,13 @@ if RATE_LIMITING_ENABLED and limiter:
             content={"detail": "Too many requests. Please try again later."}
         )
 
-Base.metadata.create_all(bind=engine)
+if ENV == "production" and not static_manifest:
+    # unhashed assets would be served with no-cache and uncompressed on every page
+    raise RuntimeError(f"{MANIFEST_PATH} is missing: run tools/build_static.py before starting the app")
 
-app.mount("/static", StaticFiles(directory="CCOIN/static"), name="static")
-templates = Jinja2Templates(directory="CCOIN/templates")
+app.mount("/static", PrecompressedStaticFiles(directory=STATIC_DIR), name="static")
 
-app.add_middleware(GZipMiddleware, minimum_size=1000) 
+app.add_middleware(CompressionMiddleware, minimum_size=1000)
 
 app.add_middleware(
     SessionMiddleware,
@@ -184,43 +178,9 @@ if ENV == "production":
     allowed_hosts = [APP_DOMAIN.replace("https://", "").replace("http://", "")]
     app.add_middleware(TrustedHostMiddleware, allowed_hosts=allowed_hosts)
 
-@app.middleware("http")
-async def add_security_headers(request: Request, call_next):
-    """Add security headers to all responses"""
-    response = await call_next(request)
-    
-    response.headers["X-Content-Type-Options"] = "nosniff"
-    response.headers["X-Frame-Options"] = "SAMEORIGIN"
-    response.headers["X-XSS-Protection"] = "1; mode=block"
-    response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
-    
-    response.headers["Content-Security-Policy"] = (
-        "default-src 'self'; "
-        "script-src 'self' 'unsafe-inline' 'unsafe-eval' https://telegram.org https://unpkg.com https://cdnjs.cloudflare.com https://cdn.jsdelivr.net; "
-        "style-src 'self' 'unsafe-inline' https://cdnjs.cloudflare.com https://fonts.googleapis.com https://unpkg.com; "
-        "font-src 'self' data: https://cdnjs.cloudflare.com https://fonts.gstatic.com https://unpkg.com; "
-        "img-src 'self' data: https: blob:; "
-        "connect-src 'self' https://api.telegram.org https:; "
-        "frame-src 'self' https://telegram.org;"
-    )
-    
-    return response
-
-@app.middleware("http")
-async def add_process_time_header(request: Request, call_next):
-    start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
-    response.headers["X-Process-Time"] = str(process_time)
-    
-    if process_time > 1.0:
-        logger.warning("Slow request detected", extra={
-            "path": request.url.path,
-            "method": request.method,
-            "process_time": process_time
-        })
-    
-    return response
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(tracing.TracingMiddleware)
+app.add_middleware(ResponseHeadersMiddleware)
 
 @app.get("/")
 async def root(request: Request, db: Session = Depends(get_db)):
@@ -252,10 +212,11 @@ async def root(request: Request, db: Session = Depends(get_db)):
         return RedirectResponse(url=f"/home?telegram_id={telegram_id}")
         
 @app.api_route("/telegram_webhook", methods=["POST"])
-async def telegram_webhook(request: Request, db: Session = Depends(get_db)):
+async def telegram_webhook(request: Request):
     """
     Webhook endpoint with better authentication
-    Uses X-Telegram-Bot-Api-Secret-Token
+    Uses X-Telegram-Bot-Api-Secret-Token.
+    Updates are acknowledged once queued; workers process them afterwards.
     """
     secret_token = request.headers.get("X-Telegram-Bot-Api-Secret-Token")
     expected_token = os.getenv("WEBHOOK_TOKEN")
@@ -286,27 +247,42 @@ async def telegram_webhook(request: Request, db: Session = Depends(get_db)):
     except ValueError:
         logger.error("Invalid IP address", extra={"ip": client_ip})
 
+    from telegram import Update  # already loaded by the Application at startup
+
     try:
         update_data = await request.json()
-        logger.debug("Received webhook data", extra={"update_id": update_data.get("update_id")})
+        update = Update.de_json(update_data, bot=get_telegram_app().bot)
+    except Exception as e:
+        logger.warning("Invalid Telegram update received", extra={"error": str(e)})
+        raise HTTPException(status_code=400, detail="Invalid Telegram update")
 
-        bot = Bot(token=BOT_TOKEN)
-        await bot.initialize()
-        update = Update.de_json(update_data, bot=bot)
+    if not update:
+        logger.warning("Invalid Telegram update received")
+        raise HTTPException(status_code=400, detail="Invalid Telegram update")
 
-        if not update:
-            logger.warning("Invalid Telegram update received")
-            raise HTTPException(status_code=400, detail="Invalid Telegram update")
+    if not await update_queue.claim(update.update_id):
+        logger.info("Duplicate update ignored", extra={"update_id": update.update_id})
+        return {"ok": True}
 
-        await telegram_app.process_update(update)
-        await bot.shutdown()
+    chat = update.effective_chat
+    if not update_queue.submit(update, chat.id if chat else None):
+        await update_queue.release(update.update_id)
+        logger.warning("Update queue full, asking Telegram to retry", extra={"update_id": update.update_id})
+        raise HTTPException(status_code=503, detail="Busy")
 
-        logger.info("Update processed successfully", extra={"update_id": update.update_id})
-        return {"ok": True}
+    logger.debug("Update queued", extra={"update_id": update.update_id})
+    return {"ok": True}
 
-    except Exception as e:
-        logger.error("Error processing Telegram update", extra={"error": str(e)}, exc_info=True)
-        return {"ok": False, "error": "Internal error"}
+async def process_queued_update(update):
+    await get_telegram_app().process_update(update)
+    logger.info("Update processed successfully", extra={"update_id": update.update_id})
+
+update_queue = UpdateQueue(
+    process_queued_update,
+    workers=UPDATE_QUEUE_WORKERS,
+    max_size=UPDATE_QUEUE_SIZE,
+    dedupe_ttl=UPDATE_DEDUPE_TTL
+)
 
 @app.get("/health")
 async def health_check():
@@ -322,6 +298,15 @@ async def health_check():
         "cache_enabled": CACHE_ENABLED,
         "redis_available": REDIS_URL is not None,
         "environment": ENV,
+        "update_queue": update_queue.stats(),
+        "telegram_dispatcher": telegram_dispatcher.stats(),
+        "leader": leader.stats(),
+        "maintenance": maintenance.stats(),
+        "wallet_keystore": phantom_keypairs.stats(),
+        "registration_writer": registration_writer.stats,
+        "activity_buffer": {**activity_buffer.stats, "pending": activity_buffer.pending},
+        "compression": compression.stats(),
+        "render_cache": render_cache.stats(),
         "timestamp": datetime.now(timezone.utc).isoformat()
     }
     
@@ -332,29 +317,128 @@ async def health_check():
     
     return JSONResponse(content=health_status, status_code=status_code)
 
-@app.get("/metrics")
-async def metrics(db: Session = Depends(get_db)):
+def cache_requests() -> dict:
+    """Lookups per cache as (cache, result) -> count, for hit ratios"""
+    values = {}
+    for page, counters in render_cache.counters.items():
+        values[(f"render:{page}", "hit")] = counters["hits"] + counters["not_modified"]
+        values[(f"render:{page}", "miss")] = counters["renders"]
+        values[(f"render:{page}", "bypass")] = counters["uncached"]
+    values[("compression", "hit")] = compression.cache_hits
+    values[("compression", "miss")] = compression.cache_misses
+    for platform, stats in verifier_stats().items():
+        values[(f"social_check:{platform}", "hit")] = stats["cache_hits"]
+        values[(f"social_check:{platform}", "miss")] = stats["calls"] - stats["cache_hits"]
+    return values
+
+Collected("ccoin_db_pool_connections", "Database pool connections by state",
+          lambda: {(state,): value for state, value in get_pool_stats().items()}, ("state",))
+Collected("ccoin_queue_depth", "Items waiting in in-process queues", lambda: {
+    ("telegram_updates",): update_queue.depth(),
+    ("telegram_outbox",): telegram_dispatcher.stats()["pending"],
+    ("registrations",): registration_writer.pending,
+    ("activity",): activity_buffer.pending,
+}, ("queue",))
+Collected("ccoin_telegram_updates_total", "Webhook updates by outcome",
+          lambda: {(outcome,): count for outcome, count in update_queue.counters.items()}, ("outcome",), type="counter")
+Collected("ccoin_telegram_outbox_messages_total", "Outgoing Telegram messages by outcome",
+          lambda: {(outcome,): count for outcome, count in telegram_dispatcher.counters.items()}, ("outcome",), type="counter")
+Collected("ccoin_cache_requests_total", "Cache lookups by cache and result", cache_requests, ("cache", "result"), type="counter")
+Collected("ccoin_render_cache_bytes", "Bytes of rendered pages held", lambda: render_cache.stats()["bytes"])
+Collected("ccoin_compression_bytes_total", "Response bytes before and after compression",
+          lambda: {
+              (direction,): sum(stats[f"bytes_{direction}"] for stats in compression.routes.values())
+              for direction in ("in", "out")
+          }, ("direction",), type="counter")
+Collected("ccoin_user_totals", "Users, connected wallets and compacted tokens, as of the last stats rollup",
+          lambda: {(field,): stats_rollup.current().get(field) for field in stats_rollup.TOTAL_FIELDS}, ("total",))
+Collected("ccoin_today_events", "Signups, wallet connections and commission payments so far today (UTC)",
+          lambda: {(field,): stats_rollup.current().get(field) for field in stats_rollup.DAILY_FIELDS}, ("event",))
+
+def require_metrics_token(request: Request):
+    """/metrics exists only when METRICS_TOKEN is set; scrapers send it as a bearer token"""
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404)
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not secrets.compare_digest(token, METRICS_TOKEN):
+        logger.warning("Invalid metrics token", extra={"ip": request.client.host})
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+@app.get("/metrics", dependencies=[Depends(require_metrics_token)])
+async def metrics():
+    """Prometheus text format"""
+    return Response(metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
+
+class BroadcastRequest(BaseModel):
+    segment: str
+    text: str
+    parse_mode: Optional[str] = None
+    disable_web_page_preview: Optional[bool] = None
+
+def require_admin(request: Request):
+    """Admin endpoints exist only when ADMIN_API_TOKEN is set"""
+    token = request.headers.get("X-Admin-Token")
+    if not ADMIN_API_TOKEN:
+        raise HTTPException(status_code=404)
+    if not token or not secrets.compare_digest(token, ADMIN_API_TOKEN):
+        logger.warning("Invalid admin token", extra={"ip": request.client.host})
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+@app.post("/admin/broadcast", dependencies=[Depends(require_admin)])
+async def start_broadcast(body: BroadcastRequest):
     """
-    Endpoint برای monitoring
-    In production, should be protected with authentication
+    Send a message to every user in a segment at the dispatcher's safe rate
     """
-    if ENV == "production":
-        raise HTTPException(status_code=404)
-    
     try:
-        total_users = db.query(User).count()
-        connected_wallets = db.query(User).filter(User.wallet_connected == True).count()
-        total_tokens = db.query(func.sum(User.tokens)).scalar() or 0
-        
-        return {
-            "total_users": total_users,
-            "connected_wallets": connected_wallets,
-            "wallet_connection_rate": f"{(connected_wallets / total_users * 100):.2f}%" if total_users > 0 else "0%",
-            "total_tokens_distributed": total_tokens
-        }
-    except Exception as e:
-        logger.error("Error fetching metrics", exc_info=True)
-        raise HTTPException(status_code=500, detail="Internal error")
+        campaign_id = await telegram_dispatcher.broadcast(
+            body.segment,
+            body.text,
+            parse_mode=body.parse_mode,
+            disable_web_page_preview=body.disable_web_page_preview
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    logger.info("Broadcast started", extra={"campaign_id": campaign_id, "segment": body.segment})
+    return {"campaign_id": campaign_id, **telegram_dispatcher.campaigns[campaign_id]}
+
+@app.get("/admin/broadcast/{campaign_id}", dependencies=[Depends(require_admin)])
+async def broadcast_status(campaign_id: str):
+    campaign = telegram_dispatcher.campaigns.get(campaign_id)
+    if not campaign:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    return {"campaign_id": campaign_id, **campaign}
+
+@app.get("/admin/profiles", dependencies=[Depends(require_admin)])
+async def profiles():
+    """Stored request profiles, newest first"""
+    return {"profiles": await asyncio.to_thread(list_profiles)}
+
+@app.get("/admin/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+async def download_profile(profile_id: str):
+    """Speedscope JSON of one profile; open it at https://www.speedscope.app"""
+    path = profile_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/json", filename=os.path.basename(path))
+
+@app.get("/admin/traces", dependencies=[Depends(require_admin)])
+async def traces():
+    """Root spans of the most recent sampled requests"""
+    return {"traces": tracing.tracer.summaries()}
+
+@app.get("/admin/traces/{trace_id}", dependencies=[Depends(require_admin)])
+async def get_trace(trace_id: str):
+    """Every span of one recent trace, in start order"""
+    spans = tracing.tracer.get_trace(trace_id)
+    if spans is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return {"trace_id": trace_id, "spans": spans}
+
+@app.get("/admin/stats/daily", dependencies=[Depends(require_admin)])
+async def daily_stats(days: int = Query(30, ge=1, le=3650)):
+    """Daily signups, wallet connections, commission payments and totals, newest first"""
+    return {"days": await asyncio.to_thread(stats_rollup.get_daily_stats, days)}
 
 app.include_router(load.router)
 app.include_router(home.router, prefix="/home")
@@ -368,10 +452,36 @@ app.include_router(users.router, prefix="/users")
 app.include_router(wallet.router, prefix="/wallet")
 app.include_router(commission.router, prefix="/commission")
 
-scheduler = BackgroundScheduler(timezone=pytz.UTC)
-scheduler.start()
+# database jobs run on the elected leader only; the sweeps of this
+# process's own memory run on every instance
+if UNFOLLOW_SWEEP_ENABLED:
+    maintenance.register("unfollow_sweep", sweep_unfollowed_users, UNFOLLOW_SWEEP_INTERVAL, leader_only=True)
+# one instance, once per leadership term, ahead of the first compaction
+maintenance.register("opening_balance_backfill", backfill_opening_balances, None, leader_only=True, run_at_start=True)
+maintenance.register("ledger_compaction", run_ledger_compaction, LEDGER_COMPACTION_INTERVAL, leader_only=True)
+maintenance.register("stats_rollup", stats_rollup.run_stats_rollup, STATS_ROLLUP_INTERVAL, leader_only=True, run_at_start=True)
+maintenance.register("stats_snapshot", stats_rollup.load_latest, STATS_ROLLUP_INTERVAL, run_at_start=True)
+maintenance.register("social_cache_sweep", social_check.clear_expired_cache, SOCIAL_CACHE_SWEEP_INTERVAL)
+maintenance.register("session_sweep", session_store.sweep_expired, SESSION_SWEEP_INTERVAL)
+
+webhook_setup_task: Optional[asyncio.Task] = None
+
+# Every instance serves requests, but only the elected one registers the
+# webhook and runs the database jobs
+@leader.on_elected
+def start_leader_duties():
+    global webhook_setup_task
+    maintenance.set_leader(True)
+    # Registering the webhook is three Bot API round trips; the app can
+    # serve (and queue updates) before they finish
+    webhook_setup_task = asyncio.create_task(register_webhook(get_telegram_app().bot))
+
+@leader.on_demoted
+def stop_leader_duties():
+    maintenance.set_leader(False)
+    if webhook_setup_task is not None and not webhook_setup_task.done():
+        webhook_setup_task.cancel()
 
-@app.on_event("startup")
 async def startup():
     logger.info("🚀 Application starting", extra={
         "environment": ENV,
@@ -379,21 +489,37 @@ async def startup():
         "cache_enabled": CACHE_ENABLED
     })
 
+    try:
+        await asyncio.to_thread(init_db)
+    except Exception as e:
+        logger.error("Database initialization failed", extra={"error": str(e)}, exc_info=True)
+
+    telegram_app = get_telegram_app()
+    try:
+        await telegram_app.initialize()
+        logger.info("✅ Telegram app initialized")
+    except Exception as e:
+        logger.error("Error initializing telegram app", extra={"error": str(e)}, exc_info=True)
+
+    precompile_templates()
+
+    await update_queue.start()
+    await telegram_dispatcher.start(telegram_app.bot)
+    await maintenance.start()
+    await leader.start()
+
+async def register_webhook(bot):
     webhook_token = os.getenv('WEBHOOK_TOKEN')
     if not webhook_token:
         logger.error("WEBHOOK_TOKEN not set!")
         return
 
-    bot = Bot(token=BOT_TOKEN)
-    await bot.initialize()
-
     webhook_url = f"{APP_DOMAIN}/telegram_webhook"
 
     try:
         await bot.set_webhook(
             url=webhook_url,
-            secret_token=webhook_token,
-            drop_pending_updates=True
+            secret_token=webhook_token
         )
         logger.info("✅ Telegram webhook set successfully", extra={"url": webhook_url})
 
@@ -419,17 +545,19 @@ async def startup():
     except Exception as e:
         logger.error("Error setting webhook", extra={"error": str(e)}, exc_info=True)
 
+async def shutdown():
+    await leader.stop()
+    await maintenance.stop()
+    await update_queue.stop()
+    await registration_writer.stop()
+    await activity_buffer.stop()
+    await telegram_dispatcher.stop()
+    await phantom_keypairs.close()
+    await user_state.close()
     try:
-        await telegram_app.initialize()
-        logger.info("✅ Telegram app initialized")
+        await get_telegram_app().shutdown()
     except Exception as e:
-        logger.error("Error initializing telegram app", extra={"error": str(e)}, exc_info=True)
-
-    await bot.shutdown()
-
-@app.on_event("shutdown")
-def shutdown():
-    scheduler.shutdown()
+        logger.error("Error shutting down telegram app", extra={"error": str(e)})
     logger.info("Application shutdown")
 
 if __name__ == "__main__":
@@ -446,4 +574,8 @@ if __name__ == "__main__":
 
 @app.get("/metadata.html")
 async def serve_metadata():
-    return FileResponse("CCOIN/templates/metadata.html", media_type="text/html")
+    return FileResponse(
+        "CCOIN/templates/metadata.html",
+        media_type="text/html",
+        headers={"Cache-Control": "public, max-age=31536000"}
+    )
@@ -0,0 +1,22 @@
+from sqlalchemy import Column, Integer, BigInteger, Date, DateTime
+from datetime import datetime, timezone
+from CCOIN.database import Base
+
+class DailyStats(Base):
+    """One row per UTC day, written by CCOIN.tasks.stats_rollup; the history behind the dashboards"""
+    __tablename__ = "daily_stats"
+
+    day = Column(Date, primary_key=True)
+    signups = Column(Integer, default=0, nullable=False)
+    wallet_connections = Column(Integer, default=0, nullable=False)
+    commission_payments = Column(Integer, default=0, nullable=False)
+
+    # totals as of the last refresh of that day; null where a backfill could not know them
+    total_users = Column(Integer, nullable=True)
+    connected_wallets = Column(Integer, nullable=True)
+    tokens_distributed = Column(BigInteger, nullable=True)
+
+    updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f"<DailyStats(day={self.day}, signups={self.signups}, total_users={self.total_users})>"
@@ -0,0 +1,32 @@
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, DateTime, ForeignKey, Index
+from datetime import datetime, timezone
+from CCOIN.database import Base
+
+class TokenLedger(Base):
+    __tablename__ = "token_ledger"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    delta = Column(Integer, nullable=False)
+    reason = Column(String, nullable=False)  # welcome_bonus, referral_bonus, task_reward, unfollow_penalty, opening_balance
+    ref = Column(String, nullable=True)  # what caused it: referred user id, platform, task id
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
+    # True once the delta is folded into users.tokens by the compaction job
+    compacted = Column(Boolean, default=False, nullable=False)
+
+    __table_args__ = (
+        Index('idx_token_ledger_user_id', 'user_id', 'id'),
+        Index(
+            'idx_token_ledger_pending', 'user_id',
+            postgresql_where=compacted.is_(False),
+            sqlite_where=compacted.is_(False)
+        ),
+        Index(
+            'uq_token_ledger_opening_balance', 'user_id', unique=True,
+            postgresql_where=reason == 'opening_balance',
+            sqlite_where=reason == 'opening_balance'
+        ),
+    )
+
+    def __repr__(self):
+        return f"<TokenLedger(user_id={self.user_id}, delta={self.delta}, reason={self.reason}, compacted={self.compacted})>"
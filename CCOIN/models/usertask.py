@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
 from CCOIN.database import Base
@@ -17,5 +17,9 @@ class UserTask(Base):
     
     user = relationship("User", back_populates="tasks")
 
+    __table_args__ = (
+        Index('idx_user_task_platform_completed', 'platform', 'completed', 'id'),
+    )
+
     def __repr__(self):
         return f"<UserTask(user_id={self.user_id}, platform={self.platform}, completed={self.completed}, attempts={self.attempt_count})>"
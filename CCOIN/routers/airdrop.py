@@ -1,19 +1,18 @@
 from fastapi import APIRouter, Request, Depends, HTTPException, Query, BackgroundTasks
 from fastapi.responses import HTMLResponse, JSONResponse
 from sqlalchemy.orm import Session
-from solana.rpc.api import Client
-from solana.transaction import Transaction
-from fastapi.templating import Jinja2Templates
-import os
+from CCOIN.utils.render_cache import render_cache
 import redis
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 from CCOIN.database import get_db, SessionLocal
 from CCOIN.models.user import User
 from CCOIN.utils.telegram_security import get_current_user, send_commission_payment_link
+from CCOIN.utils.telegram_dispatcher import dispatcher, PRIORITY_HIGH
+from CCOIN.utils.activity import activity_buffer
+from CCOIN.utils.metrics import track_rpc
+from CCOIN.utils.solana_rpc import get_sync_client
 from CCOIN.config import SOLANA_RPC, COMMISSION_AMOUNT, ADMIN_WALLET, REDIS_URL, BOT_TOKEN
-from solders.pubkey import Pubkey
-from solders.system_program import TransferParams, transfer
 from datetime import datetime, timezone
 import base58
 import base64
@@ -31,8 +30,6 @@ logger = structlog.get_logger()
 
 router = APIRouter()
 limiter = Limiter(key_func=get_remote_address)
-templates = Jinja2Templates(directory=os.path.join(os.path.dirname(__file__), "..", "templates"))
-solana_client = Client(SOLANA_RPC)
 
 try:
     redis_client = redis.Redis.from_url(REDIS_URL) if REDIS_URL else None
@@ -57,59 +54,65 @@ async def get_airdrop(request: Request, db: Session = Depends(get_db)):
         logger.error("User not found", extra={"telegram_id": telegram_id})
         raise HTTPException(status_code=404, detail="User not found")
 
+    activity_buffer.record(user.id, request.client.host)
+
     end_date = datetime(2025, 12, 31, tzinfo=timezone.utc)
     countdown = end_date - datetime.now(timezone.utc)
+    required_platforms = ['telegram', 'instagram', 'x', 'youtube']
 
-    tasks_completed = False
-    if user.tasks:
-        required_platforms = ['telegram', 'instagram', 'x', 'youtube']
+    def tasks_done() -> bool:
         completed_platforms = [t.platform for t in user.tasks if t.completed]
-        
         tasks_completed = all(platform in completed_platforms for platform in required_platforms)
-        
         logger.info("Tasks completion check", extra={
             "telegram_id": telegram_id,
             "required_platforms": required_platforms,
             "completed_platforms": completed_platforms,
             "all_completed": tasks_completed
         })
+        return tasks_completed
 
-    invited = False
-    if hasattr(user, 'referrals') and user.referrals:
-        invited = len(user.referrals) > 0
-    else:
-        referral_count = db.query(User).filter(User.referred_by == user.id).count()
-        invited = referral_count > 0
-
-    wallet_connected = bool(user.wallet_address)
-    commission_paid = user.commission_paid
+    def has_invited() -> bool:
+        if hasattr(user, 'referrals') and user.referrals:
+            return len(user.referrals) > 0
+        return db.query(User).filter(User.referred_by == user.id).count() > 0
 
-    if tasks_completed and invited and wallet_connected and commission_paid:
-        if hasattr(user, 'airdrop') and user.airdrop:
+    # a write, so never inside the render callback: it runs on every visit, cached page or not,
+    # and its commit bumps the user's version before the page is cached under it
+    if user.wallet_address and user.commission_paid and user.airdrop and not user.airdrop.eligible:
+        if tasks_done() and has_invited():
             user.airdrop.eligible = True
             db.commit()
 
-    from CCOIN import config
+    def context():
+        tasks_completed = tasks_done() if user.tasks else False
+        invited = has_invited()
+        wallet_connected = bool(user.wallet_address)
+        commission_paid = user.commission_paid
 
-    logger.info("Airdrop page accessed", extra={
-        "telegram_id": telegram_id,
-        "tasks_completed": tasks_completed,
-        "invited": invited,
-        "wallet_connected": wallet_connected,
-        "commission_paid": commission_paid
-    })
+        from CCOIN import config
 
-    return templates.TemplateResponse("airdrop.html", {
-        "request": request,
-        "countdown": countdown,
-        "value": 0.02,
-        "tasks_completed": tasks_completed,
-        "invited": invited,
-        "wallet_connected": wallet_connected,
-        "commission_paid": commission_paid,
-        "config": config,
-        "user_wallet_address": user.wallet_address if user.wallet_address else ""
-    })
+        logger.info("Airdrop page accessed", extra={
+            "telegram_id": telegram_id,
+            "tasks_completed": tasks_completed,
+            "invited": invited,
+            "wallet_connected": wallet_connected,
+            "commission_paid": commission_paid
+        })
+
+        return {
+            "countdown": countdown,
+            "value": 0.02,
+            "tasks_completed": tasks_completed,
+            "invited": invited,
+            "wallet_connected": wallet_connected,
+            "commission_paid": commission_paid,
+            "config": config,
+            "user_wallet_address": user.wallet_address if user.wallet_address else ""
+        }
+
+    # the template also prints these session values; the countdown moves on once a day
+    extra = (request.session.get("csrf_token"), request.session.get("telegram_id"), countdown.days)
+    return await render_cache.render(request, "airdrop.html", user.id, context, extra)
 
 @router.post("/connect_wallet")
 @limiter.limit("10/day")  
@@ -161,6 +164,8 @@ async def connect_wallet(
         logger.warning("Invalid wallet format", extra={"telegram_id": telegram_id})
         raise HTTPException(status_code=400, detail="Invalid wallet address")
 
+    from solders.pubkey import Pubkey
+
     try:
         decoded = base58.b58decode(wallet)
         if len(decoded) != 32:
@@ -211,8 +216,7 @@ async def connect_wallet(
             )
 
         user.wallet_address = wallet
-        user.last_ip = client_ip  
-        user.last_active = datetime.now(timezone.utc)  
+        activity_buffer.record(user.id, client_ip)
         if hasattr(user, 'wallet_connected'):
             user.wallet_connected = True
         if hasattr(user, 'wallet_connection_date'):
@@ -339,18 +343,19 @@ async def confirm_commission(
                     "signature": tx_signature
                 })
 
-                tx_info = solana_client.get_transaction(
-                    tx_signature,
-                    encoding="json",
-                    commitment="confirmed",
-                    max_supported_transaction_version=0
-                )
+                with track_rpc(SOLANA_RPC, "getTransaction"):
+                    tx_info = get_sync_client().get_transaction(
+                        tx_signature,
+                        encoding="json",
+                        commitment="confirmed",
+                        max_supported_transaction_version=0
+                    )
 
                 if tx_info.value and tx_info.value.meta and not tx_info.value.meta.err:
                     user.commission_paid = True
                     user.commission_transaction_hash = tx_signature
                     user.commission_payment_date = datetime.now(timezone.utc)
-                    user.last_active = datetime.now(timezone.utc)  
+                    activity_buffer.record(user.id, request.client.host)
                     if hasattr(user, 'updated_at'):
                         user.updated_at = datetime.now(timezone.utc)
                     db.commit()
@@ -524,15 +529,17 @@ async def verify_commission_manual(request: Request, db: Session = Depends(get_d
             raise HTTPException(status_code=400, detail="No wallet connected")
 
         try:
+            from solders.pubkey import Pubkey
             from solders.signature import Signature
             
             user_pubkey = Pubkey.from_string(user.wallet_address)
             admin_pubkey = Pubkey.from_string(ADMIN_WALLET)
             
-            signatures = solana_client.get_signatures_for_address(
-                user_pubkey,
-                limit=10
-            )
+            with track_rpc(SOLANA_RPC, "getSignaturesForAddress"):
+                signatures = get_sync_client().get_signatures_for_address(
+                    user_pubkey,
+                    limit=10
+                )
 
             if not signatures.value:
                 return {
@@ -545,12 +552,13 @@ async def verify_commission_manual(request: Request, db: Session = Depends(get_d
             for sig_info in signatures.value:
                 tx_sig = str(sig_info.signature)
                 
-                tx_info = solana_client.get_transaction(
-                    tx_sig,
-                    encoding="json",
-                    commitment="confirmed",
-                    max_supported_transaction_version=0
-                )
+                with track_rpc(SOLANA_RPC, "getTransaction"):
+                    tx_info = get_sync_client().get_transaction(
+                        tx_sig,
+                        encoding="json",
+                        commitment="confirmed",
+                        max_supported_transaction_version=0
+                    )
 
                 if tx_info.value and tx_info.value.meta and not tx_info.value.meta.err:
                     verified_transactions.append({
@@ -610,11 +618,8 @@ async def request_commission_link(request: Request, db: Session = Depends(get_db
         if not user.wallet_connected:
             return {"success": False, "message": "Please connect wallet first"}
         
-        from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup
-        from CCOIN.config import BOT_TOKEN, APP_DOMAIN
-        
-        bot = Bot(token=BOT_TOKEN)
-        await bot.initialize()
+        from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+        from CCOIN.config import APP_DOMAIN
         
         commission_url = f"{APP_DOMAIN}/commission/browser/pay?telegram_id={telegram_id}"
         
@@ -629,14 +634,16 @@ async def request_commission_link(request: Request, db: Session = Depends(get_db
             "✅ The page will open in your default browser \\(not in Telegram\\)\\."
         )
         
-        await bot.send_message(
-            chat_id=int(telegram_id), 
-            text=message_text,
+        sent = await dispatcher.send(
+            int(telegram_id),
+            message_text,
+            priority=PRIORITY_HIGH,
+            wait=True,
             reply_markup=reply_markup,
             parse_mode='MarkdownV2'
         )
-        
-        await bot.shutdown()
+        if not sent:
+            raise HTTPException(status_code=500, detail="Failed to send link")
         
         logger.info("Commission link sent via bot", extra={"telegram_id": telegram_id})
         return {"success": True, "message": "Payment link sent to your Telegram chat"}
@@ -686,16 +693,8 @@ async def send_link_to_chat(request: Request, db: Session = Depends(get_db)):
             }, status_code=400)
 
         try:
-            from telegram import Bot
             from telegram.constants import ParseMode
             
-            from CCOIN.config import BOT_TOKEN
-            
-            if not BOT_TOKEN:
-                raise ValueError("BOT_TOKEN not configured")
-            
-            bot = Bot(token=BOT_TOKEN)
-            
             message_text = (
                 "🔔 <b>Commission Payment Required</b>\n"
                 "━━━━━━━━━━━━━━━━━━━━\n\n"
@@ -712,12 +711,16 @@ async def send_link_to_chat(request: Request, db: Session = Depends(get_db)):
                 f"{payment_url}\n\n"
             )
 
-            await bot.send_message(
-                chat_id=int(telegram_id),
-                text=message_text,
+            sent = await dispatcher.send(
+                int(telegram_id),
+                message_text,
+                priority=PRIORITY_HIGH,
+                wait=True,
                 parse_mode=ParseMode.HTML,
                 disable_web_page_preview=False
             )
+            if not sent:
+                raise RuntimeError("Telegram rejected the message")
 
             logger.info("Payment link sent to chat successfully", extra={
                 "telegram_id": telegram_id
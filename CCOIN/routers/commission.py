@@ -1,4 +1,3 @@
-import os
 import time
 import secrets
 import base64
@@ -9,21 +8,17 @@ from datetime import datetime, timezone, timedelta
 
 from fastapi import APIRouter, Request, Depends, HTTPException, Query
 from fastapi.responses import HTMLResponse, JSONResponse
-from fastapi.templating import Jinja2Templates
+from CCOIN.utils.templates import templates
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 
-from solders.pubkey import Pubkey
-from solders.keypair import Keypair
-from solders.system_program import TransferParams, transfer
-from solders.transaction import Transaction as SolanaTransaction
-from solders.message import Message
-import base58
 
 from CCOIN.database import get_db
 from CCOIN.models.user import User
 from CCOIN.models.transaction import Transaction 
 from CCOIN.utils.transaction_validator import TransactionValidator  
+from CCOIN.utils.metrics import track_rpc
+from CCOIN.utils import tracing
 from CCOIN.config import (
     COMMISSION_AMOUNT,
     ADMIN_WALLET,
@@ -35,13 +30,13 @@ from CCOIN.config import (
     SOLANA_RPC
 )
 from CCOIN.utils.telegram_security import send_commission_payment_link
+from CCOIN.utils.telegram_dispatcher import dispatcher, PRIORITY_HIGH
 
 # from CCOIN.utils.redis_session import session_store
 # from CCOIN.utils.solana_rpc import rpc_client
 
 logger = structlog.get_logger(__name__)
 router = APIRouter()
-templates = Jinja2Templates(directory=os.path.join(os.path.dirname(__file__), "..", "templates"))
 
 @router.get("/browser/pay", response_class=HTMLResponse)
 async def commission_browser_pay(
@@ -133,7 +128,6 @@ async def create_payment_session(request: Request, db: Session = Depends(get_db)
         raise HTTPException(status_code=500, detail=str(e))
 
 
-
 @router.get("/phantom_callback", response_class=HTMLResponse)
 async def phantom_callback(request: Request):
     """
@@ -258,7 +252,8 @@ async def verify_signature(request: Request, db: Session = Depends(get_db)):
             "signature": signature,
             "wait_time": TX_FINALIZATION_WAIT
         })
-        await asyncio.sleep(TX_FINALIZATION_WAIT)
+        with tracing.span("sleep tx_finalization", seconds=TX_FINALIZATION_WAIT):
+            await asyncio.sleep(TX_FINALIZATION_WAIT)
         blockchain_result = await validator.verify_solana_transaction(
             signature=signature,
             expected_wallet=user.wallet_address,
@@ -338,6 +333,7 @@ async def verify_commission_payment(request: Request, db: Session = Depends(get_
             raise HTTPException(status_code=400, detail="Wallet not connected")
 
         from solana.rpc.async_api import AsyncClient
+        from solders.pubkey import Pubkey
         from solders.signature import Signature
         from CCOIN.config import SOLANA_RPC
 
@@ -350,7 +346,8 @@ async def verify_commission_payment(request: Request, db: Session = Depends(get_
                 "scan_limit": TX_SCAN_LIMIT
             })
 
-            signatures_resp = await client.get_signatures_for_address(user_pubkey, limit=TX_SCAN_LIMIT)
+            with track_rpc(SOLANA_RPC, "getSignaturesForAddress"):
+                signatures_resp = await client.get_signatures_for_address(user_pubkey, limit=TX_SCAN_LIMIT)
             expected_lamports = int(COMMISSION_AMOUNT * 1_000_000_000)
 
             if signatures_resp.value:
@@ -381,11 +378,12 @@ async def verify_commission_payment(request: Request, db: Session = Depends(get_
 
                     try:
                         sig_obj = Signature.from_string(sig)
-                        tx_resp = await client.get_transaction(
-                            sig_obj,
-                            encoding="jsonParsed",
-                            max_supported_transaction_version=0
-                        )
+                        with track_rpc(SOLANA_RPC, "getTransaction"):
+                            tx_resp = await client.get_transaction(
+                                sig_obj,
+                                encoding="jsonParsed",
+                                max_supported_transaction_version=0
+                            )
                     except Exception as tx_error:
                         logger.warning("Failed to get transaction", extra={
                             "signature": sig,
@@ -475,7 +473,7 @@ async def send_payment_link_endpoint(request: Request, db: Session = Depends(get
                 "message": "Commission already paid"
             }
 
-        success = await send_commission_payment_link(telegram_id, BOT_TOKEN)
+        success = await send_commission_payment_link(telegram_id)
 
         if success:
             logger.info("Payment link sent successfully", extra={
@@ -533,6 +531,7 @@ async def scan_transaction(request: Request, db: Session = Depends(get_db)):
             raise HTTPException(status_code=400, detail="Wallet not connected")
 
         from solana.rpc.async_api import AsyncClient
+        from solders.pubkey import Pubkey
         from solders.signature import Signature as SigObj
 
         client = AsyncClient(SOLANA_RPC)
@@ -540,10 +539,11 @@ async def scan_transaction(request: Request, db: Session = Depends(get_db)):
         try:
             user_pubkey = Pubkey.from_string(user.wallet_address)
             
-            signatures_resp = await client.get_signatures_for_address(
-                user_pubkey,
-                limit=TX_SCAN_LIMIT
-            )
+            with track_rpc(SOLANA_RPC, "getSignaturesForAddress"):
+                signatures_resp = await client.get_signatures_for_address(
+                    user_pubkey,
+                    limit=TX_SCAN_LIMIT
+                )
 
             if not signatures_resp or not signatures_resp.value:
                 await client.close()
@@ -610,11 +610,12 @@ async def scan_transaction(request: Request, db: Session = Depends(get_db)):
 
                 try:
                     sig_obj = SigObj.from_string(sig_str)
-                    tx_resp = await client.get_transaction(
-                        sig_obj,
-                        encoding="jsonParsed",
-                        max_supported_transaction_version=0
-                    )
+                    with track_rpc(SOLANA_RPC, "getTransaction"):
+                        tx_resp = await client.get_transaction(
+                            sig_obj,
+                            encoding="jsonParsed",
+                            max_supported_transaction_version=0
+                        )
                 except Exception as tx_error:
                     logger.warning("Failed to get transaction", extra={
                         "signature": sig_str,
@@ -807,9 +808,11 @@ async def send_payment_link(request: Request, db: Session = Depends(get_db)):
             f"⚠️ This link will open in your browser. Complete the payment and return to the app."
         )
         
-        success = await send_telegram_message(
+        success = await dispatcher.send(
             telegram_id,
             message,
+            priority=PRIORITY_HIGH,
+            wait=True,
             parse_mode="Markdown"
         )
         
@@ -4,12 +4,13 @@ from sqlalchemy.orm import Session
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 from CCOIN.database import get_db
+from CCOIN.utils import ledger
+from CCOIN.utils.activity import activity_buffer
 from CCOIN.models.user import User
 from CCOIN.models.usertask import UserTask
 from CCOIN.tasks.social_check import PLATFORM_REWARD, check_social_follow, check_and_update_all_user_tasks
-from fastapi.templating import Jinja2Templates
+from CCOIN.utils.render_cache import render_cache
 from pydantic import BaseModel, validator
-import os
 import time
 import structlog
 from datetime import datetime, timezone
@@ -29,7 +30,6 @@ class TaskRequest(BaseModel):
 
 router = APIRouter()
 limiter = Limiter(key_func=get_remote_address)
-templates = Jinja2Templates(directory=os.path.join(os.path.dirname(__file__), "..", "templates"))
 
 memory_cache = {}
 CACHE_EXPIRY = 300  
@@ -54,6 +54,46 @@ def clear_user_cache(telegram_id: str):
     for key in keys_to_delete:
         del memory_cache[key]
 
+def build_tasks(db: Session, user: User) -> list:
+    """Task cards for earn.html"""
+    user_tasks = db.query(UserTask).filter(UserTask.user_id == user.id).all()
+    task_dict = {task.platform: task for task in user_tasks}
+
+    return [
+        {
+            "label": "Join Telegram",
+            "reward": PLATFORM_REWARD["telegram"],
+            "platform": "telegram",
+            "icon": "Telegram.png",
+            "completed": task_dict.get("telegram").completed if task_dict.get("telegram") else False,
+            "attempt_count": task_dict.get("telegram").attempt_count if task_dict.get("telegram") else 0
+        },
+        {
+            "label": "Follow Instagram",
+            "reward": PLATFORM_REWARD.get("instagram", 500),
+            "platform": "instagram",
+            "icon": "Instagram.png",
+            "completed": task_dict.get("instagram").completed if task_dict.get("instagram") else False,
+            "attempt_count": task_dict.get("instagram").attempt_count if task_dict.get("instagram") else 0
+        },
+        {
+            "label": "Follow X",
+            "reward": PLATFORM_REWARD.get("x", 500),
+            "platform": "x",
+            "icon": "X.png",
+            "completed": task_dict.get("x").completed if task_dict.get("x") else False,
+            "attempt_count": task_dict.get("x").attempt_count if task_dict.get("x") else 0
+        },
+        {
+            "label": "Subscribe YouTube",
+            "reward": PLATFORM_REWARD.get("youtube", 500),
+            "platform": "youtube",
+            "icon": "YouTube.png",
+            "completed": task_dict.get("youtube").completed if task_dict.get("youtube") else False,
+            "attempt_count": task_dict.get("youtube").attempt_count if task_dict.get("youtube") else 0
+        },
+    ]
+
 @router.get("/", response_class=HTMLResponse)
 @limiter.limit("20/minute")
 async def get_earn(request: Request, db: Session = Depends(get_db)):
@@ -73,66 +113,25 @@ async def get_earn(request: Request, db: Session = Depends(get_db)):
         logger.error("User not found", extra={"telegram_id": telegram_id})
         raise HTTPException(status_code=404, detail="User not found")
 
+    activity_buffer.record(user.id, request.client.host)
+
     cache_key = f"tasks:{telegram_id}"
-    cached_tasks = get_from_cache(cache_key)
 
-    if not cached_tasks:
+    if not get_from_cache(cache_key):
         try:
-            update_result = check_and_update_all_user_tasks(telegram_id, db)
+            update_result = await check_and_update_all_user_tasks(telegram_id, db)
         except Exception as e:
             logger.error("Error updating tasks", extra={
                 "telegram_id": telegram_id,
                 "error": str(e)
             })
+        set_in_cache(cache_key, True, ttl=60)
 
-        user_tasks = db.query(UserTask).filter(UserTask.user_id == user.id).all()
-        
-        task_dict = {task.platform: task for task in user_tasks}
-
-        tasks = [
-            {
-                "label": "Join Telegram",
-                "reward": PLATFORM_REWARD["telegram"],
-                "platform": "telegram",
-                "icon": "Telegram.png",
-                "completed": task_dict.get("telegram").completed if task_dict.get("telegram") else False,
-                "attempt_count": task_dict.get("telegram").attempt_count if task_dict.get("telegram") else 0
-            },
-            {
-                "label": "Follow Instagram",
-                "reward": PLATFORM_REWARD.get("instagram", 500),
-                "platform": "instagram",
-                "icon": "Instagram.png",
-                "completed": task_dict.get("instagram").completed if task_dict.get("instagram") else False,
-                "attempt_count": task_dict.get("instagram").attempt_count if task_dict.get("instagram") else 0
-            },
-            {
-                "label": "Follow X",
-                "reward": PLATFORM_REWARD.get("x", 500),
-                "platform": "x",
-                "icon": "X.png",
-                "completed": task_dict.get("x").completed if task_dict.get("x") else False,
-                "attempt_count": task_dict.get("x").attempt_count if task_dict.get("x") else 0
-            },
-            {
-                "label": "Subscribe YouTube",
-                "reward": PLATFORM_REWARD.get("youtube", 500),
-                "platform": "youtube",
-                "icon": "YouTube.png",
-                "completed": task_dict.get("youtube").completed if task_dict.get("youtube") else False,
-                "attempt_count": task_dict.get("youtube").attempt_count if task_dict.get("youtube") else 0
-            },
-        ]
-
-        set_in_cache(cache_key, tasks, ttl=60)  
-    else:
-        tasks = cached_tasks
-
-    return templates.TemplateResponse("earn.html", {
-        "request": request,
-        "tasks": tasks,
+    # the task check above may write, so the version is read after it
+    return await render_cache.render(request, "earn.html", user.id, lambda: {
+        "tasks": build_tasks(db, user),
         "user_id": telegram_id,
-        "user_tokens": user.tokens
+        "user_tokens": ledger.get_balance(db, user.id)
     })
 
 @router.post("/verify-task")
@@ -203,7 +202,7 @@ async def verify_task(
                 "telegram_id": telegram_id,
                 "platform": platform
             })
-            result = check_social_follow(telegram_id, platform, force_refresh=True)
+            result = await check_social_follow(telegram_id, platform, force_refresh=True)
             
             logger.info("Task verification result", extra={
                 "telegram_id": telegram_id,
@@ -213,12 +212,12 @@ async def verify_task(
             })
             
             return {
-                "success": result,
+                "success": result is True,
                 "attempt_count": task.attempt_count
             }
     
     elif platform == 'telegram':
-        result = check_social_follow(telegram_id, platform, force_refresh=True)
+        result = await check_social_follow(telegram_id, platform, force_refresh=True)
         
         logger.info("Telegram task verification", extra={
             "telegram_id": telegram_id,
@@ -227,7 +226,7 @@ async def verify_task(
         })
         
         return {
-            "success": result,
+            "success": result is True,
             "attempt_count": task.attempt_count
         }
     
@@ -275,15 +274,16 @@ async def claim_reward(
         return {"success": False, "error": "Task already claimed"}
 
     try:
-        result = check_social_follow(telegram_id, platform, force_refresh=True)
+        result = await check_social_follow(telegram_id, platform, force_refresh=True)
 
         if result:
             task.completed = True
             task.completed_at = datetime.now(timezone.utc)
             reward = PLATFORM_REWARD.get(platform, 0)
-            user.tokens += reward
+            ledger.append(db, user.id, reward, "task_reward", ref=platform)
             user.updated_at = datetime.now(timezone.utc)
             db.commit()
+            total_tokens = ledger.get_balance(db, user.id)
 
             background_tasks.add_task(clear_user_cache, telegram_id)
 
@@ -291,14 +291,14 @@ async def claim_reward(
                 "telegram_id": telegram_id,
                 "platform": platform,
                 "reward": reward,
-                "total_tokens": user.tokens,
+                "total_tokens": total_tokens,
                 "attempt_count": task.attempt_count
             })
 
             return {
                 "success": True,
                 "tokens_added": reward,
-                "total_tokens": user.tokens,
+                "total_tokens": total_tokens,
                 "message": f"Congratulations! You earned {reward} tokens!"
             }
         else:
@@ -330,7 +330,7 @@ async def check_all_tasks(request: Request, db: Session = Depends(get_db)):
     telegram_id = str(telegram_id).strip()
 
     try:
-        result = check_and_update_all_user_tasks(telegram_id, db)
+        result = await check_and_update_all_user_tasks(telegram_id, db)
         return result
     except Exception as e:
         logger.error("Check all tasks error", extra={
@@ -361,7 +361,7 @@ async def refresh_task_status(
         raise HTTPException(status_code=404, detail="User not found")
 
     try:
-        update_result = check_and_update_all_user_tasks(telegram_id, db)
+        update_result = await check_and_update_all_user_tasks(telegram_id, db)
 
         background_tasks.add_task(clear_user_cache, telegram_id)
 
@@ -4,9 +4,10 @@ from sqlalchemy.orm import Session
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 from CCOIN.database import get_db
+from CCOIN.utils import ledger
+from CCOIN.utils.activity import activity_buffer
 from CCOIN.models.user import User
-from fastapi.templating import Jinja2Templates
-import os
+from CCOIN.utils.render_cache import render_cache
 import structlog
 from typing import Optional
 
@@ -15,7 +16,6 @@ logger = structlog.get_logger()
 router = APIRouter()
 limiter = Limiter(key_func=get_remote_address)
 
-templates = Jinja2Templates(directory=os.path.join(os.path.dirname(__file__), "..", "templates"))
 
 @router.get("/", response_class=HTMLResponse)
 @limiter.limit("20/minute")
@@ -43,19 +43,18 @@ async def get_home(
         logger.error("User not found", extra={"telegram_id": telegram_id})
         raise HTTPException(status_code=404, detail="User not found")
 
+    activity_buffer.record(user.id, request.client.host)
+
     if user.first_login:
         logger.info("User first login, redirecting", extra={"telegram_id": telegram_id})
         return RedirectResponse(url=f"/load?telegram_id={telegram_id}")
 
-    reward = user.tokens
-
-    logger.info("Rendering home", extra={
-        "telegram_id": telegram_id,
-        "tokens": reward
-    })
+    def context():
+        reward = ledger.get_balance(db, user.id)
+        logger.info("Rendering home", extra={
+            "telegram_id": telegram_id,
+            "tokens": reward
+        })
+        return {"reward": reward, "user": user}
 
-    return templates.TemplateResponse("home.html", {
-        "request": request,
-        "reward": reward,
-        "user": user
-    })
+    return await render_cache.render(request, "home.html", user.id, context)
@@ -6,13 +6,11 @@ from slowapi import Limiter
 from slowapi.util import get_remote_address
 from CCOIN.database import get_db
 from CCOIN.models.user import User
-from fastapi.templating import Jinja2Templates
-import os
+from CCOIN.utils.templates import templates
 
 router = APIRouter()
 limiter = Limiter(key_func=get_remote_address)
 
-templates = Jinja2Templates(directory=os.path.join(os.path.dirname(__file__), "..", "templates"))
 
 @router.get("/", response_class=HTMLResponse)
 @limiter.limit("10/minute")
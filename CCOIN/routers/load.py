@@ -4,29 +4,17 @@ from sqlalchemy.orm import Session
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 from CCOIN.database import get_db
+from CCOIN.utils import ledger
+from CCOIN.utils.activity import activity_buffer
 from CCOIN.models.user import User
-from fastapi.templating import Jinja2Templates
-import os
+from CCOIN.utils.templates import templates
 import structlog
 
-structlog.configure(
-    processors=[
-        structlog.processors.TimeStamper(fmt="iso"),
-        structlog.stdlib.add_log_level,
-        structlog.processors.JSONRenderer(),
-    ],
-    context_class=dict,
-    logger_factory=structlog.stdlib.LoggerFactory(),
-    wrapper_class=structlog.stdlib.BoundLogger,
-    cache_logger_on_first_use=True,
-)
-
 logger = structlog.get_logger()
 
 router = APIRouter()
 limiter = Limiter(key_func=get_remote_address)
 
-templates = Jinja2Templates(directory=os.path.join(os.path.dirname(__file__), "..", "templates"))
 
 @router.get("/load", response_class=HTMLResponse)
 @limiter.limit("10/minute")
@@ -43,12 +31,14 @@ async def get_load(request: Request, db: Session = Depends(get_db)):
     if not user:
         logger.info(f"User not found for telegram_id: {telegram_id}")
         raise HTTPException(status_code=404, detail="User not found")
+
+    activity_buffer.record(user.id, request.client.host)
     
     if not user.first_login:
         logger.info(f"User {telegram_id} is not first login, redirecting to home")
         return RedirectResponse(url="/home")
     
-    reward = user.tokens
+    reward = ledger.get_balance(db, user.id)
     
     if user.first_login:
         user.first_login = False
@@ -1,7 +1,46 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Depends, Query
+from sqlalchemy.orm import Session
+from typing import Optional
+from CCOIN.database import get_db
+from CCOIN.models.user import User
+from CCOIN.utils import ledger
 
 router = APIRouter()
 
 @router.post("/register")
 async def register_user():
-    raise HTTPException(status_code=403, detail="User registration is only allowed via Telegram webhook")
\ No newline at end of file
+    raise HTTPException(status_code=403, detail="User registration is only allowed via Telegram webhook")
+
+@router.get("/token-history")
+async def token_history(
+    request: Request,
+    before_id: Optional[int] = Query(None, ge=1),
+    limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_db)
+):
+    """
+    Newest-first token ledger for the session user; pass next_before_id to page back
+    """
+    telegram_id = request.session.get("telegram_id")
+    if not telegram_id:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    user = db.query(User).filter(User.telegram_id == str(telegram_id).strip()).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    entries = ledger.get_history(db, user.id, before_id, limit)
+    return {
+        "balance": ledger.get_balance(db, user.id),
+        "entries": [
+            {
+                "id": entry.id,
+                "delta": entry.delta,
+                "reason": entry.reason,
+                "ref": entry.ref,
+                "created_at": entry.created_at.isoformat() if entry.created_at else None
+            }
+            for entry in entries
+        ],
+        "next_before_id": entries[-1].id if len(entries) == limit else None
+    }
@@ -1,10 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy import exists
 from sqlalchemy.orm import Session
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 from CCOIN.models.usertask import UserTask
 from CCOIN.models.user import User
 from CCOIN.database import get_db
+from CCOIN.utils import ledger
 from CCOIN.utils.telegram_security import is_user_in_telegram_channel
 import redis
 from CCOIN.config import REDIS_URL
@@ -38,7 +40,8 @@ async def complete_task(task_type: str, platform: str, request: Request, db: Ses
         db.add(task)
     if not task.completed and check_platform_task(user, platform):
         task.completed = True
-        user.tokens += task.reward
+        db.flush()
+        ledger.append(db, user.id, task.reward, "task_reward", ref=str(task.id))
         db.commit()
         redis_client.setex(cache_key, 3600, "completed")
     return {"status": task.completed}
@@ -56,9 +59,10 @@ async def get_task_status(request: Request, user_id: str, db: Session = Depends(
     cached_status = redis_client.get(cache_key)
     if cached_status:
         return eval(cached_status.decode()) 
+    # existence checks instead of loading every task and referral through the relationships
     status = {
-        "task": any(t.completed for t in user.tasks),
-        "invite": len(user.referrals) > 0,
+        "task": db.query(exists().where(UserTask.user_id == user.id, UserTask.completed.is_(True))).scalar(),
+        "invite": db.query(exists().where(User.referred_by == user.id)).scalar(),
         "wallet": bool(user.wallet_address),
         "pay": user.commission_paid
     }
@@ -1,39 +1,22 @@
 from fastapi import APIRouter, Request, Depends, HTTPException, Query
 from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
-from fastapi.templating import Jinja2Templates
+from CCOIN.utils.templates import templates
 from sqlalchemy.orm import Session
 from slowapi import Limiter
 from slowapi.util import get_remote_address
-import os
 from datetime import datetime, timezone
 from CCOIN.database import get_db
 from CCOIN.models.user import User
 from CCOIN.config import SOLANA_RPC, ADMIN_WALLET, BOT_USERNAME, APP_DOMAIN
+from CCOIN.utils.keystore import phantom_keypairs
 import structlog
 import json
 import base58
-import nacl.utils
-import nacl.public
-import time
 
 logger = structlog.get_logger()
 
 router = APIRouter()
 limiter = Limiter(key_func=get_remote_address)
-templates = Jinja2Templates(directory=os.path.join(os.path.dirname(__file__), "..", "templates"))
-
-in_memory_keypairs = {}
-
-def cleanup_old_keypairs():
-    """Remove keypairs older than 5 minutes"""
-    current_time = time.time()
-    to_remove = []
-    for telegram_id, (keypair_data, timestamp) in in_memory_keypairs.items():
-        if current_time - timestamp > 300:  # 5 minutes
-            to_remove.append(telegram_id)
-    
-    for telegram_id in to_remove:
-        in_memory_keypairs.pop(telegram_id, None)
 
 @router.get("/browser/connect", response_class=HTMLResponse)
 @limiter.limit("20/minute")
@@ -49,6 +32,8 @@ async def wallet_browser_connect(
 ):
     """Wallet connection page in browser with Phantom deeplink support"""
     
+    import nacl.public  # only this endpoint does the Phantom key exchange
+
     try:
         logger.info("Wallet connect request", extra={"telegram_id": telegram_id})
         
@@ -74,25 +59,23 @@ async def wallet_browser_connect(
             try:
                 logger.info("Processing Phantom redirect", extra={"telegram_id": telegram_id})
                 
-                keypair_entry = in_memory_keypairs.get(telegram_id)
+                # single use: taken out whatever the outcome, a retry starts a new connect
+                dapp_secret = await phantom_keypairs.take(telegram_id)
                 
-                if not keypair_entry:
-                    logger.error("dApp keypair not found in memory", extra={"telegram_id": telegram_id})
+                if not dapp_secret:
+                    logger.error("dApp keypair not found or expired", extra={"telegram_id": telegram_id})
                     return RedirectResponse(
                         url=f"https://t.me/{BOT_USERNAME}/app?startapp=wallet_error",
                         status_code=302
                     )
                 
-                dapp_keypair_json, _ = keypair_entry
-                dapp_keypair = json.loads(dapp_keypair_json)
-                
                 logger.info("Decrypting Phantom response", extra={"telegram_id": telegram_id})
                 
                 encrypted_data = base58.b58decode(data)
                 nonce_bytes = base58.b58decode(nonce)
                 phantom_public_key_bytes = base58.b58decode(phantom_encryption_public_key)
                 
-                dapp_secret_key = nacl.public.PrivateKey(bytes(dapp_keypair['secretKey']))
+                dapp_secret_key = nacl.public.PrivateKey(dapp_secret)
                 phantom_public_key_obj = nacl.public.PublicKey(phantom_public_key_bytes)
                 
                 box = nacl.public.Box(dapp_secret_key, phantom_public_key_obj)
@@ -122,7 +105,6 @@ async def wallet_browser_connect(
                         "telegram_id": telegram_id,
                         "wallet": wallet_address
                     })
-                    in_memory_keypairs.pop(telegram_id, None)
                     return RedirectResponse(
                         url=f"https://t.me/{BOT_USERNAME}/app?startapp=wallet_error",
                         status_code=302
@@ -150,26 +132,18 @@ async def wallet_browser_connect(
                     "error": str(e)
                 }, exc_info=True)
                 
-                in_memory_keypairs.pop(telegram_id, None)
-                
                 return RedirectResponse(
                     url=f"https://t.me/{BOT_USERNAME}/app?startapp=wallet_error",
                     status_code=302
                 )
         
         else:
-            cleanup_old_keypairs()
-            
             dapp_keypair = nacl.public.PrivateKey.generate()
             
-            dapp_keypair_dict = {
-                'publicKey': list(bytes(dapp_keypair.public_key)),
-                'secretKey': list(bytes(dapp_keypair))
-            }
-            
-            in_memory_keypairs[telegram_id] = (json.dumps(dapp_keypair_dict), time.time())
+            # the 32-byte secret is enough: the public key is derived from it
+            await phantom_keypairs.put(telegram_id, bytes(dapp_keypair))
             
-            logger.info("dApp keypair saved to memory", extra={"telegram_id": telegram_id})
+            logger.info("dApp keypair stored", extra={"telegram_id": telegram_id})
             
             dapp_public_key_base58 = base58.b58encode(bytes(dapp_keypair.public_key)).decode('utf-8')
             
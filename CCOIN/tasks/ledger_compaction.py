@@ -0,0 +1,159 @@
+import sys
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import structlog
+from sqlalchemy import case, func, literal, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from CCOIN.database import SessionLocal
+from CCOIN.models.token_ledger import TokenLedger
+from CCOIN.models.user import User
+from CCOIN.utils import user_state
+from CCOIN.config import LEDGER_COMPACTION_BATCH_SIZE, LEDGER_COMPACTION_MAX_BATCHES
+
+logger = structlog.get_logger(__name__)
+
+OPENING_REASONS = ("opening_balance", "welcome_bonus")
+
+
+def compact_batch(batch_size: int = LEDGER_COMPACTION_BATCH_SIZE) -> int:
+    """
+    Fold the oldest pending ledger rows into users.tokens in one transaction.
+    Rows are claimed with FOR UPDATE SKIP LOCKED, so several workers can
+    compact at once, and each user's row is updated once per batch.
+    """
+    with SessionLocal() as db:
+        rows = db.execute(
+            select(TokenLedger.id, TokenLedger.user_id, TokenLedger.delta)
+            .where(TokenLedger.compacted.is_(False))
+            .order_by(TokenLedger.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if not rows:
+            return 0
+
+        totals = defaultdict(int)
+        for row in rows:
+            totals[row.user_id] += row.delta
+
+        db.execute(
+            update(TokenLedger)
+            .where(TokenLedger.id.in_([row.id for row in rows]))
+            .values(compacted=True),
+            execution_options={"synchronize_session": False}
+        )
+        changed = {user_id: total for user_id, total in totals.items() if total}
+        if changed:
+            # balances shown to the users themselves are unchanged, but a referrer's friends page lists users.tokens
+            referrers = db.execute(
+                update(User)
+                .where(User.id.in_(sorted(changed)))
+                .values(tokens=func.coalesce(User.tokens, 0) + case(changed, value=User.id, else_=0))
+                .returning(User.referred_by),
+                execution_options={"synchronize_session": False}
+            ).scalars().all()
+            user_state.touch(db, *referrers)
+        db.commit()
+    return len(rows)
+
+
+def compact_ledger(batch_size: int = LEDGER_COMPACTION_BATCH_SIZE, max_batches: int = LEDGER_COMPACTION_MAX_BATCHES) -> int:
+    compacted = 0
+    for _ in range(max_batches):
+        count = compact_batch(batch_size)
+        compacted += count
+        if count < batch_size:
+            break
+    if compacted:
+        logger.info("Ledger compacted", rows=compacted)
+    return compacted
+
+
+def backfill_opening_balances() -> int:
+    """
+    Give every user without an opening entry one that makes the compacted
+    ledger sum equal users.tokens. Idempotent; the leader runs it once per term.
+    """
+    with SessionLocal() as db:
+        dialect = sqlite if db.get_bind().dialect.name == "sqlite" else postgresql
+        compacted_sum = (
+            select(func.coalesce(func.sum(TokenLedger.delta), 0))
+            .where(TokenLedger.user_id == User.id, TokenLedger.compacted.is_(True))
+            .scalar_subquery()
+        )
+        has_opening = (
+            select(TokenLedger.id)
+            .where(TokenLedger.user_id == User.id, TokenLedger.reason.in_(OPENING_REASONS))
+            .exists()
+        )
+        stmt = dialect.insert(TokenLedger).from_select(
+            ["user_id", "delta", "reason", "created_at", "compacted"],
+            select(
+                User.id,
+                func.coalesce(User.tokens, 0) - compacted_sum,
+                literal("opening_balance"),
+                literal(datetime.now(timezone.utc)),
+                literal(True)
+            ).where(~has_opening)
+        ).on_conflict_do_nothing(
+            index_elements=[TokenLedger.user_id],
+            index_where=TokenLedger.reason == "opening_balance"
+        )
+        inserted = db.execute(stmt).rowcount
+        db.commit()
+    if inserted:
+        logger.info("Opening balances backfilled", users=inserted)
+    return inserted
+
+
+def rebuild_balances(batch_size: int = 1000) -> int:
+    """
+    Recompute users.tokens from the compacted ledger and return how many
+    balances had drifted. Each batch locks its user rows first, so a
+    concurrent compaction of those users waits instead of being overwritten.
+    """
+    last_id = 0
+    fixed = 0
+    while True:
+        with SessionLocal() as db:
+            user_ids = db.execute(
+                select(User.id).where(User.id > last_id).order_by(User.id).limit(batch_size).with_for_update()
+            ).scalars().all()
+            if not user_ids:
+                break
+            compacted_sum = (
+                select(func.coalesce(func.sum(TokenLedger.delta), 0))
+                .where(TokenLedger.user_id == User.id, TokenLedger.compacted.is_(True))
+                .scalar_subquery()
+            )
+            fixed += db.execute(
+                update(User)
+                .where(User.id.in_(user_ids), func.coalesce(User.tokens, 0) != compacted_sum)
+                .values(tokens=compacted_sum),
+                execution_options={"synchronize_session": False}
+            ).rowcount
+            db.commit()
+            last_id = user_ids[-1]
+    logger.info("Balances rebuilt from ledger", fixed=fixed)
+    return fixed
+
+
+def run_ledger_compaction():
+    """Entry point for the maintenance scheduler, which runs it in a worker thread and logs failures"""
+    compact_ledger()
+
+
+if __name__ == "__main__":
+    # python -m CCOIN.tasks.ledger_compaction [compact|backfill|rebuild]
+    from CCOIN.models import airdrop, transaction, usertask  # noqa: F401  (User's relationships)
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "compact"
+    if command == "backfill":
+        print(backfill_opening_balances())
+    elif command == "rebuild":
+        compact_ledger(max_batches=sys.maxsize)
+        print(rebuild_balances())
+    else:
+        print(compact_ledger(max_batches=sys.maxsize))
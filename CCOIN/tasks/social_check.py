@@ -2,26 +2,17 @@ from sqlalchemy.orm import Session
 from CCOIN.database import SessionLocal
 from CCOIN.models.user import User
 from CCOIN.models.usertask import UserTask
+from CCOIN.tasks.verifiers import get_verifier, run_verifier
+from CCOIN.utils import ledger
 from CCOIN.config import (BOT_TOKEN, TELEGRAM_CHANNEL_USERNAME, 
                          INSTAGRAM_USERNAME, X_USERNAME, YOUTUBE_CHANNEL_HANDLE,
                          INSTAGRAM_ACCESS_TOKEN, X_API_KEY, YOUTUBE_API_KEY)
+import asyncio
 import structlog
-import requests
 import time
+from typing import Optional
 from datetime import datetime
 
-structlog.configure(
-    processors=[
-        structlog.processors.TimeStamper(fmt="iso"),
-        structlog.stdlib.add_log_level,
-        structlog.processors.JSONRenderer(),
-    ],
-    context_class=dict,
-    logger_factory=structlog.stdlib.LoggerFactory(),
-    wrapper_class=structlog.stdlib.BoundLogger,
-    cache_logger_on_first_use=True,
-)
-
 logger = structlog.get_logger()
 
 memory_cache = {}
@@ -47,162 +38,97 @@ def set_in_cache(key, value, ttl):
     """Store in memory cache"""
     memory_cache[key] = (value, time.time() + ttl)
 
-def clear_expired_cache():
-    """Store in memory cache"""
+async def clear_expired_cache():
+    """
+    Drop expired entries from the memory cache; a maintenance job, reads
+    already skip them. Async so it runs on the loop, where the cache is
+    written, and never in a thread beside those writes.
+    """
     current_time = time.time()
-    expired_keys = []
-    for key, (value, expiry) in memory_cache.items():
-        if current_time >= expiry:
-            expired_keys.append(key)
+    expired_keys = [key for key, (value, expiry) in list(memory_cache.items()) if current_time >= expiry]
     
     for key in expired_keys:
-        del memory_cache[key]
+        memory_cache.pop(key, None)
     
     if expired_keys:
         logger.info(f"Cleared {len(expired_keys)} expired cache entries")
 
-def is_user_in_telegram_channel(user_id: int) -> bool:
-    """Check if user is a member of the CCOIN_OFFICIAL Telegram channel"""
-    try:
-        url = f"https://api.telegram.org/bot{BOT_TOKEN}/getChatMember"
-        params = {"chat_id": "@CCOIN_OFFICIAL", "user_id": user_id}
-        
-        logger.info(f"Checking Telegram membership for user {user_id}")
-        
-        response = requests.get(url, params=params, timeout=15)
-        
-        if response.status_code == 200:
-            data = response.json()
-            
-            if data.get("ok"):
-                result = data.get("result", {})
-                status = result.get("status")
-                is_member = status in ["member", "administrator", "creator"]
-                
-                logger.info(f"User {user_id} status in channel: {status}, is_member: {is_member}")
-                return is_member
-            else:
-                error_description = data.get("description", "Unknown error")
-                logger.error(f"Telegram API error: {error_description}")
-                return False
-        else:
-            logger.error(f"Telegram API HTTP error: {response.status_code}")
-            return False
-            
-    except Exception as e:
-        logger.error(f"Error checking Telegram channel membership: {e}")
-        return False
+async def check_social_follow(user_id: str, platform: str, force_refresh: bool = False) -> Optional[bool]:
+    """Main function to check follow status on different platforms; None when it could not be determined"""
+    results = await check_social_follow_many([user_id], platform, force_refresh=force_refresh)
+    return results[user_id]
 
-def check_instagram_follow(user_id: str) -> bool:
-    """Check if user follows Instagram ccoin_official"""
-    try:
+async def check_social_follow_many(user_ids: list, platform: str, force_refresh: bool = False) -> dict:
+    """
+    Check several users on one platform through its verifier plugin. A user
+    maps to None when the verifier could not decide (budget used up,
+    timeout, API error): that is never an unfollow.
+    """
+    verifier = get_verifier(platform)
+    if not verifier:
+        logger.warning(f"⚠️ Unknown platform: {platform}")
+        return {user_id: False for user_id in user_ids}
 
-        logger.info(f"Instagram follow check for user {user_id}: Mock verification - returning True")
-        return True
-        
-    except Exception as e:
-        logger.error(f"Error checking Instagram follow for user {user_id}: {e}")
-        return False
+    results = {}
+    pending = []
+    for user_id in user_ids:
+        verifier.metrics["calls"] += 1
+        cached_result = None if force_refresh else get_from_cache(f"social_check:{user_id}:{platform}")
+        if cached_result is not None:
+            verifier.metrics["cache_hits"] += 1
+            results[user_id] = cached_result == "1"
+            logger.info(f"📋 Cache hit for user {user_id} platform {platform}: {results[user_id]}")
+        else:
+            pending.append(user_id)
 
-def check_x_follow(user_id: str) -> bool:
-    """Check if user follows X CCOIN_OFFICIAL"""
-    try:
+    if pending:
+        logger.info(f"🔍 Checking {platform} follow status for {len(pending)} user(s)")
+        for user_id, result in (await run_verifier(verifier, pending)).items():
+            if result is None:
+                logger.error(f"❌ Could not determine {platform} follow for user {user_id}")
+                results[user_id] = None
+                continue
+            set_in_cache(f"social_check:{user_id}:{platform}", "1" if result else "0", verifier.result_ttl)
+            results[user_id] = result
+            logger.info(f"✅ Follow check result for user {user_id} platform {platform}: {result}")
 
-        logger.info(f"X follow check for user {user_id}: Mock verification - returning True")
-        return True
-        
-    except Exception as e:
-        logger.error(f"Error checking X follow for user {user_id}: {e}")
-        return False
+    return results
 
-def check_youtube_subscribe(user_id: str) -> bool:
-    """Check if user follows youtube CCOIN_OFFICIAL"""
-    try:
-    
-        logger.info(f"YouTube subscribe check for user {user_id}: Mock verification - returning True")
-        return True
-        
-    except Exception as e:
-        logger.error(f"Error checking YouTube subscription for user {user_id}: {e}")
-        return False
+def _find_user_id(db_session: Session, telegram_id: str) -> Optional[int]:
+    return db_session.query(User.id).filter(User.telegram_id == telegram_id).scalar()
 
-def check_social_follow(user_id: str, platform: str, force_refresh: bool = False) -> bool:
-    """Main function to check follow status on different platforms"""
-    clear_expired_cache()
-    
-    cache_key = f"social_check:{user_id}:{platform}"
-    
-    if not force_refresh:
-        cached_result = get_from_cache(cache_key)
-        if cached_result is not None:
-            result = cached_result == "1"
-            logger.info(f"📋 Cache hit for user {user_id} platform {platform}: {result}")
-            return result
-    
-    result = False
+def _apply_follow_statuses(db_session: Session, user_pk: int, telegram_id: str, platforms: list, follow_statuses: list) -> dict:
+    """Bring the user's tasks and balance in line with the follow checks, in one transaction"""
     try:
-        logger.info(f"🔍 Checking {platform} follow status for user {user_id}")
-        
-        if platform == "telegram":
-            result = is_user_in_telegram_channel(int(user_id))
-        elif platform == "instagram":
-            result = check_instagram_follow(user_id)
-        elif platform == "x":
-            result = check_x_follow(user_id)
-        elif platform == "youtube":
-            result = check_youtube_subscribe(user_id)
-        else:
-            logger.warning(f"⚠️ Unknown platform: {platform}")
-            result = False
-            
-    except ValueError as e:
-        logger.error(f"❌ Invalid user_id format for {platform}: {user_id} - {e}")
-        result = False
-    except Exception as e:
-        logger.error(f"❌ Error checking {platform} follow for user {user_id}: {e}")
-        result = False
-    
-    set_in_cache(cache_key, "1" if result else "0", 300)
-    
-    logger.info(f"✅ Follow check result for user {user_id} platform {platform}: {result}")
-    return result
-
-def check_and_update_all_user_tasks(user_id: str, db_session: Session = None) -> dict:
-    """Check all user tasks and update their status"""
-    if not db_session:
-        db_session = SessionLocal()
-        should_close = True
-    else:
-        should_close = False
-    
-    try:
-        user = db_session.query(User).filter(User.telegram_id == user_id).first()
-        if not user:
-            return {"error": "User not found"}
-        
         results = {}
-        platforms = ["telegram", "instagram", "x", "youtube"]
+        tasks = {
+            task.platform: task
+            for task in db_session.query(UserTask).filter(UserTask.user_id == user_pk, UserTask.platform.in_(platforms))
+        }
         
-        for platform in platforms:
-            current_follow_status = check_social_follow(user_id, platform, force_refresh=True)
-            
-            task = db_session.query(UserTask).filter(
-                UserTask.user_id == user.id,
-                UserTask.platform == platform
-            ).first()
+        for platform, current_follow_status in zip(platforms, follow_statuses):
+            task = tasks.get(platform)
             
             if not task:
-                task = UserTask(user_id=user.id, platform=platform, completed=False)
+                task = UserTask(user_id=user_pk, platform=platform, completed=False)
                 db_session.add(task)
             
-            if not current_follow_status and task.completed:
+            if current_follow_status is None:
+                # no answer from the platform: leave the task and balance as they are
+                results[platform] = {"status": "unknown", "follow_status": None}
+                
+            elif not current_follow_status and task.completed:
                 reward = PLATFORM_REWARD.get(platform, 0)
-                user.tokens = max(0, user.tokens - reward) 
+                db_session.flush()
+                delta = ledger.penalty_delta(ledger.get_balance(db_session, user_pk), reward)
+                if delta:
+                    ledger.append(db_session, user_pk, delta, "unfollow_penalty", ref=platform)
+                penalty = -delta
                 task.completed = False
                 task.completed_at = None
                 
-                logger.info(f"🚫 User {user_id} unfollowed {platform}. Penalty applied: -{reward} tokens")
-                results[platform] = {"status": "unfollowed", "penalty": reward, "follow_status": False}
+                logger.info(f"🚫 User {telegram_id} unfollowed {platform}. Penalty applied: -{penalty} tokens")
+                results[platform] = {"status": "unfollowed", "penalty": penalty, "follow_status": False}
                 
             elif current_follow_status and not task.completed:
                 results[platform] = {"status": "ready_to_claim", "follow_status": True}
@@ -214,15 +140,39 @@ def check_and_update_all_user_tasks(user_id: str, db_session: Session = None) ->
                 results[platform] = {"status": "not_completed", "follow_status": False}
         
         db_session.commit()
-        return {"success": True, "platforms": results, "user_tokens": user.tokens}
+        return {"success": True, "platforms": results, "user_tokens": ledger.get_balance(db_session, user_pk)}
         
     except Exception as e:
         db_session.rollback()
         logger.error(f"Error checking all user tasks: {e}")
         return {"error": str(e)}
+
+async def check_and_update_all_user_tasks(user_id: str, db_session: Session = None) -> dict:
+    """Check all user tasks and update their status"""
+    if not db_session:
+        db_session = SessionLocal()
+        should_close = True
+    else:
+        should_close = False
+    
+    # the session is only ever used from one thread at a time: the loop waits on each hop
+    try:
+        user_pk = await asyncio.to_thread(_find_user_id, db_session, user_id)
+        if user_pk is None:
+            return {"error": "User not found"}
+        
+        platforms = ["telegram", "instagram", "x", "youtube"]
+        follow_statuses = await asyncio.gather(
+            *(check_social_follow(user_id, platform, force_refresh=True) for platform in platforms)
+        )
+        return await asyncio.to_thread(_apply_follow_statuses, db_session, user_pk, user_id, platforms, list(follow_statuses))
+        
+    except Exception as e:
+        logger.error(f"Error checking all user tasks: {e}")
+        return {"error": str(e)}
     finally:
         if should_close:
-            db_session.close()
+            await asyncio.to_thread(db_session.close)
 
 def get_detailed_telegram_status(user_id: int) -> dict:
     """Clear the user's cache for a specific platform or for all platforms"""
@@ -230,6 +180,8 @@ def get_detailed_telegram_status(user_id: int) -> dict:
         url = f"https://api.telegram.org/bot{BOT_TOKEN}/getChatMember"
         params = {"chat_id": "@CCOIN_OFFICIAL", "user_id": user_id}
         
+        import requests  # diagnostics only; kept off the app's import path
+
         response = requests.get(url, params=params, timeout=15)
         
         if response.status_code == 200:
@@ -329,6 +281,8 @@ def verify_bot_access():
                 "error": "BOT_TOKEN not configured"
             }
         
+        import requests  # diagnostics only; kept off the app's import path
+
         url = f"https://api.telegram.org/bot{BOT_TOKEN}/getMe"
         response = requests.get(url, timeout=10)
         
@@ -366,12 +320,12 @@ def verify_bot_access():
             "error": str(e)
         }
 
-def manual_verify_user_task(user_id: str, platform: str, force: bool = False):
+async def manual_verify_user_task(user_id: str, platform: str, force: bool = False):
     """Manual verification of user task"""
     try:
         clear_user_cache(user_id, platform)
         
-        return check_social_follow(user_id, platform, force_refresh=True)
+        return await check_social_follow(user_id, platform, force_refresh=True)
         
     except Exception as e:
         logger.error(f"Error in manual verification: {e}")
@@ -0,0 +1,159 @@
+import sys
+from datetime import date, datetime, time, timedelta, timezone
+from typing import List, Optional
+
+import structlog
+from sqlalchemy import case, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from CCOIN.database import SessionLocal
+from CCOIN.models.daily_stats import DailyStats
+from CCOIN.models.token_ledger import TokenLedger
+from CCOIN.models.user import User
+
+logger = structlog.get_logger(__name__)
+
+DAILY_FIELDS = ("signups", "wallet_connections", "commission_payments")
+TOTAL_FIELDS = ("total_users", "connected_wallets", "tokens_distributed")
+
+# what /metrics serves; the maintenance jobs swap in a new dict on every refresh
+_latest = {}
+
+
+def current() -> dict:
+    return _latest
+
+
+def _upsert(db, row: dict):
+    dialect = sqlite if db.get_bind().dialect.name == "sqlite" else postgresql
+    stmt = dialect.insert(DailyStats).values(**row)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[DailyStats.day],
+        set_={name: stmt.excluded[name] for name in row if name != "day"}
+    )
+    db.execute(stmt)
+
+
+def _count_in_day(column, day: date):
+    start = datetime.combine(day, time.min, tzinfo=timezone.utc)
+    return func.coalesce(func.sum(case(((column >= start) & (column < start + timedelta(days=1)), 1), else_=0)), 0)
+
+
+def _tokens_distributed():
+    """Every balance as users read it: users.tokens plus the ledger deltas not yet compacted into it"""
+    pending = select(func.coalesce(func.sum(TokenLedger.delta), 0)).where(TokenLedger.compacted.is_(False)).scalar_subquery()
+    return func.coalesce(func.sum(User.tokens), 0) + pending
+
+
+def refresh_stats(today: Optional[date] = None) -> dict:
+    """
+    Rewrite today's row and yesterday's daily counts, in one pass over users.
+    Yesterday is recounted so events committed just before midnight are not
+    lost; it keeps the totals of its last refresh before the day ended.
+    """
+    today = today or datetime.now(timezone.utc).date()
+    days = (today - timedelta(days=1), today)
+    columns = [
+        func.count(User.id),
+        func.coalesce(func.sum(case((User.wallet_connected.is_(True), 1), else_=0)), 0),
+        _tokens_distributed(),
+    ]
+    for day in days:
+        columns += [
+            _count_in_day(User.created_at, day),
+            _count_in_day(User.wallet_connection_date, day),
+            _count_in_day(User.commission_payment_date, day),
+        ]
+
+    now = datetime.now(timezone.utc)
+    with SessionLocal() as db:
+        result = db.execute(select(*columns)).one()
+        totals = dict(zip(TOTAL_FIELDS, result[:3]))
+        rows = [
+            {"day": day, **dict(zip(DAILY_FIELDS, result[3 + 3 * i:6 + 3 * i])), "updated_at": now}
+            for i, day in enumerate(days)
+        ]
+        rows[1].update(totals)
+        for row in rows:
+            _upsert(db, row)
+        db.commit()
+
+    global _latest
+    _latest = {**rows[1], "day": today.isoformat(), "updated_at": now.isoformat()}
+    return _latest
+
+
+def _as_date(value) -> date:
+    # SQLite's date() gives a string, Postgres a date
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def backfill_daily_stats() -> int:
+    """
+    Fill the history from users' timestamps when the table is empty. Only
+    total_users can be rebuilt (as running signups); the other totals of
+    past days stay null.
+    """
+    with SessionLocal() as db:
+        if db.execute(select(DailyStats.day).limit(1)).first() is not None:
+            return 0
+        history = {}
+        for field, column in zip(DAILY_FIELDS, (User.created_at, User.wallet_connection_date, User.commission_payment_date)):
+            day_column = func.date(column)
+            for day, count in db.execute(select(day_column, func.count()).where(column.isnot(None)).group_by(day_column)):
+                history.setdefault(_as_date(day), dict.fromkeys(DAILY_FIELDS, 0))[field] = count
+
+        total_users = 0
+        for day in sorted(history):
+            total_users += history[day]["signups"]
+            _upsert(db, {"day": day, **history[day], "total_users": total_users})
+        db.commit()
+    if history:
+        logger.info("Daily stats backfilled", days=len(history))
+    return len(history)
+
+
+def get_daily_stats(days: int = 30) -> List[dict]:
+    """Newest-first daily series for dashboards"""
+    with SessionLocal() as db:
+        rows = db.execute(select(DailyStats).order_by(DailyStats.day.desc()).limit(days)).scalars().all()
+        return [
+            {
+                "day": row.day.isoformat(),
+                **{field: getattr(row, field) for field in DAILY_FIELDS + TOTAL_FIELDS},
+                "updated_at": row.updated_at.isoformat() if row.updated_at else None,
+            }
+            for row in rows
+        ]
+
+
+def load_latest() -> dict:
+    """Read today's row into what /metrics serves, on instances that do not run the rollup"""
+    global _latest
+    today = datetime.now(timezone.utc).date()
+    with SessionLocal() as db:
+        row = db.get(DailyStats, today)
+        if row is None:
+            return _latest
+        latest = {field: getattr(row, field) for field in DAILY_FIELDS + TOTAL_FIELDS}
+        latest.update(day=today.isoformat(), updated_at=row.updated_at.isoformat() if row.updated_at else None)
+
+    _latest = latest
+    return _latest
+
+
+def run_stats_rollup():
+    """Entry point for the maintenance scheduler, which runs it in a worker thread and logs failures"""
+    backfill_daily_stats()
+    refresh_stats()
+
+
+if __name__ == "__main__":
+    # python -m CCOIN.tasks.stats_rollup [refresh|backfill]
+    from CCOIN.models import airdrop, transaction, usertask  # noqa: F401  (User's relationships)
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "refresh"
+    if command == "backfill":
+        print(backfill_daily_stats())
+    else:
+        print(refresh_stats())
@@ -0,0 +1,141 @@
+import asyncio
+
+import redis
+import structlog
+from sqlalchemy import select, update
+
+from CCOIN.database import SessionLocal
+from CCOIN.models.user import User
+from CCOIN.models.usertask import UserTask
+from CCOIN.tasks.social_check import PLATFORM_REWARD, clear_user_cache
+from CCOIN.tasks.verifiers import get_verifier, run_verifier
+from CCOIN.utils import ledger, user_state
+from CCOIN.config import (
+    REDIS_URL, UNFOLLOW_SWEEP_BATCH_SIZE, UNFOLLOW_SWEEP_MAX_BATCHES, UNFOLLOW_SWEEP_CONCURRENCY
+)
+
+logger = structlog.get_logger(__name__)
+
+CHECKPOINT_KEY = "unfollow_sweep:last_task_id"
+
+try:
+    redis_client = redis.Redis.from_url(REDIS_URL, decode_responses=True) if REDIS_URL else None
+except Exception as e:
+    logger.error("Redis unavailable for unfollow sweeper", error=str(e))
+    redis_client = None
+
+_memory_checkpoint = {"last_task_id": 0}
+
+
+def load_checkpoint() -> int:
+    """Last user_tasks.id processed by the sweeper"""
+    if redis_client:
+        try:
+            value = redis_client.get(CHECKPOINT_KEY)
+            return int(value) if value else 0
+        except Exception as e:
+            logger.warning("Checkpoint read failed, using memory", error=str(e))
+    return _memory_checkpoint["last_task_id"]
+
+
+def save_checkpoint(last_task_id: int):
+    _memory_checkpoint["last_task_id"] = last_task_id
+    if redis_client:
+        try:
+            redis_client.set(CHECKPOINT_KEY, last_task_id)
+        except Exception as e:
+            logger.warning("Checkpoint write failed", error=str(e))
+
+
+def fetch_batch(after_task_id: int, batch_size: int) -> list:
+    """Next keyset page of completed Telegram tasks, read in its own short transaction"""
+    with SessionLocal() as db:
+        rows = db.execute(
+            select(UserTask.id, UserTask.user_id, User.telegram_id)
+            .join(User, User.id == UserTask.user_id)
+            .where(
+                UserTask.platform == "telegram",
+                UserTask.completed.is_(True),
+                UserTask.id > after_task_id
+            )
+            .order_by(UserTask.id)
+            .limit(batch_size)
+        ).all()
+    return rows
+
+
+def apply_penalties(task_ids: list) -> list:
+    """
+    Reset the tasks with one set-based UPDATE and append one penalty per user
+    to the token ledger. Only tasks still completed at write time are charged,
+    so a concurrent /earn/check-all-tasks cannot double-penalize.
+    """
+    reward = PLATFORM_REWARD["telegram"]
+    with SessionLocal() as db:
+        user_ids = db.execute(
+            update(UserTask)
+            .where(UserTask.id.in_(task_ids), UserTask.completed.is_(True))
+            .values(completed=False, completed_at=None)
+            .returning(UserTask.user_id)
+        ).scalars().all()
+        user_state.touch(db, *user_ids)
+
+        balances = ledger.get_balances(db, list(set(user_ids)))
+        entries = []
+        for user_id in user_ids:
+            delta = ledger.penalty_delta(balances.get(user_id, 0), reward)
+            if delta:
+                balances[user_id] += delta
+                entries.append({"user_id": user_id, "delta": delta, "reason": "unfollow_penalty", "ref": "telegram"})
+        ledger.append_many(db, entries)
+        db.commit()
+    return user_ids
+
+
+async def sweep_unfollowed_users(
+    batch_size: int = UNFOLLOW_SWEEP_BATCH_SIZE,
+    max_batches: int = UNFOLLOW_SWEEP_MAX_BATCHES
+) -> dict:
+    """
+    Walk completed Telegram tasks in keyset order, re-verify channel membership
+    and penalize users who left. Checks go through the Telegram verifier, so
+    the sweep and the interactive re-checks draw on one Bot API rate limit
+    (and a RetryAfter pauses both); the sweep runs on the app's event loop
+    to share it. Progress is checkpointed after every batch; a run stops
+    after `max_batches` and the next run resumes where it left off.
+    """
+    verifier = get_verifier("telegram")
+    semaphore = asyncio.Semaphore(UNFOLLOW_SWEEP_CONCURRENCY)  # the sweep's share of the verifier's slots
+    last_task_id = await asyncio.to_thread(load_checkpoint)
+    stats = {"checked": 0, "penalized": 0, "unknown": 0, "batches": 0, "completed_pass": False}
+
+    async def check(row):
+        async with semaphore:
+            results = await run_verifier(verifier, [row.telegram_id])
+        return row, results.get(row.telegram_id)
+
+    for _ in range(max_batches):
+        rows = await asyncio.to_thread(fetch_batch, last_task_id, batch_size)
+        if not rows:
+            stats["completed_pass"] = True
+            last_task_id = 0
+            await asyncio.to_thread(save_checkpoint, last_task_id)
+            break
+
+        results = await asyncio.gather(*(check(row) for row in rows))
+        left = [(row.id, row.telegram_id) for row, is_member in results if is_member is False]
+
+        if left:
+            penalized = await asyncio.to_thread(apply_penalties, [task_id for task_id, _ in left])
+            stats["penalized"] += len(penalized)
+            for _, telegram_id in left:
+                clear_user_cache(telegram_id, "telegram")
+
+        stats["checked"] += len(rows)
+        stats["unknown"] += sum(1 for _, is_member in results if is_member is None)
+        stats["batches"] += 1
+        last_task_id = rows[-1].id
+        await asyncio.to_thread(save_checkpoint, last_task_id)
+
+    logger.info("Unfollow sweep finished", last_task_id=last_task_id, **stats)
+    return stats
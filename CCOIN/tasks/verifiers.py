@@ -0,0 +1,285 @@
+import asyncio
+import time
+import weakref
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import structlog
+from redis import asyncio as aioredis
+
+from CCOIN.config import (
+    BOT_TOKEN, TELEGRAM_CHANNEL_USERNAME, TELEGRAM_API_BASE_URL, REDIS_URL, TELEGRAM_API_RATE, TELEGRAM_API_BURST
+)
+from CCOIN.utils.metrics import observe_telegram
+from CCOIN.utils.rate_limit import TokenBucket
+
+logger = structlog.get_logger(__name__)
+
+MEMBER_STATUSES = {"member", "administrator", "creator"}
+LEFT_STATUSES = {"left", "kicked"}
+
+_memory_budgets: Dict[str, int] = {}
+
+
+class SocialVerifier:
+    """
+    Base class for async follow/subscribe verifier plugins.
+
+    Subclasses declare their quotas as class attributes and implement `check`.
+    Every caller on a loop (the social re-checks and the unfollow sweeper
+    alike) goes through run_verifier and so shares one rate limiter per
+    plugin; `burst` is its capacity, max_concurrency when unset.
+    Plugins whose upstream API can answer for several users in one call set
+    `supports_batch` and override `check_many`; one batch counts as one
+    request against the quota.
+    """
+
+    platform = ""
+    requests_per_minute = 60
+    burst: Optional[int] = None
+    daily_budget: Optional[int] = None
+    result_ttl = 300
+    max_concurrency = 5
+    supports_batch = False
+    batch_size = 1
+
+    def __init__(self):
+        self.metrics = {
+            "calls": 0,
+            "cache_hits": 0,
+            "upstream_calls": 0,
+            "errors": 0,
+            "budget_exhausted": 0,
+            "in_flight": 0,
+            "latency_total": 0.0,
+        }
+        self._loop_state = weakref.WeakKeyDictionary()
+
+    def _state(self) -> dict:
+        """Semaphore, bucket, HTTP and Redis clients bound to the running event loop"""
+        loop = asyncio.get_running_loop()
+        state = self._loop_state.get(loop)
+        if state is None:
+            state = {
+                "semaphore": asyncio.Semaphore(self.max_concurrency),
+                "bucket": TokenBucket(self.requests_per_minute / 60, self.burst or self.max_concurrency),
+                "client": None,
+                "redis": aioredis.from_url(REDIS_URL, decode_responses=True) if REDIS_URL else None,
+            }
+            self._loop_state[loop] = state
+        return state
+
+    def http_client(self) -> httpx.AsyncClient:
+        state = self._state()
+        if state["client"] is None or state["client"].is_closed:
+            state["client"] = httpx.AsyncClient(timeout=15)
+        return state["client"]
+
+    async def consume_budget(self, calls: int = 1) -> bool:
+        """Count upstream calls against the daily budget shared by all workers"""
+        if self.daily_budget is None:
+            return True
+        key = f"verifier_budget:{self.platform}:{datetime.now(timezone.utc):%Y%m%d}"
+        client = self._state()["redis"]
+        if client is not None:
+            try:
+                used = await client.incrby(key, calls)
+                if used == calls:
+                    await client.expire(key, 2 * 86400)
+                return used <= self.daily_budget
+            except Exception as e:
+                logger.warning("Verifier budget check failed, using memory", platform=self.platform, error=str(e))
+        _memory_budgets[key] = _memory_budgets.get(key, 0) + calls
+        return _memory_budgets[key] <= self.daily_budget
+
+    async def check(self, user_id: str) -> Optional[bool]:
+        """True/False for a definite answer, None when it could not be determined"""
+        raise NotImplementedError
+
+    async def check_many(self, user_ids: List[str]) -> Dict[str, Optional[bool]]:
+        raise NotImplementedError
+
+    async def close(self):
+        for state in list(self._loop_state.values()):
+            if state["client"] is not None:
+                await state["client"].aclose()
+                state["client"] = None
+            if state["redis"] is not None:
+                await state["redis"].aclose()
+                state["redis"] = None
+
+
+_registry: Dict[str, SocialVerifier] = {}
+
+
+def register_verifier(cls):
+    """Class decorator adding a verifier plugin to the registry"""
+    verifier = cls()
+    _registry[verifier.platform] = verifier
+    return cls
+
+
+def get_verifier(platform: str) -> Optional[SocialVerifier]:
+    return _registry.get(platform)
+
+
+def registered_platforms() -> List[str]:
+    return list(_registry)
+
+
+async def run_verifier(verifier: SocialVerifier, user_ids: List[str]) -> Dict[str, Optional[bool]]:
+    """Run a plugin under its concurrency limit, rate limit and daily budget"""
+    state = verifier._state()
+    chunk_size = verifier.batch_size if verifier.supports_batch else 1
+
+    async def run_chunk(ids: List[str]) -> Dict[str, Optional[bool]]:
+        if not await verifier.consume_budget():
+            verifier.metrics["budget_exhausted"] += 1
+            logger.warning("Verifier daily budget exhausted", platform=verifier.platform)
+            return {uid: None for uid in ids}
+
+        await state["bucket"].acquire()
+        async with state["semaphore"]:
+            verifier.metrics["in_flight"] += 1
+            started = time.perf_counter()
+            try:
+                if verifier.supports_batch:
+                    return await verifier.check_many(ids)
+                return {ids[0]: await verifier.check(ids[0])}
+            except Exception as e:
+                verifier.metrics["errors"] += 1
+                logger.error("Verifier failed", platform=verifier.platform, error=str(e))
+                return {uid: None for uid in ids}
+            finally:
+                verifier.metrics["in_flight"] -= 1
+                verifier.metrics["upstream_calls"] += 1
+                verifier.metrics["latency_total"] += time.perf_counter() - started
+
+    chunks = [user_ids[i:i + chunk_size] for i in range(0, len(user_ids), chunk_size)]
+    results: Dict[str, Optional[bool]] = {}
+    for part in await asyncio.gather(*(run_chunk(chunk) for chunk in chunks)):
+        results.update(part)
+    return results
+
+
+def verifier_stats() -> dict:
+    """Per-plugin counters and declared quotas"""
+    return {
+        platform: {
+            **verifier.metrics,
+            "requests_per_minute": verifier.requests_per_minute,
+            "daily_budget": verifier.daily_budget,
+            "result_ttl": verifier.result_ttl,
+            "max_concurrency": verifier.max_concurrency,
+            "supports_batch": verifier.supports_batch,
+        }
+        for platform, verifier in _registry.items()
+    }
+
+
+async def get_chat_member_status(client: httpx.AsyncClient, telegram_id: str) -> Tuple[Optional[bool], Optional[int]]:
+    """
+    Ask the Bot API whether a user is in the official channel.
+    Returns (is_member, retry_after); is_member is None when Telegram
+    gave no definite answer, so API trouble is never read as an unfollow.
+    """
+    started = time.perf_counter()
+    try:
+        response = await client.get(
+            f"{TELEGRAM_API_BASE_URL}/bot{BOT_TOKEN}/getChatMember",
+            params={"chat_id": f"@{TELEGRAM_CHANNEL_USERNAME}", "user_id": int(telegram_id)}
+        )
+    except Exception as e:
+        observe_telegram("getChatMember", time.perf_counter() - started, error=e)
+        logger.warning("getChatMember failed", telegram_id=telegram_id, error=str(e))
+        return None, None
+    observe_telegram("getChatMember", time.perf_counter() - started, status=response.status_code)
+
+    try:
+        data = response.json()
+    except ValueError as e:
+        logger.warning("getChatMember failed", telegram_id=telegram_id, error=str(e))
+        return None, None
+
+    if response.status_code == 429 or data.get("error_code") == 429:
+        return None, (data.get("parameters") or {}).get("retry_after", 5)
+
+    if not data.get("ok"):
+        description = data.get("description", "").lower()
+        if "user not found" in description or "participant_id_invalid" in description:
+            return False, None
+        logger.warning("getChatMember error", telegram_id=telegram_id, description=description)
+        return None, None
+
+    result = data.get("result", {})
+    status = result.get("status")
+    if status in MEMBER_STATUSES:
+        return True, None
+    if status == "restricted":
+        return bool(result.get("is_member")), None
+    if status in LEFT_STATUSES:
+        return False, None
+    return None, None
+
+
+@register_verifier
+class TelegramVerifier(SocialVerifier):
+    """Channel membership through getChatMember"""
+
+    platform = "telegram"
+    requests_per_minute = TELEGRAM_API_RATE * 60  # the bot's whole getChatMember budget
+    burst = TELEGRAM_API_BURST
+    result_ttl = 300
+    max_concurrency = 10
+
+    async def check(self, user_id: str) -> Optional[bool]:
+        is_member, retry_after = await get_chat_member_status(self.http_client(), user_id)
+        if retry_after:
+            logger.warning("Telegram verifier rate limited", retry_after=retry_after)
+            self._state()["bucket"].pause(retry_after)
+        return is_member
+
+
+@register_verifier
+class InstagramVerifier(SocialVerifier):
+    """Placeholder: the Graph API cannot list followers, so every check passes"""
+
+    platform = "instagram"
+    requests_per_minute = 60
+    daily_budget = 4800
+    result_ttl = 3600
+
+    async def check(self, user_id: str) -> Optional[bool]:
+        logger.info(f"Instagram follow check for user {user_id}: Mock verification - returning True")
+        return True
+
+
+@register_verifier
+class XVerifier(SocialVerifier):
+    """Placeholder: batch-capable like the X users lookup endpoint, every check passes"""
+
+    platform = "x"
+    requests_per_minute = 15
+    daily_budget = 500
+    result_ttl = 3600
+    supports_batch = True
+    batch_size = 100
+
+    async def check_many(self, user_ids: List[str]) -> Dict[str, Optional[bool]]:
+        logger.info(f"X follow check for {len(user_ids)} users: Mock verification - returning True")
+        return {uid: True for uid in user_ids}
+
+
+@register_verifier
+class YouTubeVerifier(SocialVerifier):
+    """Placeholder: subscriptions.list costs one quota unit per call, every check passes"""
+
+    platform = "youtube"
+    requests_per_minute = 600
+    daily_budget = 10000
+    result_ttl = 3600
+
+    async def check(self, user_id: str) -> Optional[bool]:
+        logger.info(f"YouTube subscribe check for user {user_id}: Mock verification - returning True")
+        return True
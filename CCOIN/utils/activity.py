@@ -0,0 +1,122 @@
+import asyncio
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+import structlog
+from sqlalchemy import DateTime, Integer, String, case, column, func, update, values
+
+from CCOIN.database import SessionLocal
+from CCOIN.models.user import User
+from CCOIN.config import ACTIVITY_FLUSH_INTERVAL, ACTIVITY_FLUSH_SIZE
+
+logger = structlog.get_logger(__name__)
+
+
+def _update_statement(dialect: str, entries: Dict[int, Tuple[datetime, Optional[str]]]):
+    now = datetime.now(timezone.utc)
+    if dialect == "postgresql":
+        activity = values(
+            column("id", Integer),
+            column("last_active", DateTime(timezone=True)),
+            column("last_ip", String),
+            name="activity"
+        ).data([(user_id, seen_at, ip) for user_id, (seen_at, ip) in entries.items()])
+        return (
+            update(User)
+            .where(User.id == activity.c.id)
+            .values(
+                last_active=activity.c.last_active,
+                last_ip=func.coalesce(activity.c.last_ip, User.last_ip),
+                updated_at=now
+            )
+        )
+
+    # SQLite has no UPDATE ... FROM (VALUES ...) AS alias(cols)
+    ips = {user_id: ip for user_id, (_, ip) in entries.items() if ip}
+    return (
+        update(User)
+        .where(User.id.in_(sorted(entries)))
+        .values(
+            last_active=case({user_id: seen_at for user_id, (seen_at, _) in entries.items()}, value=User.id),
+            last_ip=case(ips, value=User.id, else_=User.last_ip) if ips else User.last_ip,
+            updated_at=now
+        )
+    )
+
+
+def write_activity(entries: Dict[int, Tuple[datetime, Optional[str]]]) -> int:
+    """Apply buffered activity in one UPDATE; returns the rows touched"""
+    with SessionLocal() as db:
+        stmt = _update_statement(db.get_bind().dialect.name, entries)
+        updated = db.execute(stmt, execution_options={"synchronize_session": False}).rowcount
+        db.commit()
+    return updated
+
+
+class ActivityBuffer:
+    """
+    Write-behind buffer for last_active / last_ip. Routes call record(),
+    which only touches a dict; repeated hits from one user coalesce to the
+    latest, and the buffer is written every `interval` seconds or once
+    `max_size` users are waiting.
+    """
+
+    def __init__(self, interval: float = ACTIVITY_FLUSH_INTERVAL, max_size: int = ACTIVITY_FLUSH_SIZE):
+        self.interval = interval
+        self.max_size = max_size
+        self._entries: Dict[int, Tuple[datetime, Optional[str]]] = {}
+        self._full = None
+        self._task = None
+        self._stopping = False
+        self.stats = {"recorded": 0, "flushes": 0, "rows_written": 0, "failed_flushes": 0}
+
+    def record(self, user_id: int, ip: Optional[str] = None):
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._full = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        previous = self._entries.get(user_id)
+        # keep the last known IP when this hit has none
+        self._entries[user_id] = (datetime.now(timezone.utc), ip or (previous[1] if previous else None))
+        self.stats["recorded"] += 1
+        if len(self._entries) >= self.max_size:
+            self._full.set()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            await self.flush()
+
+    async def flush(self):
+        if not self._entries:
+            return
+        entries, self._entries = self._entries, {}
+        try:
+            self.stats["rows_written"] += await asyncio.to_thread(write_activity, entries)
+            self.stats["flushes"] += 1
+        except Exception as e:
+            self.stats["failed_flushes"] += 1
+            logger.warning("Activity flush failed", users=len(entries), error=str(e))
+            # newer hits recorded meanwhile win over the failed batch
+            self._entries = {**entries, **self._entries}
+
+    async def stop(self):
+        """Stop the flush task and write whatever is still buffered"""
+        if self._task is not None:
+            # not cancel(): a flush in progress must finish its write
+            self._stopping = True
+            self._full.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    @property
+    def pending(self) -> int:
+        return len(self._entries)
+
+
+activity_buffer = ActivityBuffer()
@@ -1,17 +1,18 @@
 from datetime import datetime, timezone, timedelta
 from sqlalchemy.orm import Session
 from CCOIN.models.user import User
-from solana.rpc.api import Client
 from CCOIN.config import SOLANA_RPC
+from CCOIN.utils.metrics import track_rpc
+from CCOIN.utils.solana_rpc import get_sync_client
 import structlog
 
 logger = structlog.get_logger()
-solana_client = Client(SOLANA_RPC)
 
 def check_wallet_age(wallet_address: str) -> bool:
     """Check wallet age — newly created wallets may be suspicious"""
     try:
-        response = solana_client.get_signatures_for_address(wallet_address, limit=1)
+        with track_rpc(SOLANA_RPC, "getSignaturesForAddress"):
+            response = get_sync_client().get_signatures_for_address(wallet_address, limit=1)
         if not response.value:
             logger.warning("Empty wallet detected", extra={"wallet": wallet_address})
             return False 
@@ -56,7 +57,8 @@ def check_duplicate_pattern(db: Session, telegram_id: str, ip_address: str = Non
 def check_wallet_activity(wallet_address: str) -> dict:
     """Check wallet activity"""
     try:
-        response = solana_client.get_signatures_for_address(wallet_address, limit=100)
+        with track_rpc(SOLANA_RPC, "getSignaturesForAddress"):
+            response = get_sync_client().get_signatures_for_address(wallet_address, limit=100)
         
         if not response.value:
             return {
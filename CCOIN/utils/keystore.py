@@ -0,0 +1,81 @@
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import structlog
+from redis import asyncio as aioredis
+
+from CCOIN.config import REDIS_URL, KEYPAIR_TTL, KEYPAIR_LOCAL_MAX
+
+logger = structlog.get_logger(__name__)
+
+
+class EphemeralKeystore:
+    """
+    Short-lived secrets that any instance may need to read back, such as
+    the dApp keypair of a Phantom connect whose redirect can land on
+    another worker. Values are raw bytes in Redis under `prefix` with a
+    native TTL, and `take` reads and deletes in one GETDEL, so a secret is
+    used once. When Redis is unreachable they go to a local LRU of at most
+    `max_local` entries, which only the same process can read back.
+    """
+
+    def __init__(self, prefix: str, ttl: int = KEYPAIR_TTL, max_local: int = KEYPAIR_LOCAL_MAX):
+        self.prefix = prefix
+        self.ttl = ttl
+        self.max_local = max_local
+        self._redis = None
+        self._local = OrderedDict()  # key -> (value, expires_at), oldest first
+        self.counters = {"stored": 0, "stored_local": 0, "taken": 0, "missing": 0, "evicted": 0}
+
+    def _client(self):
+        if self._redis is None and REDIS_URL:
+            self._redis = aioredis.from_url(REDIS_URL)
+        return self._redis
+
+    async def put(self, key: str, value: bytes):
+        client = self._client()
+        if client is not None:
+            try:
+                await client.set(self.prefix + key, value, ex=self.ttl)
+                self.counters["stored"] += 1
+                return
+            except Exception as e:
+                logger.warning("Keystore write to Redis failed, keeping it in memory", prefix=self.prefix, error=str(e))
+        self._put_local(key, value)
+
+    def _put_local(self, key: str, value: bytes):
+        now = time.monotonic()
+        self._local.pop(key, None)
+        # one TTL for every entry, so the oldest are also the first to expire
+        while self._local and (next(iter(self._local.values()))[1] <= now or len(self._local) >= self.max_local):
+            self._local.popitem(last=False)
+            self.counters["evicted"] += 1
+        self._local[key] = (value, now + self.ttl)
+        self.counters["stored_local"] += 1
+
+    async def take(self, key: str) -> Optional[bytes]:
+        """The value stored under `key`, removed; None when missing or expired"""
+        value = None
+        client = self._client()
+        if client is not None:
+            try:
+                value = await client.getdel(self.prefix + key)
+            except Exception as e:
+                logger.warning("Keystore read from Redis failed", prefix=self.prefix, error=str(e))
+        entry = self._local.pop(key, None)
+        if value is None and entry is not None and entry[1] > time.monotonic():
+            value = entry[0]
+        self.counters["taken" if value is not None else "missing"] += 1
+        return value
+
+    async def close(self):
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    def stats(self) -> dict:
+        return {"local_entries": len(self._local), "local_max": self.max_local, **self.counters}
+
+
+phantom_keypairs = EphemeralKeystore("phantom_keypair:")
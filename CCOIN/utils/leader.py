@@ -0,0 +1,171 @@
+import asyncio
+import inspect
+import time
+import uuid
+from typing import Awaitable, Callable, List, Union
+
+import structlog
+from redis import asyncio as aioredis
+from redis.exceptions import TimeoutError as RedisTimeoutError
+
+from CCOIN.config import REDIS_URL, LEADER_KEY, LEADER_TTL
+
+logger = structlog.get_logger(__name__)
+
+# extend / delete the lock only while it still holds our id, so a
+# leader that stalled past the TTL cannot cut short its successor's term
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+Callback = Callable[[], Union[None, Awaitable[None]]]
+
+
+class LeaderElection:
+    """
+    One leader among the app's instances, via a Redis lock: SET NX PX with
+    this instance's id, renewed every TTL/3. A leader that dies stops
+    renewing and another instance takes over once the lock expires; one that
+    cannot reach Redis steps down when its own lease runs out, before anyone
+    else can acquire it. Each round is bounded to TTL/6; a leader whose
+    renewal times out cannot tell whether it went through and steps down at
+    once, then takes the lock back on a later round if it still holds its id.
+    Without REDIS_URL there is nothing to coordinate with and the instance
+    leads on its own.
+
+    on_elected callbacks run each time this instance becomes leader,
+    on_demoted ones when it stops (including at shutdown).
+    """
+
+    def __init__(self, key: str = LEADER_KEY, ttl: int = LEADER_TTL):
+        self.key = key
+        self.ttl = ttl
+        self.round_timeout = ttl / 6
+        self.instance_id = uuid.uuid4().hex
+        self.is_leader = False
+        self.elections = 0
+        self._lease_until = 0.0
+        self._redis = None
+        self._task = None
+        self._on_elected: List[Callback] = []
+        self._on_demoted: List[Callback] = []
+
+    def on_elected(self, callback: Callback):
+        self._on_elected.append(callback)
+        return callback
+
+    def on_demoted(self, callback: Callback):
+        self._on_demoted.append(callback)
+        return callback
+
+    async def start(self):
+        if self._task:
+            return
+        self._redis = aioredis.from_url(
+            REDIS_URL, decode_responses=True,
+            socket_timeout=self.round_timeout, socket_connect_timeout=self.round_timeout
+        ) if REDIS_URL else None
+        if self._redis is None:
+            logger.warning("REDIS_URL not set, this instance leads without election")
+            await self._become_leader()
+            return
+        await self._campaign()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Give up leadership at once, so a successor does not wait for the TTL"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        was_leader = self.is_leader
+        await self._step_down("shutdown")
+        if self._redis:
+            try:
+                if was_leader:
+                    await asyncio.wait_for(
+                        self._redis.eval(RELEASE_SCRIPT, 1, self.key, self.instance_id), self.round_timeout
+                    )
+                await self._redis.aclose()
+            except Exception as e:
+                logger.warning("Releasing leader lock failed", error=str(e))
+            self._redis = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            await self._campaign()
+
+    async def _campaign(self):
+        """Acquire the lock when free, renew it when ours"""
+        sent = time.monotonic()
+        try:
+            held = await asyncio.wait_for(self._claim(), self.round_timeout)
+        except (asyncio.TimeoutError, RedisTimeoutError):
+            await self._step_down("round timed out")
+            logger.warning("Leader election round timed out", timeout=self.round_timeout)
+            return
+        except Exception as e:
+            # the next round would come after the lease ends: stop now, while it still holds
+            if self.is_leader and time.monotonic() + self.ttl / 3 + self.round_timeout >= self._lease_until:
+                await self._step_down("lease expiring")
+            logger.warning("Leader election round failed", error=str(e), leader=self.is_leader)
+            return
+        if held:
+            self._lease_until = sent + self.ttl
+            if not self.is_leader:
+                await self._become_leader()
+        elif self.is_leader:
+            await self._step_down("lock lost")
+
+    async def _claim(self) -> bool:
+        px = self.ttl * 1000
+        if self.is_leader:
+            return bool(await self._redis.eval(RENEW_SCRIPT, 1, self.key, self.instance_id, px))
+        if await self._redis.set(self.key, self.instance_id, nx=True, px=px):
+            return True
+        # still ours if we stepped down on a round whose renewal did land
+        return bool(await self._redis.eval(RENEW_SCRIPT, 1, self.key, self.instance_id, px))
+
+    async def _become_leader(self):
+        self.is_leader = True
+        self.elections += 1
+        logger.info("Elected leader", instance_id=self.instance_id, key=self.key)
+        await self._notify(self._on_elected)
+
+    async def _step_down(self, reason: str):
+        if not self.is_leader:
+            return
+        self.is_leader = False
+        logger.info("No longer leader", instance_id=self.instance_id, reason=reason)
+        await self._notify(self._on_demoted)
+
+    async def _notify(self, callbacks: List[Callback]):
+        for callback in callbacks:
+            try:
+                result = callback()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.error("Leader callback failed", callback=getattr(callback, "__name__", repr(callback)),
+                             error=str(e), exc_info=True)
+
+    def stats(self) -> dict:
+        return {
+            "instance_id": self.instance_id,
+            "is_leader": self.is_leader,
+            "elections": self.elections,
+            "coordinated": self._redis is not None,
+        }
+
+
+leader = LeaderElection()
@@ -0,0 +1,63 @@
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import Session
+
+from CCOIN.models.token_ledger import TokenLedger
+from CCOIN.models.user import User
+from CCOIN.utils import user_state
+
+# users.tokens holds the compacted balance; deltas not yet folded in by
+# CCOIN.tasks.ledger_compaction are added on read
+
+
+def append(db: Session, user_id: int, delta: int, reason: str, ref: Optional[str] = None, compacted: bool = False):
+    """Record a balance change; it becomes part of users.tokens at the next compaction"""
+    db.add(TokenLedger(user_id=user_id, delta=delta, reason=reason, ref=ref, compacted=compacted))
+
+
+def append_many(db: Session, entries: Iterable[dict]):
+    """Multi-row append of {user_id, delta, reason, ref[, compacted]} dicts"""
+    now = datetime.now(timezone.utc)
+    rows = [{"ref": None, "compacted": False, "created_at": now, **entry} for entry in entries]
+    if rows:
+        db.execute(insert(TokenLedger), rows)
+        user_state.touch(db, *(row["user_id"] for row in rows))
+
+
+def _pending_sum(user_id_column):
+    return (
+        select(func.coalesce(func.sum(TokenLedger.delta), 0))
+        .where(TokenLedger.user_id == user_id_column, TokenLedger.compacted.is_(False))
+        .scalar_subquery()
+    )
+
+
+def get_balance(db: Session, user_id: int) -> int:
+    """Compacted balance plus pending deltas, read in one statement"""
+    return db.execute(
+        select(func.coalesce(User.tokens, 0) + _pending_sum(User.id)).where(User.id == user_id)
+    ).scalar() or 0
+
+
+def get_balances(db: Session, user_ids: List[int]) -> Dict[int, int]:
+    if not user_ids:
+        return {}
+    rows = db.execute(
+        select(User.id, func.coalesce(User.tokens, 0) + _pending_sum(User.id)).where(User.id.in_(user_ids))
+    ).all()
+    return {user_id: balance for user_id, balance in rows}
+
+
+def penalty_delta(balance: int, amount: int) -> int:
+    """Negative delta for a penalty that never takes a balance below zero"""
+    return -min(amount, max(balance, 0))
+
+
+def get_history(db: Session, user_id: int, before_id: Optional[int] = None, limit: int = 50) -> List[TokenLedger]:
+    """Newest-first keyset page of a user's ledger"""
+    query = select(TokenLedger).where(TokenLedger.user_id == user_id)
+    if before_id:
+        query = query.where(TokenLedger.id < before_id)
+    return db.execute(query.order_by(TokenLedger.id.desc()).limit(limit)).scalars().all()
@@ -0,0 +1,27 @@
+import structlog
+
+from CCOIN.utils import query_stats, tracing
+
+
+def configure_logging():
+    """
+    The app's one structlog configuration. The CCOIN package applies it on
+    import, ahead of every module that logs: loggers cache the configuration
+    they first log under, so one configured later would never reach them and
+    their lines would lack db_queries / trace_id.
+    """
+    structlog.configure(
+        processors=[
+            structlog.processors.TimeStamper(fmt="iso"),
+            structlog.stdlib.add_log_level,
+            structlog.processors.StackInfoRenderer(),
+            structlog.processors.format_exc_info,
+            query_stats.add_to_log,
+            tracing.add_to_log,
+            structlog.processors.JSONRenderer(),
+        ],
+        context_class=dict,
+        logger_factory=structlog.stdlib.LoggerFactory(),
+        wrapper_class=structlog.stdlib.BoundLogger,
+        cache_logger_on_first_use=True,
+    )
@@ -0,0 +1,236 @@
+import asyncio
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable, Optional, Tuple
+from urllib.parse import urlsplit
+
+import structlog
+
+from CCOIN.utils import tracing
+
+logger = structlog.get_logger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# seconds; request latencies run from sub-millisecond cache hits to multi-second RPC scans
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """Every metric of the process, rendered in the Prometheus text format on scrape"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                logger.error("Metric collection failed", metric=metric.name, error=str(e))
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for suffix, names, values, value in samples:
+                lines.append(f"{metric.name}{suffix}{_format_labels(names, values)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+class Metric:
+    """
+    Base for the hot-path metrics: a dict from label values to the current
+    value. Updates also come from worker threads (sync RPC calls, queries run
+    via to_thread), so each metric has a lock, and a scrape renders a copy
+    taken under it.
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), registry: Registry = registry):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    def samples(self):
+        for labels, value in self._snapshot().items():
+            yield "", self.labelnames, labels, value
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) - amount
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(Metric):
+    """Observations are counted in their own bucket and made cumulative only on scrape"""
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+                 registry: Registry = registry):
+        super().__init__(name, help, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        bucket = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][bucket] += 1
+            state[1] += value
+
+    def _snapshot(self) -> dict:
+        with self._lock:
+            return {labels: (list(counts), total) for labels, (counts, total) in self._values.items()}
+
+    def samples(self):
+        names = self.labelnames + ("le",)
+        for labels, (counts, total) in self._snapshot().items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield "_bucket", names, labels + (_format_value(bound),), cumulative
+            yield "_sum", self.labelnames, labels, round(total, 6)
+            yield "_count", self.labelnames, labels, cumulative
+
+
+class Collected(Metric):
+    """
+    A value read at scrape time from state that already exists (pool
+    status, queue depths, stats dicts), so the hot path pays nothing.
+    `collect` returns a number, or a dict of label-value tuples to numbers.
+    """
+
+    def __init__(self, name: str, help: str, collect: Callable[[], object], labelnames: Iterable[str] = (),
+                 type: str = "gauge", registry: Registry = registry):
+        self.collect = collect
+        self.type = type
+        super().__init__(name, help, labelnames, registry)
+
+    def samples(self):
+        values = self.collect()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in values.items():
+            if value is not None:
+                yield "", self.labelnames, labels if isinstance(labels, tuple) else (labels,), value
+
+
+HTTP_REQUESTS = Counter("ccoin_http_requests_total", "HTTP requests by route template and status", ("method", "route", "status"))
+HTTP_DURATION = Histogram("ccoin_http_request_duration_seconds", "HTTP request latency until the last body byte", ("method", "route"))
+HTTP_IN_PROGRESS = Gauge("ccoin_http_requests_in_progress", "HTTP requests being served", ("method",))
+
+# statements per request; anything past the last bucket is worth a look
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 20, 30, 50, 100)
+DB_QUERIES = Histogram("ccoin_db_queries_per_request", "SQL statements run by one HTTP request", ("method", "route"), QUERY_COUNT_BUCKETS)
+DB_TIME = Histogram("ccoin_db_time_per_request_seconds", "Time one HTTP request spent waiting on SQL", ("method", "route"))
+DB_REPEATED_STATEMENTS = Counter("ccoin_db_repeated_statement_requests_total", "Requests that ran one SQL statement repeatedly (N+1)", ("method", "route"))
+
+RPC_REQUESTS = Counter("ccoin_rpc_requests_total", "Solana RPC calls", ("endpoint", "method", "outcome"))
+RPC_DURATION = Histogram("ccoin_rpc_request_duration_seconds", "Solana RPC call latency", ("endpoint", "method"))
+
+TELEGRAM_REQUESTS = Counter("ccoin_telegram_api_requests_total", "Telegram Bot API calls", ("method", "outcome"))
+TELEGRAM_DURATION = Histogram("ccoin_telegram_api_request_duration_seconds", "Telegram Bot API call latency", ("method",))
+
+JOB_DURATION_BUCKETS = (0.001, 0.01, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0)
+JOB_RUNS = Counter("ccoin_job_runs_total", "Maintenance job runs by outcome (ok, error, cancelled, skipped while still running)", ("job", "outcome"))
+JOB_DURATION = Histogram("ccoin_job_duration_seconds", "Maintenance job run time", ("job",), JOB_DURATION_BUCKETS)
+
+
+def endpoint_label(url: str) -> str:
+    """Host of an RPC URL; the query string can carry an API key"""
+    return urlsplit(url).hostname or "unknown"
+
+
+def _outcome(error: BaseException) -> str:
+    if isinstance(error, asyncio.CancelledError):
+        return "cancelled"
+    return "timeout" if isinstance(error, TimeoutError) or "timeout" in type(error).__name__.lower() else "error"
+
+
+@contextmanager
+def track_rpc(endpoint: str, method: str):
+    """Wrap one Solana RPC call: with track_rpc(SOLANA_RPC, "getTransaction"): ..."""
+    endpoint = endpoint_label(endpoint)
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        with tracing.span(f"rpc {method}", "client", **{"rpc.endpoint": endpoint}):
+            yield
+    except BaseException as e:
+        outcome = _outcome(e)
+        raise
+    finally:
+        RPC_DURATION.observe(time.perf_counter() - started, endpoint, method)
+        RPC_REQUESTS.inc(endpoint, method, outcome)
+
+
+def observe_telegram(method: str, seconds: float, status: Optional[int] = None, error: Optional[BaseException] = None):
+    """Record one Bot API call from its HTTP status, or the exception that prevented one"""
+    if error is not None:
+        outcome = _outcome(error)
+    elif status == 429:
+        outcome = "rate_limited"
+    elif status is not None and status < 300:
+        outcome = "ok"
+    else:
+        outcome = "error"
+    TELEGRAM_DURATION.observe(seconds, method)
+    TELEGRAM_REQUESTS.inc(method, outcome)
+    tracing.record_span(f"telegram {method}", "client", seconds, error, **{"telegram.outcome": outcome})
+
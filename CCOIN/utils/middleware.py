@@ -0,0 +1,321 @@
+import time
+import zlib
+from collections import OrderedDict
+
+import structlog
+from starlette.datastructures import Headers, MutableHeaders
+
+from CCOIN.utils import query_stats
+from CCOIN.utils.metrics import HTTP_DURATION, HTTP_IN_PROGRESS, HTTP_REQUESTS
+from CCOIN.utils.static_files import accepted_encodings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = structlog.get_logger(__name__)
+
+SECURITY_HEADERS = {
+    "X-Content-Type-Options": "nosniff",
+    "X-Frame-Options": "SAMEORIGIN",
+    "X-XSS-Protection": "1; mode=block",
+    "Referrer-Policy": "strict-origin-when-cross-origin",
+    "Content-Security-Policy": (
+        "default-src 'self'; "
+        "script-src 'self' 'unsafe-inline' 'unsafe-eval' https://telegram.org https://unpkg.com https://cdnjs.cloudflare.com https://cdn.jsdelivr.net; "
+        "style-src 'self' 'unsafe-inline' https://cdnjs.cloudflare.com https://fonts.googleapis.com https://unpkg.com; "
+        "font-src 'self' data: https://cdnjs.cloudflare.com https://fonts.gstatic.com https://unpkg.com; "
+        "img-src 'self' data: https: blob:; "
+        "connect-src 'self' https://api.telegram.org https:; "
+        "frame-src 'self' https://telegram.org;"
+    ),
+}
+
+# static assets are loaded cross-origin by the Telegram web app
+STATIC_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET, OPTIONS",
+    "Access-Control-Allow-Headers": "*",
+}
+
+
+def route_path(scope) -> str:
+    """Route template for labels; raw paths would give every 404 probe its own series"""
+    # the router stores the matched route in the shared scope before the endpoint runs
+    route = scope.get("route")
+    if route is not None:
+        return getattr(route, "path", "unknown")
+    return "/static" if scope["path"].startswith("/static/") else "unmatched"
+
+
+def _encode(headers: dict) -> tuple:
+    raw = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers.items()]
+    return frozenset(name for name, _ in raw), raw
+
+
+class ResponseHeadersMiddleware:
+    """
+    Pure ASGI middleware for the per-response bookkeeping: security
+    headers, CORS for static files, X-Process-Time, slow-request logging,
+    the per-route request metrics and the request's SQL statement count. Headers are encoded once and spliced into
+    `http.response.start`, so the body streams through untouched.
+    """
+
+    def __init__(self, app, static_prefixes=("/static/",), static_paths=("/metadata.html",), slow_request_threshold: float = 1.0):
+        self.app = app
+        self.static_prefixes = tuple(static_prefixes)
+        self.static_paths = frozenset(static_paths)
+        self.slow_request_threshold = slow_request_threshold
+        self._default = _encode(SECURITY_HEADERS)
+        self._static = _encode({**SECURITY_HEADERS, **STATIC_HEADERS})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        path = scope["path"]
+        method = scope["method"]
+        names, extra = self._static if path.startswith(self.static_prefixes) or path in self.static_paths else self._default
+        status = 500
+
+        async def send_with_headers(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                process_time = time.perf_counter() - started
+                message["headers"] = [
+                    (name, value) for name, value in message.get("headers", ()) if name not in names
+                ] + extra + [(b"x-process-time", str(process_time).encode("latin-1"))]
+                if process_time > self.slow_request_threshold:
+                    logger.warning(
+                        "Slow request detected",
+                        path=path,
+                        method=method,
+                        process_time=process_time
+                    )
+            await send(message)
+
+        HTTP_IN_PROGRESS.inc(method)
+        stats, token = query_stats.begin()
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            HTTP_IN_PROGRESS.dec(method)
+            route = route_path(scope)
+            query_stats.end(token, stats, method, route)
+            HTTP_DURATION.observe(time.perf_counter() - started, method, route)
+            HTTP_REQUESTS.inc(method, route, status)
+
+
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/x-javascript",
+    "application/xml",
+    "application/manifest+json",
+    "image/svg+xml",
+)
+
+
+def is_compressible(content_type: str) -> bool:
+    return content_type.split(";", 1)[0].strip().lower().startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionState:
+    """LRU of compressed immutable bodies plus per-route counters, shared by every CompressionMiddleware"""
+
+    def __init__(self, cache_bytes: int = 16 * 1024 * 1024):
+        self.cache_bytes = cache_bytes
+        self._cache = OrderedDict()
+        self._cache_size = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.routes = {}
+
+    def cached(self, key):
+        body = self._cache.get(key)
+        if body is not None:
+            self._cache.move_to_end(key)
+            self.cache_hits += 1
+        else:
+            self.cache_misses += 1
+        return body
+
+    def cache(self, key, body: bytes):
+        if len(body) > self.cache_bytes // 8 or key in self._cache:
+            return
+        self._cache[key] = body
+        self._cache_size += len(body)
+        while self._cache_size > self.cache_bytes:
+            _, evicted = self._cache.popitem(last=False)
+            self._cache_size -= len(evicted)
+
+    def record(self, route: str, compressed: bool, bytes_in: int = 0, bytes_out: int = 0, cpu: float = 0.0):
+        stats = self.routes.get(route)
+        if stats is None:
+            stats = self.routes[route] = {"compressed": 0, "skipped": 0, "bytes_in": 0, "bytes_out": 0, "cpu_seconds": 0.0}
+        if compressed:
+            stats["compressed"] += 1
+            stats["bytes_in"] += bytes_in
+            stats["bytes_out"] += bytes_out
+            stats["cpu_seconds"] += cpu
+        else:
+            stats["skipped"] += 1
+
+    def stats(self) -> dict:
+        return {
+            "brotli": brotli is not None,
+            "cache_entries": len(self._cache),
+            "cache_bytes": self._cache_size,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "routes": {
+                route: {
+                    **stats,
+                    "cpu_seconds": round(stats["cpu_seconds"], 4),
+                    "ratio": round(stats["bytes_out"] / stats["bytes_in"], 3) if stats["bytes_in"] else None,
+                }
+                for route, stats in self.routes.items()
+            },
+        }
+
+
+compression = CompressionState()
+
+
+class CompressionMiddleware:
+    """
+    Compresses text responses only, with brotli when the client accepts it
+    and the package is installed, gzip otherwise. Responses that already
+    carry Content-Encoding (the precompressed static variants), binary
+    types and bodies under `minimum_size` pass through untouched.
+    Compressed bodies of immutable responses are kept in an LRU keyed by
+    ETag, and ratio and CPU time are counted per route.
+    """
+
+    def __init__(self, app, minimum_size: int = 1000, gzip_level: int = 6, brotli_quality: int = 4, state: CompressionState = compression):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.state = state
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        if brotli is not None and "br" in accepted:
+            encoding = "br"
+        elif "gzip" in accepted:
+            encoding = "gzip"
+        else:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _CompressionResponder(self, scope, encoding, send).send)
+
+    def compressor(self, encoding: str):
+        if encoding == "br":
+            return brotli.Compressor(quality=self.brotli_quality)
+        return zlib.compressobj(self.gzip_level, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+
+    def compress(self, encoding: str, body: bytes) -> bytes:
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        compressor = self.compressor(encoding)
+        return compressor.compress(body) + compressor.flush()
+
+
+class _CompressionResponder:
+    """Per-response state: holds back http.response.start until the first body chunk decides"""
+
+    def __init__(self, middleware: CompressionMiddleware, scope, encoding: str, send):
+        self.middleware = middleware
+        self.scope = scope
+        self.encoding = encoding
+        self._send = send
+        self.start = None
+        self.mode = None  # "passthrough", "streaming"
+        self.compressor = None
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.cpu = 0.0
+
+    async def send(self, message):
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            self.start = message
+            return
+        if message_type != "http.response.body":
+            await self._send(message)
+            return
+        if self.mode == "passthrough":
+            await self._send(message)
+        elif self.mode == "streaming":
+            await self._stream(message)
+        else:
+            await self._first_body(message)
+
+    async def _first_body(self, message):
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        headers = MutableHeaders(scope=self.start)
+        if (
+            "content-encoding" in headers
+            or self.start["status"] < 200
+            or self.start["status"] in (204, 304)
+            or not is_compressible(headers.get("content-type", ""))
+            or (not more_body and len(body) < self.middleware.minimum_size)
+        ):
+            self.mode = "passthrough"
+            self.middleware.state.record(route_path(self.scope), compressed=False)
+            await self._send(self.start)
+            await self._send(message)
+            return
+
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        if not more_body:
+            key = None
+            if "immutable" in headers.get("cache-control", "") and "etag" in headers:
+                key = (headers["etag"], self.encoding)
+            compressed = self.middleware.state.cached(key) if key else None
+            if compressed is None:
+                started = time.thread_time()
+                compressed = self.middleware.compress(self.encoding, body)
+                self.cpu += time.thread_time() - started
+                if key:
+                    self.middleware.state.cache(key, compressed)
+            headers["Content-Length"] = str(len(compressed))
+            self.middleware.state.record(route_path(self.scope), True, len(body), len(compressed), self.cpu)
+            await self._send(self.start)
+            await self._send({"type": "http.response.body", "body": compressed})
+            return
+
+        self.mode = "streaming"
+        if "content-length" in headers:
+            del headers["Content-Length"]
+        self.compressor = self.middleware.compressor(self.encoding)
+        await self._send(self.start)
+        await self._stream(message)
+
+    async def _stream(self, message):
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        started = time.thread_time()
+        # flush every chunk, as gzip does with Z_SYNC_FLUSH: a streamed part must reach the client now
+        if self.encoding == "br":
+            chunk = self.compressor.process(body) + (self.compressor.flush() if more_body else self.compressor.finish())
+        else:
+            chunk = self.compressor.compress(body) + self.compressor.flush(zlib.Z_SYNC_FLUSH if more_body else zlib.Z_FINISH)
+        self.cpu += time.thread_time() - started
+        self.bytes_in += len(body)
+        self.bytes_out += len(chunk)
+        if not more_body:
+            self.middleware.state.record(route_path(self.scope), True, self.bytes_in, self.bytes_out, self.cpu)
+        await self._send({"type": "http.response.body", "body": chunk, "more_body": more_body})
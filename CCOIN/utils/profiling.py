@@ -0,0 +1,159 @@
+import asyncio
+import json
+import os
+import random
+import secrets
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+
+import structlog
+
+from CCOIN.config import (
+    PROFILE_SAMPLE_RATE, PROFILE_TOKEN, PROFILE_DIR, PROFILE_INTERVAL, PROFILE_MAX_FILES, PROFILE_PATHS
+)
+from CCOIN.utils.middleware import route_path
+
+logger = structlog.get_logger(__name__)
+
+PROFILE_HEADER = "x-profile-token"
+PROFILE_SUFFIX = ".speedscope.json"
+
+
+def profile_path(profile_id: str, directory: str = PROFILE_DIR) -> Optional[str]:
+    """File of a stored profile; None for ids that are not ours (no path tricks)"""
+    if not profile_id or not all(c.isalnum() or c == "-" for c in profile_id):
+        return None
+    path = os.path.join(directory, profile_id + PROFILE_SUFFIX)
+    return path if os.path.isfile(path) else None
+
+
+def list_profiles(directory: str = PROFILE_DIR) -> List[dict]:
+    """Newest-first summaries of the stored profiles"""
+    profiles = []
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return profiles
+    for name in names:
+        if not name.endswith(".meta.json"):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    profiles.sort(key=lambda profile: profile["created_at"], reverse=True)
+    return profiles
+
+
+class ProfilingMiddleware:
+    """
+    Opt-in statistical profiling of live requests with pyinstrument. A
+    request is profiled when it carries X-Profile-Token matching
+    PROFILE_TOKEN, or is picked at PROFILE_SAMPLE_RATE (optionally only
+    under PROFILE_PATHS). The sampler runs in async mode, so only the
+    profiled request's own coroutine is attributed, even with others
+    interleaved on the loop; work handed to the threadpool shows up as the
+    await on it. Each profile is written as speedscope JSON (flamegraph
+    data) next to a .meta.json with route and timing, keeping the newest
+    PROFILE_MAX_FILES; the id goes back in the X-Profile-Id header.
+    """
+
+    def __init__(self, app, sample_rate: float = PROFILE_SAMPLE_RATE, token: Optional[str] = PROFILE_TOKEN,
+                 directory: str = PROFILE_DIR, interval: float = PROFILE_INTERVAL, max_files: int = PROFILE_MAX_FILES,
+                 paths=PROFILE_PATHS):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.token = token
+        self.directory = directory
+        self.interval = interval
+        self.max_files = max_files
+        self.paths = tuple(paths)
+        self.enabled = False
+        if sample_rate > 0 or token:
+            # imported only when profiling is configured: it is never needed otherwise
+            try:
+                from pyinstrument import Profiler
+                from pyinstrument.renderers import SpeedscopeRenderer
+            except ImportError:
+                logger.warning("Request profiling configured but pyinstrument is not installed")
+            else:
+                self._profiler_class = Profiler
+                self._renderer_class = SpeedscopeRenderer
+                self.enabled = True
+
+    def _trigger(self, scope) -> Optional[str]:
+        if self.token:
+            for name, value in scope["headers"]:
+                if name == PROFILE_HEADER.encode():
+                    if secrets.compare_digest(value, self.token.encode()):
+                        return "header"
+                    break
+        if self.sample_rate > 0 and (not self.paths or scope["path"].startswith(self.paths)):
+            if random.random() < self.sample_rate:
+                return "sampled"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trigger = self._trigger(scope)
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f") + "-" + secrets.token_hex(4)
+        status = 500
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", ())) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        profiler = self._profiler_class(interval=self.interval, async_mode="enabled")
+        started = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profiler.stop()
+            meta = {
+                "id": profile_id,
+                "method": scope["method"],
+                "route": route_path(scope),
+                "path": scope["path"],
+                "status": status,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+                "trigger": trigger,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+            }
+            try:
+                await asyncio.to_thread(self._save, profiler, meta)
+            except Exception as e:
+                logger.error("Saving request profile failed", profile_id=profile_id, error=str(e))
+
+    def _save(self, profiler, meta: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, meta["id"])
+        session = profiler.last_session
+        meta["samples"] = session.sample_count if session else 0
+        with open(base + PROFILE_SUFFIX, "w") as f:
+            f.write(profiler.output(self._renderer_class()))
+        with open(base + ".meta.json", "w") as f:
+            json.dump(meta, f)
+        logger.info("Request profile saved", **meta)
+        self._prune()
+
+    def _prune(self):
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith(".meta.json"))
+        for name in names[:max(0, len(names) - self.max_files)]:
+            profile_id = name[:-len(".meta.json")]
+            for suffix in (".meta.json", PROFILE_SUFFIX):
+                try:
+                    os.remove(os.path.join(self.directory, profile_id + suffix))
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,126 @@
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+import structlog
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from CCOIN.config import QUERY_REPEAT_THRESHOLD, QUERY_COUNT_THRESHOLD
+from CCOIN.utils.metrics import DB_QUERIES, DB_REPEATED_STATEMENTS, DB_TIME
+
+logger = structlog.get_logger(__name__)
+
+
+class QueryStats:
+    """Statements run on behalf of one request (or one assert_max_queries block)"""
+
+    __slots__ = ("count", "seconds", "statements")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def record(self, statement: str, seconds: float):
+        self.count += 1
+        self.seconds += seconds
+        self.statements[statement] += 1
+
+    def repeated(self, threshold: int = QUERY_REPEAT_THRESHOLD) -> list:
+        """(statement, times) for identical SQL run at least `threshold` times: the N+1 shape"""
+        return [(statement, times) for statement, times in self.statements.most_common() if times >= threshold]
+
+
+# set per request by ResponseHeadersMiddleware; run_in_threadpool copies the
+# context, so sync dependencies and endpoints add to the same object
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+_watchers = []
+
+
+def current() -> Optional[QueryStats]:
+    return _current.get()
+
+
+def begin() -> tuple:
+    stats = QueryStats()
+    return stats, _current.set(stats)
+
+
+def end(token, stats: QueryStats, method: str, route: str):
+    """Close a request's scope: export its totals and warn about repeated statements"""
+    _current.reset(token)
+    DB_QUERIES.observe(stats.count, method, route)
+    DB_TIME.observe(stats.seconds, method, route)
+    repeated = stats.repeated()
+    if repeated:
+        DB_REPEATED_STATEMENTS.inc(method, route)
+        statement, times = repeated[0]
+        logger.warning(
+            "Repeated SQL statement in one request",
+            method=method,
+            route=route,
+            times=times,
+            statement=" ".join(statement.split())[:300],
+            db_queries=stats.count
+        )
+    elif stats.count >= QUERY_COUNT_THRESHOLD:
+        logger.warning("Many SQL statements in one request", method=method, route=route, db_queries=stats.count)
+
+
+def add_to_log(logger, method_name, event_dict):
+    """structlog processor: db_queries / db_time_ms so far, on every line logged inside a request"""
+    stats = _current.get()
+    if stats is not None and stats.count:
+        event_dict.setdefault("db_queries", stats.count)
+        event_dict.setdefault("db_time_ms", round(stats.seconds * 1000, 2))
+    return event_dict
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None or _watchers:
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("query_started")
+    if not started:
+        return
+    seconds = time.perf_counter() - started.pop()
+    stats = _current.get()
+    if stats is not None:
+        stats.record(statement, seconds)
+    for watcher in _watchers:
+        if watcher is not stats:
+            watcher.record(statement, seconds)
+
+
+@contextmanager
+def assert_max_queries(max_queries: int, max_repeats: Optional[int] = None):
+    """
+    Test helper: fail if the block runs more than `max_queries` statements,
+    or any identical statement more than `max_repeats` times. Counts every
+    statement on every engine while active, so it also sees requests that
+    TestClient runs in its own thread.
+
+        with assert_max_queries(6):
+            client.get("/home/?telegram_id=1")
+    """
+    stats = QueryStats()
+    _watchers.append(stats)
+    try:
+        yield stats
+    finally:
+        _watchers.remove(stats)
+    problems = []
+    if stats.count > max_queries:
+        problems.append(f"{stats.count} statements, budget is {max_queries}")
+    if max_repeats is not None:
+        problems += [f"{times}x {statement}" for statement, times in stats.repeated(max_repeats + 1)]
+    if problems:
+        listing = "\n".join(f"  {times}x {' '.join(statement.split())[:200]}" for statement, times in stats.statements.most_common())
+        raise AssertionError("; ".join(problems[:1]) + "\n" + listing)
@@ -74,6 +74,21 @@ class RedisSessionStore:
             logger.error("Failed to retrieve session", error=str(e), session_id=session_id)
             return None
     
+    async def sweep_expired(self) -> int:
+        """
+        Drop expired in-memory sessions (Redis expires its own); a maintenance
+        job, run on the loop rather than in a thread beside the request writes
+        """
+        if self.redis_client:
+            return 0
+        now = time.time()
+        expired = [session_id for session_id, ent in list(self._memory_store.items()) if now > ent["expires_at"]]
+        for session_id in expired:
+            self._memory_store.pop(session_id, None)
+        if expired:
+            logger.info("Expired sessions swept", count=len(expired))
+        return len(expired)
+
     def delete_session(self, session_id: str) -> bool:
         """Delete session data"""
         try:
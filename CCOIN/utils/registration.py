@@ -0,0 +1,276 @@
+import asyncio
+import uuid
+from typing import List, NamedTuple, Optional, Tuple
+
+import structlog
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from CCOIN.database import SessionLocal
+from CCOIN.models.user import User
+from CCOIN.utils import user_state
+from CCOIN.utils.ledger import append_many
+from CCOIN.config import REGISTRATION_BATCH_WINDOW, REGISTRATION_BATCH_SIZE
+
+logger = structlog.get_logger(__name__)
+
+WELCOME_BONUS = 2000
+REFERRAL_BONUS = 50
+
+
+def _insert(db: Session):
+    return (sqlite if db.get_bind().dialect.name == "sqlite" else postgresql).insert(User)
+
+
+def register_user(
+    db: Session,
+    telegram_id: str,
+    username: Optional[str],
+    first_name: Optional[str],
+    last_name: Optional[str],
+    referral_code: Optional[str] = None
+) -> Tuple[object, bool]:
+    """
+    Create or refresh a user from /start in one transaction.
+
+    INSERT ... ON CONFLICT (telegram_id) DO UPDATE either inserts the user or
+    refreshes their names, so concurrent /start updates for one user cannot
+    hit the unique constraint. Bonuses are ledger appends made only when the
+    row was really inserted, so a popular referrer's row is never locked.
+    Returns (row, is_new_user).
+    """
+    referrer_id = None
+    if referral_code:
+        referrer_id = db.execute(
+            select(User.id).where(User.referral_code == referral_code)
+        ).scalar_one_or_none()
+        if referrer_id is None:
+            logger.warning("Invalid referral code", referral_code=referral_code, telegram_id=telegram_id)
+
+    for attempt in range(3):
+        new_code = str(uuid.uuid4())[:8]
+        stmt = _insert(db).values(
+            telegram_id=telegram_id,
+            username=username,
+            first_name=first_name,
+            last_name=last_name,
+            referral_code=new_code,
+            referred_by=referrer_id,
+            tokens=WELCOME_BONUS,
+            first_login=True,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[User.telegram_id],
+            set_={
+                "username": stmt.excluded.username,
+                "first_name": stmt.excluded.first_name,
+                "last_name": stmt.excluded.last_name,
+            }
+        ).returning(User.id, User.tokens, User.first_login, User.referred_by, User.referral_code)
+        try:
+            row = db.execute(stmt).one()
+            break
+        except IntegrityError:
+            # the generated referral_code collided with another user's; the telegram_id conflict is handled above
+            db.rollback()
+            if attempt == 2:
+                raise
+
+    # an existing row keeps its own referral_code, so ours only comes back on insert
+    is_new_user = row.referral_code == new_code
+
+    if is_new_user:
+        append_many(db, _bonus_entries([row]))
+    # names were refreshed, and they show on the referrer's friends page
+    user_state.touch(db, row.id, row.referred_by)
+
+    db.commit()
+
+    if is_new_user:
+        logger.info("New user registered", telegram_id=telegram_id, referred_by=row.referred_by)
+    elif referral_code:
+        logger.info("Ignoring referral code for existing user", telegram_id=telegram_id, referral_code=referral_code)
+    return row, is_new_user
+
+
+class Registration(NamedTuple):
+    telegram_id: str
+    username: Optional[str]
+    first_name: Optional[str]
+    last_name: Optional[str]
+    referral_code: Optional[str] = None
+
+
+def _bonus_entries(rows) -> list:
+    """
+    Ledger rows for newly created users: the welcome bonus is already in the
+    inserted users.tokens, so it is recorded as compacted; the referrer's
+    bonus waits for compaction like any other credit.
+    """
+    entries = []
+    for row in rows:
+        entries.append({"user_id": row.id, "delta": WELCOME_BONUS, "reason": "welcome_bonus", "compacted": True})
+        if row.referred_by is not None:
+            entries.append({"user_id": row.referred_by, "delta": REFERRAL_BONUS, "reason": "referral_bonus", "ref": str(row.id)})
+    return entries
+
+
+def register_batch(registrations: List[Registration]) -> List[Tuple[object, bool]]:
+    """
+    register_user for many /start updates in one transaction: a single
+    multi-row upsert and a single multi-row ledger append.
+    Results line up with `registrations`; when one telegram_id appears
+    several times only its first occurrence reports a new user.
+    """
+    latest = {reg.telegram_id: reg for reg in registrations}
+    referral_codes = {reg.referral_code for reg in registrations if reg.referral_code}
+
+    with SessionLocal() as db:
+        referrers = dict(db.execute(
+            select(User.referral_code, User.id).where(User.referral_code.in_(referral_codes))
+        ).all()) if referral_codes else {}
+
+        first_code = {}
+        for reg in registrations:
+            if reg.referral_code and reg.telegram_id not in first_code:
+                first_code[reg.telegram_id] = reg.referral_code
+
+        for attempt in range(3):
+            new_codes = {telegram_id: str(uuid.uuid4())[:8] for telegram_id in latest}
+            # Postgres rejects an upsert touching one row twice, hence one row per telegram_id;
+            # and locks rows in VALUES order, so concurrent batches sorted alike cannot deadlock
+            stmt = _insert(db).values([
+                {
+                    "telegram_id": reg.telegram_id,
+                    "username": reg.username,
+                    "first_name": reg.first_name,
+                    "last_name": reg.last_name,
+                    "referral_code": new_codes[reg.telegram_id],
+                    "referred_by": referrers.get(first_code.get(reg.telegram_id)),
+                    "tokens": WELCOME_BONUS,
+                    "first_login": True,
+                }
+                for _, reg in sorted(latest.items())
+            ])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[User.telegram_id],
+                set_={
+                    "username": stmt.excluded.username,
+                    "first_name": stmt.excluded.first_name,
+                    "last_name": stmt.excluded.last_name,
+                }
+            ).returning(User.id, User.telegram_id, User.tokens, User.first_login, User.referred_by, User.referral_code)
+            try:
+                rows = {row.telegram_id: row for row in db.execute(stmt).all()}
+                break
+            except IntegrityError:
+                db.rollback()
+                if attempt == 2:
+                    raise
+
+        created = {telegram_id for telegram_id, row in rows.items() if row.referral_code == new_codes[telegram_id]}
+        append_many(db, _bonus_entries(rows[telegram_id] for telegram_id in created))
+        user_state.touch(db, *(row.id for row in rows.values()), *(row.referred_by for row in rows.values()))
+
+        db.commit()
+
+    results = []
+    for reg in registrations:
+        is_new_user = reg.telegram_id in created
+        created.discard(reg.telegram_id)
+        results.append((rows[reg.telegram_id], is_new_user))
+    return results
+
+
+class RegistrationWriter:
+    """
+    Group commit for /start: registrations arriving within `window` seconds
+    are written by one register_batch call, and each caller resumes only
+    after that transaction has committed.
+    """
+
+    def __init__(self, window: float = REGISTRATION_BATCH_WINDOW, max_batch: int = REGISTRATION_BATCH_SIZE):
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = []
+        self._wakeup = None
+        self._task = None
+        self._in_flight = 0
+        self.stats = {"batches": 0, "registrations": 0, "largest_batch": 0, "failed_batches": 0}
+
+    async def register(
+        self,
+        telegram_id: str,
+        username: Optional[str],
+        first_name: Optional[str],
+        last_name: Optional[str],
+        referral_code: Optional[str] = None
+    ) -> Tuple[object, bool]:
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((Registration(telegram_id, username, first_name, last_name, referral_code), future))
+        self._wakeup.set()
+        return await future
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            if len(self._pending) < self.max_batch:
+                await asyncio.sleep(self.window)
+            batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            if not self._pending:
+                self._wakeup.clear()
+            await self._write(batch)
+
+    async def _write(self, batch: list):
+        self._in_flight = len(batch)
+        try:
+            results = await asyncio.to_thread(register_batch, [reg for reg, _ in batch])
+        except Exception as e:
+            self.stats["failed_batches"] += 1
+            logger.warning("Registration batch failed, writing one by one", size=len(batch), error=str(e))
+            results = [await self._write_one(reg, future) for reg, future in batch]
+        finally:
+            self._in_flight = 0
+
+        self.stats["batches"] += 1
+        self.stats["registrations"] += len(batch)
+        self.stats["largest_batch"] = max(self.stats["largest_batch"], len(batch))
+        for (_, future), result in zip(batch, results):
+            if result is not None and not future.done():
+                future.set_result(result)
+
+    async def _write_one(self, reg: Registration, future: asyncio.Future):
+        try:
+            return await asyncio.to_thread(_register_one, reg)
+        except Exception as e:
+            logger.error("Registration failed", telegram_id=reg.telegram_id, error=str(e), exc_info=True)
+            if not future.done():
+                future.set_exception(e)
+            return None
+
+    async def stop(self):
+        """Let pending registrations commit, then stop the flush task"""
+        if self._task is None:
+            return
+        while self._pending or self._in_flight:
+            await asyncio.sleep(self.window)
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending) + self._in_flight
+
+
+def _register_one(reg: Registration) -> Tuple[object, bool]:
+    with SessionLocal() as db:
+        return register_user(db, *reg)
+
+
+registration_writer = RegistrationWriter()
@@ -0,0 +1,125 @@
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+import structlog
+from fastapi import Request
+from fastapi.responses import HTMLResponse, Response
+
+from CCOIN.config import RENDER_CACHE_ENABLED, RENDER_CACHE_MAX_BYTES
+from CCOIN.utils import user_state
+from CCOIN.utils.static_files import manifest
+from CCOIN.utils.templates import TEMPLATES_DIR, templates
+
+logger = structlog.get_logger(__name__)
+
+# the WebView may keep the page but has to ask every time
+CACHE_CONTROL = "private, no-cache"
+
+
+def deploy_fingerprint() -> str:
+    """Changes whenever a template or a hashed asset does, so a deploy never matches an old ETag"""
+    digest = hashlib.sha256()
+    for name in sorted(templates.env.list_templates(extensions=["html"])):
+        with open(os.path.join(TEMPLATES_DIR, name), "rb") as f:
+            digest.update(name.encode() + b"\0" + f.read())
+    for path in sorted(manifest):
+        digest.update(f"{path}={manifest[path]}".encode())
+    return digest.hexdigest()[:16]
+
+
+class RenderCache:
+    """
+    Rendered per-user pages, keyed by (template, user, state version, extra).
+    A key is never served once the user's version moves on, so entries are
+    only evicted for space; the versions themselves live in user_state and
+    are shared by every worker, which makes the ETag valid on all of them.
+    """
+
+    def __init__(self, max_bytes: int = RENDER_CACHE_MAX_BYTES, enabled: bool = RENDER_CACHE_ENABLED):
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.fingerprint = deploy_fingerprint() if enabled else ""
+        self._pages = OrderedDict()
+        self._size = 0
+        self.counters = {}
+
+    def _count(self, name: str, outcome: str):
+        counters = self.counters.get(name)
+        if counters is None:
+            counters = self.counters[name] = {"not_modified": 0, "hits": 0, "renders": 0, "uncached": 0}
+        counters[outcome] += 1
+
+    def etag(self, key: Tuple) -> str:
+        raw = "\0".join(str(part) for part in (self.fingerprint, *key))
+        return '"' + hashlib.sha256(raw.encode()).hexdigest()[:32] + '"'
+
+    @staticmethod
+    def not_modified(request: Request, etag: str) -> bool:
+        """Whether If-None-Match names `etag` (weak or strong) or is `*`"""
+        header = request.headers.get("if-none-match")
+        if not header:
+            return False
+        for token in header.split(","):
+            token = token.strip()
+            if token == "*":
+                return True
+            if token.startswith("W/"):
+                token = token[2:].strip()
+            if token == etag:
+                return True
+        return False
+
+    def get(self, key: Tuple) -> Optional[bytes]:
+        body = self._pages.get(key)
+        if body is not None:
+            self._pages.move_to_end(key)
+        return body
+
+    def put(self, key: Tuple, body: bytes):
+        if len(body) > self.max_bytes // 8 or key in self._pages:
+            return
+        self._pages[key] = body
+        self._size += len(body)
+        while self._size > self.max_bytes:
+            _, evicted = self._pages.popitem(last=False)
+            self._size -= len(evicted)
+
+    async def render(self, request: Request, name: str, user_id: int, context: Callable[[], dict], extra: Tuple = ()) -> Response:
+        """
+        Page `name` for one user. `context` is only called when the page has
+        to be rendered; `extra` holds whatever else the page shows that is not
+        part of the user's state (e.g. session values).
+        """
+        version = await user_state.get_version(user_id) if self.enabled else None
+        if version is None:
+            self._count(name, "uncached")
+            return templates.TemplateResponse(name, {"request": request, **context()})
+
+        key = (name, user_id, version, *extra)
+        headers = {"ETag": self.etag(key), "Cache-Control": CACHE_CONTROL}
+        if self.not_modified(request, headers["ETag"]):
+            self._count(name, "not_modified")
+            return Response(status_code=304, headers=headers)
+
+        body = self.get(key)
+        if body is not None:
+            self._count(name, "hits")
+            return HTMLResponse(body, headers=headers)
+
+        self._count(name, "renders")
+        body = templates.get_template(name).render({"request": request, **context()}).encode()
+        self.put(key, body)
+        return HTMLResponse(body, headers=headers)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._pages),
+            "bytes": self._size,
+            "pages": self.counters,
+        }
+
+
+render_cache = RenderCache()
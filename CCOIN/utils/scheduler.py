@@ -0,0 +1,172 @@
+import asyncio
+import inspect
+import random
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional
+
+import structlog
+
+from CCOIN.config import JOB_JITTER, JOB_TIMEOUT
+from CCOIN.utils.metrics import JOB_DURATION, JOB_RUNS
+
+logger = structlog.get_logger(__name__)
+
+
+class Job:
+    """A registered maintenance job and the state of its runs"""
+
+    def __init__(self, name: str, func: Callable, interval: Optional[float], jitter: float, timeout: float,
+                 leader_only: bool, run_at_start: bool):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.timeout = timeout
+        self.leader_only = leader_only
+        self.run_at_start = run_at_start
+        self.running: Optional[asyncio.Future] = None
+        self.wake = None
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.last_started = None
+        self.last_duration = None
+        self.last_error = None
+
+    def next_delay(self) -> Optional[float]:
+        if self.interval is None:
+            return None  # runs only when woken
+        return max(0.0, self.interval * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    def stats(self) -> dict:
+        return {
+            "interval": self.interval,
+            "leader_only": self.leader_only,
+            "running": self.running is not None,
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "last_started": self.last_started,
+            "last_duration_seconds": round(self.last_duration, 3) if self.last_duration is not None else None,
+            "last_error": self.last_error,
+        }
+
+
+class MaintenanceScheduler:
+    """
+    Interval jobs on the event loop. Each job has its own loop that sleeps
+    its interval (spread by `jitter`, a fraction of it, so instances and
+    jobs do not fire in step), then runs it: coroutine functions on the
+    loop, plain functions in a worker thread. A run still going when the
+    next one is due (past `timeout` it is logged as stuck; threads cannot
+    be cancelled) makes that one be skipped, so a job never overlaps itself.
+
+    `leader_only` jobs touch shared state (the database) and run only while
+    this instance is the elected leader; the rest clean up this process's
+    own memory and run everywhere. A job with no `interval` runs only at
+    start (and, if leader-only, each time this instance is elected), which
+    needs `run_at_start`.
+    """
+
+    def __init__(self):
+        self.jobs: Dict[str, Job] = {}
+        self.is_leader = False
+        self._tasks = []
+
+    def register(self, name: str, func: Callable, interval: Optional[float], jitter: float = JOB_JITTER,
+                 timeout: float = JOB_TIMEOUT, leader_only: bool = False, run_at_start: bool = False) -> Job:
+        if name in self.jobs:
+            raise ValueError(f"Job {name!r} is already registered")
+        if interval is None and not run_at_start:
+            raise ValueError(f"Job {name!r} has no interval and would never run")
+        job = self.jobs[name] = Job(name, func, interval, jitter, timeout, leader_only, run_at_start)
+        if self._tasks:
+            self._tasks.append(asyncio.create_task(self._loop(job)))
+        return job
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._loop(job)) for job in self.jobs.values()]
+        logger.info("Maintenance scheduler started", jobs=sorted(self.jobs))
+
+    async def stop(self, timeout: float = 10.0):
+        """Stop scheduling; give runs in progress `timeout` to finish"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        running = [job.running for job in self.jobs.values() if job.running is not None]
+        if running:
+            _, pending = await asyncio.wait(running, timeout=timeout)
+            for future in pending:
+                future.cancel()  # a thread keeps going; the process is exiting anyway
+        logger.info("Maintenance scheduler stopped")
+
+    def set_leader(self, is_leader: bool):
+        """Leader-only jobs run from now on (run_at_start ones right away), or stop being started"""
+        self.is_leader = is_leader
+        if is_leader:
+            for job in self.jobs.values():
+                if job.leader_only and job.run_at_start and job.wake is not None:
+                    job.wake.set()
+
+    async def _loop(self, job: Job):
+        job.wake = asyncio.Event()
+        if job.run_at_start:
+            job.wake.set()
+        while True:
+            try:
+                await asyncio.wait_for(job.wake.wait(), job.next_delay())
+            except asyncio.TimeoutError:
+                pass
+            job.wake.clear()
+            if job.leader_only and not self.is_leader:
+                continue
+            await self._run(job)
+
+    async def _run(self, job: Job):
+        if job.running is not None:
+            job.skipped += 1
+            JOB_RUNS.inc(job.name, "skipped")
+            logger.warning("Job still running, skipping this run", job=job.name, started=job.last_started)
+            return
+        if inspect.iscoroutinefunction(job.func):
+            running = asyncio.ensure_future(job.func())
+        else:
+            running = asyncio.ensure_future(asyncio.to_thread(job.func))
+        job.running = running
+        job.last_started = datetime.now(timezone.utc).isoformat()
+        started = time.perf_counter()
+        running.add_done_callback(lambda future: self._finished(job, future, time.perf_counter() - started))
+        done, _ = await asyncio.wait({running}, timeout=job.timeout)
+        if not done:
+            logger.warning("Job is taking longer than its timeout", job=job.name, timeout=job.timeout)
+
+    def _finished(self, job: Job, future: asyncio.Future, seconds: float):
+        job.running = None
+        job.last_duration = seconds
+        JOB_DURATION.observe(seconds, job.name)
+        if future.cancelled():
+            JOB_RUNS.inc(job.name, "cancelled")
+            return
+        error = future.exception()
+        job.runs += 1
+        if error is not None:
+            job.failures += 1
+            job.last_error = f"{type(error).__name__}: {error}"[:300]
+            JOB_RUNS.inc(job.name, "error")
+            logger.error("Job failed", job=job.name, seconds=round(seconds, 3), error=str(error),
+                         exc_info=(type(error), error, error.__traceback__))
+        else:
+            job.last_error = None
+            JOB_RUNS.inc(job.name, "ok")
+            logger.debug("Job finished", job=job.name, seconds=round(seconds, 3))
+
+    def stats(self) -> dict:
+        return {"running": bool(self._tasks), "leader": self.is_leader,
+                "jobs": {name: job.stats() for name, job in self.jobs.items()}}
+
+
+maintenance = MaintenanceScheduler()
@@ -1,8 +1,6 @@
 import asyncio
 import structlog
 from typing import Optional, List, Any
-from solana.rpc.async_api import AsyncClient
-from solana.rpc.commitment import Confirmed, Finalized
 from CCOIN.config import (
     SOLANA_RPC, 
     SOLANA_RPC_FALLBACK_1, 
@@ -11,6 +9,7 @@ from CCOIN.config import (
     RPC_RETRY_DELAY,
     RPC_TIMEOUT
 )
+from CCOIN.utils.metrics import track_rpc
 
 logger = structlog.get_logger(__name__)
 
@@ -26,8 +25,10 @@ class SolanaRPCClient:
         self.endpoints = [ep for ep in self.endpoints if ep and ep.strip()]
         self.current_endpoint_index = 0
         
-    async def _execute_with_retry(self, func, *args, **kwargs):
+    async def _execute_with_retry(self, method: str, func, *args, **kwargs):
         """Execute RPC call with retry logic across multiple endpoints"""
+        from solana.rpc.async_api import AsyncClient
+
         last_error = None
         
         for attempt in range(RPC_MAX_RETRIES):
@@ -41,7 +42,8 @@ class SolanaRPCClient:
                         function=func.__name__
                     )
                     
-                    result = await func(client, *args, **kwargs)
+                    with track_rpc(endpoint, method):
+                        result = await func(client, *args, **kwargs)
                     await client.close()
                     
                     logger.info(
@@ -82,20 +84,38 @@ class SolanaRPCClient:
         async def _get_tx(client, sig, enc, max_ver):
             return await client.get_transaction(sig, encoding=enc, max_supported_transaction_version=max_ver)
         
-        return await self._execute_with_retry(_get_tx, signature, encoding, max_supported_transaction_version)
+        return await self._execute_with_retry("getTransaction", _get_tx, signature, encoding, max_supported_transaction_version)
     
     async def get_signatures_for_address(self, pubkey, limit: int = 100):
         """Get signatures for address with retry logic"""
         async def _get_sigs(client, pk, lim):
             return await client.get_signatures_for_address(pk, limit=lim)
         
-        return await self._execute_with_retry(_get_sigs, pubkey, limit)
+        return await self._execute_with_retry("getSignaturesForAddress", _get_sigs, pubkey, limit)
     
-    async def get_latest_blockhash(self, commitment=Finalized):
-        """Get latest blockhash with retry logic"""
+    async def get_latest_blockhash(self, commitment=None):
+        """Get latest blockhash with retry logic; finalized unless another commitment is given"""
+        if commitment is None:
+            from solana.rpc.commitment import Finalized
+            commitment = Finalized
+
         async def _get_blockhash(client, comm):
             return await client.get_latest_blockhash(commitment=comm)
         
-        return await self._execute_with_retry(_get_blockhash, commitment)
+        return await self._execute_with_retry("getLatestBlockhash", _get_blockhash, commitment)
 
 rpc_client = SolanaRPCClient()
+
+_sync_client = None
+
+
+def get_sync_client():
+    """
+    The blocking solana Client on SOLANA_RPC, shared by the sync checks.
+    Created on first use, so solana stays off the app's import path.
+    """
+    global _sync_client
+    if _sync_client is None:
+        from solana.rpc.api import Client
+        _sync_client = Client(SOLANA_RPC)
+    return _sync_client
@@ -0,0 +1,136 @@
+import json
+import mimetypes
+import os
+from typing import Dict, Optional, Tuple
+
+import structlog
+from markupsafe import Markup, escape
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+logger = structlog.get_logger(__name__)
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "static")
+STATIC_URL = "/static/"
+# tools/build_static.py writes content-hashed copies and their .br/.gz variants here
+BUILD_DIR = os.path.join(STATIC_DIR, "build")
+MANIFEST_PATH = os.path.join(BUILD_DIR, "manifest.json")
+# responsive WebP/AVIF variants per source image, also written by the build step
+IMAGES_MANIFEST_PATH = os.path.join(BUILD_DIR, "images.json")
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def load_manifest(path: str = MANIFEST_PATH) -> Dict[str, str]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        logger.warning("Static manifest not found, serving unhashed assets", path=path)
+    except (OSError, ValueError) as e:
+        logger.error("Static manifest unreadable, serving unhashed assets", path=path, error=str(e))
+    return {}
+
+
+manifest = load_manifest()
+images = load_manifest(IMAGES_MANIFEST_PATH) if manifest else {}
+
+
+def asset_url(path: str) -> str:
+    """URL for a file under CCOIN/static, e.g. asset_url('js/airdrop.js')"""
+    path = path.lstrip("/")
+    return STATIC_URL + manifest.get(path, path)
+
+
+def picture(path: str, width: int, alt: str = "", sizes: Optional[str] = None, **attrs) -> Markup:
+    """
+    <picture> for an image under CCOIN/static with AVIF/WebP srcsets.
+    `width` is the CSS width the image is shown at and becomes the default
+    `sizes`; extra keyword arguments are <img> attributes (class_ for class).
+    Without built variants this is a plain <img>.
+    """
+    path = path.lstrip("/")
+    variant = images.get(path)
+    img_attrs = {"src": STATIC_URL + variant["fallback"] if variant else asset_url(path), "alt": alt}
+    img_attrs.update((name.rstrip("_").replace("_", "-"), value) for name, value in attrs.items())
+    img = "<img " + " ".join(f'{name}="{escape(value)}"' for name, value in img_attrs.items() if value is not None) + ">"
+    if not variant:
+        return Markup(img)
+
+    sizes = sizes or f"{width}px"
+    sources = "".join(
+        f'<source type="{media_type}" srcset="{escape(", ".join(f"{STATIC_URL}{url} {w}w" for url, w in candidates))}" sizes="{escape(sizes)}">'
+        for media_type, candidates in variant["sources"].items()
+    )
+    return Markup(f"<picture>{sources}{img}</picture>")
+
+
+def accepted_encodings(header: str) -> set:
+    accepted = set()
+    for item in header.split(","):
+        coding, _, params = item.partition(";")
+        params = params.replace(" ", "")
+        try:
+            quality = float(params[2:]) if params.startswith("q=") else 1.0
+        except ValueError:
+            quality = 1.0
+        if quality > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles that serves the build step's .br/.gz siblings when the
+    client accepts them, so nothing under /static is compressed per
+    request. Hashed files under build/ are cached as immutable; anything
+    else must be revalidated (ETag / Last-Modified) so a deploy is seen.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._variants: Dict[str, Tuple[Tuple[str, str, os.stat_result], ...]] = {}
+
+    def _find_variants(self, full_path: str) -> Tuple[Tuple[str, str, os.stat_result], ...]:
+        variants = self._variants.get(full_path)
+        if variants is None:
+            found = []
+            for encoding, suffix in ENCODINGS:
+                try:
+                    found.append((encoding, full_path + suffix, os.stat(full_path + suffix)))
+                except OSError:
+                    pass
+            # build output never changes while the process runs
+            variants = self._variants[full_path] = tuple(found)
+        return variants
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope, status_code: int = 200) -> Response:
+        full_path = os.fspath(full_path)
+        request_headers = Headers(scope=scope)
+        variants = self._find_variants(full_path)
+
+        chosen: Optional[Tuple[str, str, os.stat_result]] = None
+        if variants:
+            accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+            chosen = next((variant for variant in variants if variant[0] in accepted), None)
+
+        if chosen:
+            encoding, variant_path, variant_stat = chosen
+            media_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+            response = FileResponse(variant_path, status_code=status_code, stat_result=variant_stat, media_type=media_type)
+            response.headers["Content-Encoding"] = encoding
+        else:
+            response = FileResponse(full_path, status_code=status_code, stat_result=stat_result)
+
+        if variants:
+            response.headers["Vary"] = "Accept-Encoding"
+        immutable = full_path.startswith(BUILD_DIR + os.sep)
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL
+
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
@@ -0,0 +1,441 @@
+import asyncio
+import heapq
+import itertools
+import json
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Optional
+
+import structlog
+from redis import asyncio as aioredis
+from sqlalchemy import select, true, and_
+
+from CCOIN.database import SessionLocal
+from CCOIN.models.user import User
+from CCOIN.utils.rate_limit import TokenBucket
+from CCOIN.config import (
+    REDIS_URL, TELEGRAM_SEND_RATE, TELEGRAM_SEND_CHAT_INTERVAL, TELEGRAM_SEND_WORKERS,
+    TELEGRAM_SEND_MAX_ATTEMPTS, TELEGRAM_SEND_WAIT_TIMEOUT, BROADCAST_PAGE_SIZE
+)
+
+logger = structlog.get_logger(__name__)
+
+PRIORITY_HIGH = 0  # a reply to something the user just did
+PRIORITY_NORMAL = 5
+PRIORITY_BULK = 9  # broadcasts, never ahead of user-triggered messages
+
+OUTBOX_KEY = "tg_outbox"
+ALIVE_KEY = "tg_outbox:alive:{}"
+ALIVE_TTL = 30
+
+SEGMENTS = {
+    "all": lambda: true(),
+    "commission_unpaid": lambda: User.commission_paid.isnot(True),
+    "wallet_connected_unpaid": lambda: and_(User.wallet_connected.is_(True), User.commission_paid.isnot(True)),
+}
+
+
+def fetch_segment_page(segment: str, after_user_id: int, page_size: int) -> list:
+    """Next keyset page of (id, telegram_id) for a broadcast segment"""
+    with SessionLocal() as db:
+        return db.execute(
+            select(User.id, User.telegram_id)
+            .where(SEGMENTS[segment](), User.id > after_user_id)
+            .order_by(User.id)
+            .limit(page_size)
+        ).all()
+
+
+def _seconds(retry_after) -> float:
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+class TelegramDispatcher:
+    """
+    Single outbound path for bot messages.
+
+    Messages wait in a priority queue and leave under a global token bucket
+    (Telegram allows ~30 msg/s per bot) and a minimum interval per chat
+    (~1 msg/s). RetryAfter pauses the global bucket and requeues the message.
+    Every queued message is also kept in a Redis hash until it is delivered
+    or given up on. Each instance keeps an alive key with a heartbeat and,
+    at start and every ALIVE_TTL after, adopts the messages of instances
+    whose key has lapsed, so a crashed instance's outbox is picked up by the
+    ones still running. Delivery is at-least-once.
+
+    Broadcast campaigns and their counts live in this instance's memory only:
+    they are gone after a restart, and messages of theirs adopted by another
+    instance still go out but are not counted anywhere.
+    """
+
+    def __init__(
+        self,
+        rate: float = TELEGRAM_SEND_RATE,
+        chat_interval: float = TELEGRAM_SEND_CHAT_INTERVAL,
+        workers: int = TELEGRAM_SEND_WORKERS,
+        max_attempts: int = TELEGRAM_SEND_MAX_ATTEMPTS
+    ):
+        self.rate = rate
+        self.chat_interval = chat_interval
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.instance_id = uuid.uuid4().hex
+        self.bot = None
+        self._heap = []
+        self._delayed = []
+        self._seq = itertools.count()
+        self._jobs = {}
+        self._waiters = {}
+        self._chat_next_slot = {}
+        self._bulk_pending = 0
+        self._bucket = None
+        self._wakeup = None
+        self._outgoing = None
+        self._tasks = []
+        self._broadcasts = set()
+        self._redis = None
+        self.counters = {
+            "queued": 0, "sent": 0, "retried": 0, "failed": 0, "dropped": 0, "rate_limited": 0, "recovered": 0
+        }
+        self.campaigns = {}
+
+    async def start(self, bot):
+        if self._tasks:
+            return
+        self.bot = bot
+        # no burst allowance: Telegram counts per second, so pace sends evenly
+        self._bucket = TokenBucket(self.rate, 1)
+        self._wakeup = asyncio.Event()
+        self._outgoing = asyncio.Queue(maxsize=self.workers)
+
+        try:
+            self._redis = aioredis.from_url(REDIS_URL, decode_responses=True) if REDIS_URL else None
+            if self._redis:
+                await self._redis.set(ALIVE_KEY.format(self.instance_id), 1, ex=ALIVE_TTL)
+                await self._recover()
+        except Exception as e:
+            logger.warning("Redis unavailable for Telegram outbox, messages are kept in memory only", error=str(e))
+            self._redis = None
+
+        self._tasks = [asyncio.create_task(self._schedule()), asyncio.create_task(self._heartbeat())]
+        self._tasks += [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._wakeup.set()
+        logger.info("Telegram dispatcher started", rate=self.rate, workers=self.workers, pending=len(self._jobs))
+
+    async def stop(self):
+        """Stop sending; undelivered messages stay in the Redis outbox for the next instance"""
+        for task in list(self._broadcasts) + self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._broadcasts, *self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._redis:
+            try:
+                await self._redis.delete(ALIVE_KEY.format(self.instance_id))
+                await self._redis.aclose()
+            except Exception as e:
+                logger.warning("Error closing Telegram outbox", error=str(e))
+        logger.info("Telegram dispatcher stopped", pending=len(self._jobs))
+
+    async def send(
+        self,
+        chat_id,
+        text: str,
+        priority: int = PRIORITY_NORMAL,
+        wait: bool = False,
+        parse_mode: Optional[str] = None,
+        reply_markup=None,
+        disable_web_page_preview: Optional[bool] = None
+    ) -> bool:
+        """
+        Queue a message. With `wait`, return whether it was delivered, and
+        False is final: a message still queued after TELEGRAM_SEND_WAIT_TIMEOUT
+        is dropped, so the caller may retry without sending it twice. One
+        being sent by then is waited for, and dropped instead of retried if
+        that attempt fails.
+        """
+        job = self._new_job(chat_id, text, priority, parse_mode, reply_markup, disable_web_page_preview)
+        future = asyncio.get_running_loop().create_future() if wait else None
+        if future:
+            self._waiters[job["id"]] = future
+        await self._persist([job])
+        self._push(job)
+        if not future:
+            return True
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), TELEGRAM_SEND_WAIT_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("Message not delivered by wait timeout, dropping it", chat_id=chat_id, job_id=job["id"])
+            job["_abandoned"] = True
+            if not job.get("_inflight"):
+                await self._finish(job, False, dropped=True)
+            # an attempt under way ends within the bot's request timeouts
+            return await future
+
+    async def broadcast(self, segment: str, text: str, parse_mode: Optional[str] = None,
+                        disable_web_page_preview: Optional[bool] = None) -> str:
+        """Start sending `text` to every user in `segment` in the background; returns a campaign id"""
+        if segment not in SEGMENTS:
+            raise ValueError(f"Unknown segment: {segment}")
+        campaign_id = uuid.uuid4().hex[:12]
+        self.campaigns[campaign_id] = {
+            "segment": segment,
+            "status": "running",
+            "queued": 0,
+            "sent": 0,
+            "failed": 0,
+            "started_at": datetime.now(timezone.utc).isoformat(),
+        }
+        task = asyncio.create_task(self._run_broadcast(campaign_id, segment, text, parse_mode, disable_web_page_preview))
+        self._broadcasts.add(task)
+        task.add_done_callback(self._broadcasts.discard)
+        return campaign_id
+
+    async def _run_broadcast(self, campaign_id, segment, text, parse_mode, disable_web_page_preview):
+        campaign = self.campaigns[campaign_id]
+        last_user_id = 0
+        try:
+            while True:
+                # keep roughly one page queued so a large segment never sits in memory
+                while self._bulk_pending >= BROADCAST_PAGE_SIZE:
+                    await asyncio.sleep(0.5)
+                rows = await asyncio.to_thread(fetch_segment_page, segment, last_user_id, BROADCAST_PAGE_SIZE)
+                if not rows:
+                    break
+                jobs = [
+                    self._new_job(row.telegram_id, text, PRIORITY_BULK, parse_mode, None,
+                                  disable_web_page_preview, campaign=campaign_id)
+                    for row in rows
+                ]
+                await self._persist(jobs)
+                for job in jobs:
+                    self._push(job)
+                campaign["queued"] += len(jobs)
+                last_user_id = rows[-1].id
+            campaign["status"] = "queued"
+            logger.info("Broadcast fully queued", campaign_id=campaign_id, segment=segment, queued=campaign["queued"])
+            self._settle_campaign(campaign_id)
+        except Exception as e:
+            campaign["status"] = "error"
+            logger.error("Broadcast failed", campaign_id=campaign_id, error=str(e), exc_info=True)
+
+    def _new_job(self, chat_id, text, priority, parse_mode, reply_markup, disable_web_page_preview, campaign=None) -> dict:
+        return {
+            "id": uuid.uuid4().hex,
+            "chat_id": chat_id,
+            "text": text,
+            "priority": priority,
+            "parse_mode": parse_mode,
+            "reply_markup": reply_markup.to_dict() if reply_markup else None,
+            "disable_web_page_preview": disable_web_page_preview,
+            "campaign": campaign,
+            "attempts": 0,
+            "owner": self.instance_id,
+        }
+
+    def _push(self, job: dict, not_before: Optional[float] = None):
+        if job["id"] not in self._jobs:
+            self._jobs[job["id"]] = job
+            self.counters["queued"] += 1
+            if job["priority"] == PRIORITY_BULK:
+                self._bulk_pending += 1
+        job.setdefault("_seq", next(self._seq))
+        if not_before is not None:
+            job["_slot"] = not_before
+            heapq.heappush(self._delayed, (not_before, job["_seq"], job["id"]))
+        else:
+            heapq.heappush(self._heap, (job["priority"], job["_seq"], job["id"]))
+        if self._wakeup:
+            self._wakeup.set()
+
+    def _pop_ready(self, now: float) -> Optional[dict]:
+        """Highest-priority message whose chat may receive now; others move to the delayed heap"""
+        while self._heap:
+            _, seq, job_id = heapq.heappop(self._heap)
+            job = self._jobs.get(job_id)
+            if job is None:
+                continue
+            if job.get("_slot") is None:
+                chat = str(job["chat_id"])
+                job["_slot"] = max(now, self._chat_next_slot.get(chat, 0.0))
+                self._chat_next_slot[chat] = job["_slot"] + self.chat_interval
+            if job["_slot"] > now:
+                heapq.heappush(self._delayed, (job["_slot"], seq, job_id))
+                continue
+            return job
+        return None
+
+    async def _schedule(self):
+        while True:
+            now = time.monotonic()
+            while self._delayed and self._delayed[0][0] <= now:
+                _, seq, job_id = heapq.heappop(self._delayed)
+                job = self._jobs.get(job_id)
+                if job:
+                    heapq.heappush(self._heap, (job["priority"], seq, job_id))
+
+            job = self._pop_ready(now)
+            if job is None:
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._bucket.acquire()
+            job["_inflight"] = True
+            await self._outgoing.put(job)
+
+            if len(self._chat_next_slot) > 10000:
+                self._chat_next_slot = {c: t for c, t in self._chat_next_slot.items() if t > now}
+
+    async def _worker(self):
+        while True:
+            job = await self._outgoing.get()
+            try:
+                await self._deliver(job)
+            except Exception as e:
+                logger.error("Unexpected dispatcher error", job_id=job["id"], error=str(e), exc_info=True)
+                await self._finish(job, False)
+
+    async def _deliver(self, job: dict):
+        from telegram import InlineKeyboardMarkup
+        from telegram.error import RetryAfter, Forbidden, BadRequest, TimedOut, NetworkError
+
+        reply_markup = InlineKeyboardMarkup.de_json(job["reply_markup"], self.bot) if job["reply_markup"] else None
+        try:
+            await self.bot.send_message(
+                chat_id=job["chat_id"],
+                text=job["text"],
+                parse_mode=job["parse_mode"],
+                reply_markup=reply_markup,
+                disable_web_page_preview=job["disable_web_page_preview"]
+            )
+        except RetryAfter as e:
+            delay = _seconds(e.retry_after)
+            self.counters["rate_limited"] += 1
+            self._bucket.pause(delay)
+            logger.warning("Telegram flood limit hit, pausing sends", retry_after=delay)
+            await self._retry(job, delay)
+        except (Forbidden, BadRequest) as e:
+            # blocked bot, deleted account, bad markup: retrying will not help
+            logger.info("Message rejected by Telegram", chat_id=job["chat_id"], error=str(e))
+            await self._finish(job, False)
+        except (TimedOut, NetworkError) as e:
+            logger.warning("Telegram send failed, will retry", chat_id=job["chat_id"], attempt=job["attempts"] + 1, error=str(e))
+            await self._retry(job, min(60, 2 ** job["attempts"]))
+        else:
+            await self._finish(job, True)
+
+    async def _retry(self, job: dict, delay: float):
+        job["_inflight"] = False
+        if job.get("_abandoned"):
+            await self._finish(job, False, dropped=True)
+            return
+        job["attempts"] += 1
+        if job["attempts"] >= self.max_attempts:
+            logger.error("Giving up on message", chat_id=job["chat_id"], attempts=job["attempts"])
+            await self._finish(job, False)
+            return
+        self.counters["retried"] += 1
+        slot = time.monotonic() + delay
+        chat = str(job["chat_id"])
+        self._chat_next_slot[chat] = max(self._chat_next_slot.get(chat, 0.0), slot + self.chat_interval)
+        await self._persist([job])
+        self._push(job, not_before=slot)
+
+    async def _finish(self, job: dict, delivered: bool, dropped: bool = False):
+        if self._jobs.pop(job["id"], None) is None:
+            return
+        if job["priority"] == PRIORITY_BULK:
+            self._bulk_pending -= 1
+        self.counters["sent" if delivered else "dropped" if dropped else "failed"] += 1
+        campaign = self.campaigns.get(job["campaign"])
+        if campaign:
+            campaign["sent" if delivered else "failed"] += 1
+            self._settle_campaign(job["campaign"])
+        future = self._waiters.pop(job["id"], None)
+        if future and not future.done():
+            future.set_result(delivered)
+        if self._redis:
+            try:
+                await self._redis.hdel(OUTBOX_KEY, job["id"])
+            except Exception as e:
+                logger.warning("Outbox delete failed", job_id=job["id"], error=str(e))
+
+    def _settle_campaign(self, campaign_id: str):
+        """Mark a fully queued campaign done once each of its messages was sent or given up on"""
+        campaign = self.campaigns[campaign_id]
+        if campaign["status"] == "queued" and campaign["sent"] + campaign["failed"] >= campaign["queued"]:
+            campaign["status"] = "done"
+            campaign["finished_at"] = datetime.now(timezone.utc).isoformat()
+            logger.info("Broadcast done", campaign_id=campaign_id, sent=campaign["sent"], failed=campaign["failed"])
+
+    async def _persist(self, jobs: list):
+        if not self._redis:
+            return
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for job in jobs:
+                    pipe.hset(OUTBOX_KEY, job["id"], json.dumps({k: v for k, v in job.items() if not k.startswith("_")}))
+                await pipe.execute()
+        except Exception as e:
+            logger.warning("Outbox write failed, messages kept in memory only", count=len(jobs), error=str(e))
+
+    async def _recover(self):
+        """Adopt messages left in the outbox by instances that are no longer alive"""
+        stored = await self._redis.hgetall(OUTBOX_KEY)
+        owners = {json.loads(raw).get("owner") for raw in stored.values()} - {self.instance_id}
+        alive = {owner for owner in owners if owner and await self._redis.exists(ALIVE_KEY.format(owner))}
+        alive.add(self.instance_id)
+        adopted = []
+        for job_id, raw in stored.items():
+            job = json.loads(raw)
+            if job.get("owner") in alive or job_id in self._jobs:
+                continue
+            # HDEL is the claim: only one instance gets each message
+            if await self._redis.hdel(OUTBOX_KEY, job_id):
+                job["owner"] = self.instance_id
+                adopted.append(job)
+        if adopted:
+            await self._persist(adopted)
+            for job in adopted:
+                self._push(job)
+            self.counters["recovered"] += len(adopted)
+            logger.info("Recovered undelivered Telegram messages", count=len(adopted))
+
+    async def _heartbeat(self):
+        beats = 0
+        while True:
+            await asyncio.sleep(ALIVE_TTL / 3)
+            if not self._redis:
+                continue
+            beats += 1
+            try:
+                await self._redis.set(ALIVE_KEY.format(self.instance_id), 1, ex=ALIVE_TTL)
+            except Exception as e:
+                logger.warning("Outbox heartbeat failed", error=str(e))
+                continue
+            if beats % 3 == 0:
+                try:
+                    await self._recover()
+                except Exception as e:
+                    logger.warning("Outbox recovery failed", error=str(e))
+
+    def stats(self) -> dict:
+        return {
+            "running": bool(self._tasks),
+            "pending": len(self._jobs),
+            "ready": len(self._heap),
+            "delayed": len(self._delayed),
+            "bulk_pending": self._bulk_pending,
+            "rate": self.rate,
+            **self.counters,
+        }
+
+
+dispatcher = TelegramDispatcher()
@@ -1,38 +1,83 @@
 from fastapi import HTTPException, Request, Depends
 from fastapi.responses import RedirectResponse
 from sqlalchemy.orm import Session
-from telegram import Update, Bot, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import ApplicationBuilder, CommandHandler, ContextTypes
 from CCOIN.models.user import User
-from CCOIN.database import get_db
-from CCOIN.config import BOT_TOKEN, TELEGRAM_CHANNEL_USERNAME
-import requests
-import uuid
+from CCOIN.database import get_db, SessionLocal
+from CCOIN.utils import ledger
+from CCOIN.utils.registration import registration_writer, WELCOME_BONUS
+from CCOIN.utils.telegram_dispatcher import dispatcher, PRIORITY_HIGH
+from CCOIN.utils.metrics import observe_telegram
+from CCOIN.config import (
+    BOT_TOKEN, TELEGRAM_CHANNEL_USERNAME, TELEGRAM_API_BASE_URL,
+    TELEGRAM_POOL_SIZE, TELEGRAM_POOL_TIMEOUT
+)
+import asyncio
 import structlog
 import os
+import time
 from urllib.parse import urlencode
 
-structlog.configure(
-    processors=[
-        structlog.processors.TimeStamper(fmt="iso"),
-        structlog.stdlib.add_log_level,
-        structlog.processors.JSONRenderer(),
-    ],
-    context_class=dict,
-    logger_factory=structlog.stdlib.LoggerFactory(),
-    wrapper_class=structlog.stdlib.BoundLogger,
-    cache_logger_on_first_use=True,
-)
-
 logger = structlog.get_logger()
 
-app = ApplicationBuilder().token(BOT_TOKEN).build()
+def instrumented_request(**kwargs):
+    """An HTTPXRequest that counts and times every Bot API call by method"""
+    from telegram.request import HTTPXRequest
+
+    class InstrumentedHTTPXRequest(HTTPXRequest):
+        async def do_request(self, url: str, method: str, *args, **kwargs):
+            api_method = url.rsplit("/", 1)[-1]  # the URL path carries the bot token
+            started = time.perf_counter()
+            try:
+                status, payload = await super().do_request(url, method, *args, **kwargs)
+            except Exception as e:
+                observe_telegram(api_method, time.perf_counter() - started, error=e)
+                raise
+            observe_telegram(api_method, time.perf_counter() - started, status=status)
+            return status, payload
+
+    return InstrumentedHTTPXRequest(**kwargs)
+
+
+_application = None
+
+
+def get_application():
+    """
+    One Application (and its Bot/HTTP pool) per process, initialized in
+    main's lifespan. Built on first use, and python-telegram-bot is imported
+    only then: it and the HTTP pool's TLS setup are most of the import time
+    of the app otherwise.
+    """
+    global _application
+    if _application is None:
+        from telegram.ext import ApplicationBuilder, CommandHandler
+
+        _application = (
+            ApplicationBuilder()
+            .token(BOT_TOKEN)
+            .base_url(f"{TELEGRAM_API_BASE_URL}/bot")
+            .request(instrumented_request(
+                connection_pool_size=TELEGRAM_POOL_SIZE,
+                pool_timeout=TELEGRAM_POOL_TIMEOUT
+            ))
+            .build()
+        )
+        _application.add_handler(CommandHandler("start", start))
+    return _application
 
 def is_user_in_telegram_channel(user_id: int) -> bool:
     try:
         url = f"https://api.telegram.org/bot{BOT_TOKEN}/getChatMember"
         params = {"chat_id": f"@{TELEGRAM_CHANNEL_USERNAME}", "user_id": user_id}
-        response = requests.get(url, params=params)
+        import requests  # only this legacy sync check uses it; not worth its import time at startup
+
+        started = time.perf_counter()
+        try:
+            response = requests.get(url, params=params)
+        except Exception as e:
+            observe_telegram("getChatMember", time.perf_counter() - started, error=e)
+            raise
+        observe_telegram("getChatMember", time.perf_counter() - started, status=response.status_code)
         if response.status_code == 200:
             data = response.json()
             status = data.get("result", {}).get("status")
@@ -54,10 +99,13 @@ async def get_current_user(request: Request, db: Session = Depends(get_db)):
     
     return user
 
-async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    from CCOIN.database import SessionLocal
-    db = SessionLocal()
-    
+def _current_balance(user_id: int) -> int:
+    with SessionLocal() as db:
+        return ledger.get_balance(db, user_id)
+
+async def start(update, context):
+    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
     try:
         telegram_id = str(update.message.from_user.id)
         username = update.message.from_user.username
@@ -67,55 +115,10 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         logger.info(f"Processing /start command for user {telegram_id}")
         
-        user = db.query(User).filter(User.telegram_id == telegram_id).first()
-        
-        is_new_user = False
-        
-        if not user:
-            is_new_user = True
-            logger.info(f"Creating new user: {telegram_id}")
-            
-            user = User(
-                telegram_id=telegram_id,
-                username=username,
-                first_name=first_name,
-                last_name=last_name,
-                referral_code=str(uuid.uuid4())[:8],
-                tokens=2000,  
-                first_login=True,
-            )
-            
-            if referral_code:
-                referrer = db.query(User).filter(User.referral_code == referral_code).first()
-                if referrer:
-                    user.referred_by = referrer.id
-                    referrer.tokens += 50  
-                    logger.info(f"New user {telegram_id} referred by {referrer.telegram_id}")
-                else:
-                    logger.warning(f"Invalid referral code: {referral_code}")
-            else:
-                logger.info(f"New user {telegram_id} joined without referral code")
-            
-            db.add(user)
-            db.commit()
-            db.refresh(user)
-            logger.info(f"New user created: {telegram_id} with 2000 tokens")
-        
-        else:
-            logger.info(f"Existing user: {telegram_id}, first_login={user.first_login}")
-            
-            if referral_code:
-                logger.info(f"Ignoring referral code {referral_code} for existing user {telegram_id}")
-            
-            if user.username != username:
-                user.username = username
-            if user.first_name != first_name:
-                user.first_name = first_name
-            if user.last_name != last_name:
-                user.last_name = last_name
-            
-            db.commit()
-            db.refresh(user)
+        # resolves once the row is committed, so the reply never refers to a lost write
+        user, is_new_user = await registration_writer.register(
+            telegram_id, username, first_name, last_name, referral_code
+        )
         
         base_url = os.getenv('APP_DOMAIN', 'https://ccoin2025.onrender.com')
         
@@ -144,7 +147,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 welcome_message = (
                     "💰 **Welcome to CCoin!**\n\n"
                     "🎉 Your crypto journey starts here!\n"
-                    "💎 You received 2000 CCoin as welcome bonus!\n"
+                    f"💎 You received {WELCOME_BONUS} CCoin as welcome bonus!\n"
                     "🎯 Complete tasks and earn more tokens!\n"
                     "👥 Thanks for using a referral link!\n\n"
                     "👇 Click the button below to open the app:"
@@ -153,14 +156,16 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 welcome_message = (
                     "💰 **Welcome to CCoin!**\n\n"
                     "🎉 Your crypto journey starts here!\n"
-                    "💎 You received 2000 CCoin as welcome bonus!\n"
+                    f"💎 You received {WELCOME_BONUS} CCoin as welcome bonus!\n"
                     "🎯 Complete tasks and earn more tokens!\n\n"
                     "👇 Click the button below to open the app:"
                 )
         else:
+            # users.tokens lags the ledger until the next compaction
+            balance = await asyncio.to_thread(_current_balance, user.id)
             welcome_message = (
                 "💰 **Welcome back to CCoin!**\n\n"
-                f"💎 You have {user.tokens} tokens\n"
+                f"💎 You have {balance} tokens\n"
                 "🎯 Ready to earn more?\n\n"
                 "👇 Click the button below to open the app:"
             )
@@ -176,22 +181,14 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception as e:
         logger.error(f"Error in start command: {e}", exc_info=True)
         await update.message.reply_text("An error occurred. Please try again.")
-    
-    finally:
-        db.close()
 
 
-async def send_commission_payment_link(telegram_id: str, bot_token: str):
+async def send_commission_payment_link(telegram_id: str):
     """
     Send commission payment link to user via Telegram bot
-    Properly manages Bot instance lifecycle
+    Queued on the shared dispatcher so it respects Telegram's rate limits
     """
-    bot = None
-    
     try:
-        bot = Bot(token=bot_token)
-        await bot.initialize()
-        
         base_url = os.getenv('APP_DOMAIN', 'https://ccoin2025.onrender.com')
         commission_url = f"{base_url}/commission/browser/pay?telegram_id={telegram_id}"
 
@@ -207,34 +204,24 @@ async def send_commission_payment_link(telegram_id: str, bot_token: str):
             "✅ After payment, your status will update automatically."
         )
 
-        await bot.send_message(
-            chat_id=telegram_id,
-            text=message_text,
+        sent = await dispatcher.send(
+            telegram_id,
+            message_text,
+            priority=PRIORITY_HIGH,
+            wait=True,
             parse_mode='HTML'
         )
-        
-        logger.info("Commission payment link sent successfully", extra={
-            "telegram_id": telegram_id
-        })
-        
-        return True
-        
+
+        if sent:
+            logger.info("Commission payment link sent successfully", extra={
+                "telegram_id": telegram_id
+            })
+        return sent
+
     except Exception as e:
         logger.error("Error sending payment link", extra={
             "telegram_id": telegram_id,
             "error": str(e)
         }, exc_info=True)
         return False
-    
-    finally:
-        if bot:
-            try:
-                await bot.shutdown()
-                logger.debug("Bot instance shutdown successfully")
-            except Exception as shutdown_error:
-                logger.warning("Error shutting down bot", extra={
-                    "error": str(shutdown_error)
-                })
-
 
-app.add_handler(CommandHandler("start", start))
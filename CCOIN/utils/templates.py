@@ -1,3 +1,53 @@
+import os
+import time
+
+import structlog
 from fastapi.templating import Jinja2Templates
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, TemplateError
+
+from CCOIN.config import DEBUG, TEMPLATE_CACHE_DIR
+from CCOIN.utils.static_files import asset_url, picture
+
+logger = structlog.get_logger(__name__)
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "templates")
+
+
+def create_environment(cache_dir: str = TEMPLATE_CACHE_DIR, auto_reload: bool = DEBUG) -> Environment:
+    """
+    The one Jinja environment for every page. Compiled templates are kept in
+    `cache_dir` (keyed by source checksum, so a deploy never reads stale
+    bytecode) and, outside development, never re-stat'ed for changes.
+    """
+    bytecode_cache = None
+    if cache_dir:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(cache_dir, "ccoin-%s.cache")
+        except OSError as e:
+            logger.warning("Template bytecode cache disabled", directory=cache_dir, error=str(e))
+    return Environment(
+        loader=FileSystemLoader(TEMPLATES_DIR),
+        autoescape=True,
+        auto_reload=auto_reload,
+        bytecode_cache=bytecode_cache,
+    )
+
+
+templates = Jinja2Templates(env=create_environment())
+templates.env.globals["asset_url"] = asset_url
+templates.env.globals["picture"] = picture
+
 
-templates = Jinja2Templates(directory="CCOIN/templates")
\ No newline at end of file
+def precompile_templates(env: Environment = templates.env) -> int:
+    """Load every page template now so the first request doesn't compile it"""
+    started = time.perf_counter()
+    compiled = 0
+    for name in env.list_templates(extensions=["html"]):
+        try:
+            env.get_template(name)
+            compiled += 1
+        except TemplateError as e:
+            logger.error("Template failed to compile", template=name, error=str(e))
+    logger.info("Templates precompiled", templates=compiled, seconds=round(time.perf_counter() - started, 3))
+    return compiled
@@ -0,0 +1,357 @@
+import functools
+import inspect
+import json
+import os
+import queue
+import random
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+import redis
+import redis.asyncio
+import structlog
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from CCOIN.config import TRACE_SAMPLE_RATE, TRACE_FILE, TRACE_FILE_MAX_BYTES, TRACE_RECENT
+
+logger = structlog.get_logger(__name__)
+
+
+class Trace:
+    """The spans of one sampled request, exported together when its root span ends"""
+
+    __slots__ = ("trace_id", "spans")
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans = []
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "attributes", "start", "duration", "error")
+
+    def __init__(self, trace: Trace, name: str, kind: str, parent_id: Optional[str], attributes: dict):
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes
+        self.start = time.time()
+        self.duration = None
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start": round(self.start, 6),
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+# the innermost open span; unset (the common case) makes every helper below a no-op
+_current: ContextVar[Optional[Span]] = ContextVar("trace_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def _finish(span: Span, token, started: float, error: Optional[BaseException]):
+    span.duration = time.perf_counter() - started
+    if error is not None:
+        span.error = f"{type(error).__name__}: {error}"[:300]
+    _current.reset(token)
+    span.trace.spans.append(span)
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", **attributes):
+    """
+    Child span of the current one: with tracing.span("rpc getTransaction", "client", endpoint=host): ...
+    Outside a sampled trace it only yields None.
+    """
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(parent.trace, name, kind, parent.span_id, attributes)
+    token = _current.set(child)
+    started = time.perf_counter()
+    error = None
+    try:
+        yield child
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _finish(child, token, started, error)
+
+
+def traced(name: Optional[str] = None, kind: str = "internal"):
+    """Decorator form of span() for sync and async functions"""
+
+    def decorate(func):
+        span_name = name or func.__qualname__
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name, kind):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name, kind):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorate
+
+
+def record_span(name: str, kind: str, seconds: float, error: Optional[BaseException] = None, **attributes):
+    """Add an already finished call (timed by the caller) as a child of the current span"""
+    parent = _current.get()
+    if parent is None:
+        return
+    child = Span(parent.trace, name, kind, parent.span_id, attributes)
+    child.start -= seconds
+    child.duration = seconds
+    if error is not None:
+        child.error = f"{type(error).__name__}: {error}"[:300]
+    parent.trace.spans.append(child)
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[tuple]:
+    """(trace_id, parent_id, sampled) from a W3C traceparent header"""
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16), int(parts[3], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2], bool(int(parts[3], 16) & 1)
+
+
+class FileExporter:
+    """
+    One JSON line per span, appended by a background thread so the event
+    loop never waits on the disk. The file is rotated to `path`.1 at
+    `max_bytes`.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=10000)
+        self._thread = None
+
+    def export(self, spans: List[dict]):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+            self._thread.start()
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while not self._queue.empty() and len(batch) < 100:
+                batch.append(self._queue.get_nowait())
+            try:
+                if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                    os.replace(self.path, self.path + ".1")
+                with open(self.path, "a") as f:
+                    for spans in batch:
+                        f.writelines(json.dumps(span, default=str) + "\n" for span in spans)
+            except OSError as e:
+                logger.error("Trace export failed", path=self.path, error=str(e))
+
+
+class Tracer:
+    """Sampling decision, root spans and where finished traces go"""
+
+    def __init__(self, sample_rate: float = TRACE_SAMPLE_RATE, path: str = TRACE_FILE,
+                 max_bytes: int = TRACE_FILE_MAX_BYTES, recent: int = TRACE_RECENT):
+        self.sample_rate = sample_rate
+        self.enabled = sample_rate > 0
+        self.exporter = FileExporter(path, max_bytes) if path else None
+        self.recent = deque(maxlen=recent)
+
+    def should_sample(self, parent: Optional[tuple]) -> bool:
+        if not self.enabled:
+            return False
+        if parent is not None:
+            return parent[2]
+        return random.random() < self.sample_rate
+
+    @contextmanager
+    def root(self, name: str, kind: str = "server", parent: Optional[tuple] = None, **attributes):
+        """Start a trace (continuing `parent` from a traceparent header) if it is sampled"""
+        if not self.should_sample(parent):
+            yield None
+            return
+        trace = Trace(parent[0] if parent else secrets.token_hex(16))
+        root = Span(trace, name, kind, parent[1] if parent else None, attributes)
+        token = _current.set(root)
+        started = time.perf_counter()
+        error = None
+        try:
+            yield root
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            _finish(root, token, started, error)
+            self.export(trace)
+
+    def export(self, trace: Trace):
+        spans = [span.to_dict() for span in sorted(trace.spans, key=lambda span: span.start)]
+        self.recent.append(spans)
+        if self.exporter is not None:
+            self.exporter.export(spans)
+
+    def get_trace(self, trace_id: str) -> Optional[List[dict]]:
+        for spans in reversed(self.recent):
+            if spans and spans[0]["trace_id"] == trace_id:
+                return spans
+        return None
+
+    def summaries(self) -> List[dict]:
+        """Newest-first root spans of the recently exported traces"""
+        return [
+            {**next((span for span in spans if span["kind"] == "server"), spans[0]), "spans": len(spans)}
+            for spans in reversed(self.recent) if spans
+        ]
+
+
+tracer = Tracer()
+
+
+def add_to_log(logger, method_name, event_dict):
+    """structlog processor: trace_id / span_id of the span the line is logged in"""
+    current = _current.get()
+    if current is not None:
+        event_dict.setdefault("trace_id", current.trace.trace_id)
+        event_dict.setdefault("span_id", current.span_id)
+    return event_dict
+
+
+class TracingMiddleware:
+    """
+    Root span per sampled HTTP request, continuing an incoming traceparent.
+    The trace id goes back in X-Trace-Id.
+    """
+
+    def __init__(self, app, tracer: Tracer = tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if not self.tracer.enabled or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        from CCOIN.utils.middleware import route_path  # middleware imports metrics, which imports this module
+
+        parent = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                parent = parse_traceparent(value.decode("latin-1"))
+                break
+        with self.tracer.root(scope["method"], "server", parent, **{"http.path": scope["path"]}) as root:
+            if root is None:
+                await self.app(scope, receive, send)
+                return
+
+            async def send_with_trace_id(message):
+                if message["type"] == "http.response.start":
+                    root.set(**{"http.status": message["status"]})
+                    message["headers"] = list(message.get("headers", ())) + [(b"x-trace-id", root.trace.trace_id.encode())]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_trace_id)
+            finally:
+                root.name = f"{scope['method']} {route_path(scope)}"
+
+
+# SQLAlchemy statements, on every engine
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("trace_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("trace_started")
+    if started:
+        seconds = time.perf_counter() - started.pop()
+        record_span("db " + statement.split(None, 1)[0].upper(), "client", seconds,
+                    **{"db.system": conn.dialect.name, "db.statement": " ".join(statement.split())[:300]})
+
+
+# Redis commands: redis-py has no hooks, so the client classes are wrapped once at import
+def _instrument_redis():
+    sync_execute = redis.Redis.execute_command
+    async_execute = redis.asyncio.Redis.execute_command
+    sync_pipeline = redis.client.Pipeline.execute
+    async_pipeline = redis.asyncio.client.Pipeline.execute
+
+    @functools.wraps(sync_execute)
+    def execute_command(self, *args, **options):
+        if _current.get() is None:
+            return sync_execute(self, *args, **options)
+        with span(f"redis {args[0]}", "client", **{"db.system": "redis"}):
+            return sync_execute(self, *args, **options)
+
+    @functools.wraps(async_execute)
+    async def async_execute_command(self, *args, **options):
+        if _current.get() is None:
+            return await async_execute(self, *args, **options)
+        with span(f"redis {args[0]}", "client", **{"db.system": "redis"}):
+            return await async_execute(self, *args, **options)
+
+    @functools.wraps(sync_pipeline)
+    def pipeline_execute(self, *args, **kwargs):
+        if _current.get() is None:
+            return sync_pipeline(self, *args, **kwargs)
+        with span("redis pipeline", "client", **{"db.system": "redis", "redis.commands": len(self.command_stack)}):
+            return sync_pipeline(self, *args, **kwargs)
+
+    @functools.wraps(async_pipeline)
+    async def async_pipeline_execute(self, *args, **kwargs):
+        if _current.get() is None:
+            return await async_pipeline(self, *args, **kwargs)
+        with span("redis pipeline", "client", **{"db.system": "redis", "redis.commands": len(self.command_stack)}):
+            return await async_pipeline(self, *args, **kwargs)
+
+    redis.Redis.execute_command = execute_command
+    redis.asyncio.Redis.execute_command = async_execute_command
+    redis.client.Pipeline.execute = pipeline_execute
+    redis.asyncio.client.Pipeline.execute = async_pipeline_execute
+
+
+if tracer.enabled:
+    _instrument_redis()
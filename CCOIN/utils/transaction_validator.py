@@ -3,13 +3,12 @@ from datetime import datetime, timezone, timedelta
 from sqlalchemy.orm import Session
 from sqlalchemy import and_
 from typing import Optional, Dict, Any
-from solana.rpc.async_api import AsyncClient
-from solders.signature import Signature as SigObj
-from solders.pubkey import Pubkey
 
 from CCOIN.models.user import User
 from CCOIN.models.transaction import Transaction
 from CCOIN.config import SOLANA_RPC, COMMISSION_AMOUNT, ADMIN_WALLET
+from CCOIN.utils.metrics import track_rpc
+from CCOIN.utils.tracing import traced
 
 logger = structlog.get_logger(__name__)
 
@@ -24,6 +23,7 @@ class TransactionValidator:
     async def initialize_client(self):
         """Initialize Solana RPC client"""
         if not self.client:
+            from solana.rpc.async_api import AsyncClient
             self.client = AsyncClient(SOLANA_RPC)
         return self.client
     
@@ -33,6 +33,7 @@ class TransactionValidator:
             await self.client.close()
             self.client = None
     
+    @traced("validator.check_duplicate_signature")
     def check_duplicate_signature(self, signature: str) -> Optional[Dict[str, Any]]:
         """
         Check if signature already exists in database
@@ -59,6 +60,7 @@ class TransactionValidator:
         
         return None
     
+    @traced("validator.check_user_already_paid")
     def check_user_already_paid(self, user_id: int) -> bool:
         """Check if user already paid commission"""
         user = self.db.query(User).filter(User.id == user_id).first()
@@ -67,6 +69,7 @@ class TransactionValidator:
             return True
         return False
     
+    @traced("validator.validate_ownership")
     def validate_ownership(
         self, 
         signature: str, 
@@ -121,6 +124,7 @@ class TransactionValidator:
             "user": user
         }
     
+    @traced("validator.verify_solana_transaction")
     async def verify_solana_transaction(
         self,
         signature: str,
@@ -133,6 +137,7 @@ class TransactionValidator:
         """
         try:
             await self.initialize_client()
+            from solders.signature import Signature as SigObj
             
             sig_obj = SigObj.from_string(signature)
             
@@ -140,11 +145,12 @@ class TransactionValidator:
                 "signature": signature
             })
             
-            tx_resp = await self.client.get_transaction(
-                sig_obj,
-                encoding="jsonParsed",
-                max_supported_transaction_version=0
-            )
+            with track_rpc(SOLANA_RPC, "getTransaction"):
+                tx_resp = await self.client.get_transaction(
+                    sig_obj,
+                    encoding="jsonParsed",
+                    max_supported_transaction_version=0
+                )
             
             if not tx_resp or not tx_resp.value:
                 return {
@@ -241,6 +247,7 @@ class TransactionValidator:
                 "error": f"Blockchain verification error: {str(e)}"
             }
     
+    @traced("validator.create_transaction_record")
     def create_transaction_record(
         self,
         user_id: int,
@@ -281,6 +288,7 @@ class TransactionValidator:
         
         return transaction
     
+    @traced("validator.update_transaction_status")
     def update_transaction_status(
         self,
         transaction: Transaction,
@@ -298,6 +306,7 @@ class TransactionValidator:
             "status": status
         })
     
+    @traced("validator.mark_user_as_paid")
     def mark_user_as_paid(self, user: User, signature: str):
         """Mark user as having paid commission"""
         user.commission_paid = True
@@ -0,0 +1,186 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Optional
+
+import structlog
+from redis import asyncio as aioredis
+
+from CCOIN.config import REDIS_URL
+
+logger = structlog.get_logger(__name__)
+
+LAG_WINDOW = 60  # seconds of processing that max_lag_seconds covers
+
+
+class UpdateQueue:
+    """
+    Bounded queue between the webhook and update processing.
+
+    Updates are sharded by chat over a fixed set of workers, each draining its
+    own FIFO, so updates from one chat are processed in arrival order while
+    different chats proceed in parallel. Duplicate deliveries are dropped by
+    update_id using Redis SET NX with a TTL (in-memory when Redis is down).
+
+    The queue lives in memory and the webhook acknowledges an update once it
+    is queued, so processing is at-most-once: Telegram does not send an
+    acknowledged update again, and whatever is still queued when the process
+    dies is lost. On a clean shutdown the claims of updates that were never
+    taken up are released, so a redelivery of one (its acknowledgement lost
+    in the shutdown) is processed rather than dropped as a duplicate.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[object], Awaitable[None]],
+        workers: int = 8,
+        max_size: int = 10000,
+        dedupe_ttl: int = 3600,
+    ):
+        self.handler = handler
+        self.workers = workers
+        self.per_worker_size = max(1, max_size // workers)
+        self.dedupe_ttl = dedupe_ttl
+        self._queues = []
+        self._enqueued_at = []
+        self._tasks = []
+        self._local_seen = OrderedDict()
+        self._redis = None
+        self.counters = {"enqueued": 0, "processed": 0, "failed": 0, "duplicates": 0, "rejected": 0}
+        self.last_lag = 0.0
+        self._lag_maxima = deque()  # [second, max lag seen in it], oldest first
+
+    async def start(self):
+        if self._tasks:
+            return
+        try:
+            self._redis = aioredis.from_url(REDIS_URL) if REDIS_URL else None
+            if self._redis:
+                await self._redis.ping()
+        except Exception as e:
+            logger.warning("Redis unavailable for update dedupe, using memory", error=str(e))
+            self._redis = None
+
+        self._queues = [asyncio.Queue(maxsize=self.per_worker_size) for _ in range(self.workers)]
+        self._enqueued_at = [deque() for _ in range(self.workers)]
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info("Update queue started", workers=self.workers, per_worker_size=self.per_worker_size)
+
+    async def join(self):
+        """Wait until every queued update has been processed"""
+        await asyncio.gather(*(q.join() for q in self._queues))
+
+    async def stop(self, drain_timeout: float = 10.0):
+        """Let workers drain what is queued, then cancel them"""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self.join(), drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Update queue not drained before shutdown", depth=self.depth())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        undrained = []
+        for queue in self._queues:
+            while not queue.empty():
+                undrained.append(queue.get_nowait().update_id)
+        if undrained:
+            logger.warning("Dropping updates not processed before shutdown", count=len(undrained))
+            await self.release(*undrained)
+        if self._redis:
+            await self._redis.aclose()
+
+    async def claim(self, update_id: int) -> bool:
+        """Reserve an update_id; False if it was already seen within the TTL"""
+        key = f"tg_update:{update_id}"
+        if self._redis:
+            try:
+                claimed = await self._redis.set(key, 1, nx=True, ex=self.dedupe_ttl)
+                if not claimed:
+                    self.counters["duplicates"] += 1
+                return bool(claimed)
+            except Exception as e:
+                logger.warning("Update dedupe via Redis failed", error=str(e))
+
+        now = time.monotonic()
+        while self._local_seen and next(iter(self._local_seen.values())) < now:
+            self._local_seen.popitem(last=False)
+        if key in self._local_seen:
+            self.counters["duplicates"] += 1
+            return False
+        self._local_seen[key] = now + self.dedupe_ttl
+        return True
+
+    async def release(self, *update_ids: int):
+        """Forget claims so Telegram's retry of a rejected or dropped update is accepted"""
+        keys = [f"tg_update:{update_id}" for update_id in update_ids]
+        for key in keys:
+            self._local_seen.pop(key, None)
+        if self._redis and keys:
+            try:
+                await self._redis.delete(*keys)
+            except Exception as e:
+                logger.warning("Update dedupe release failed", count=len(keys), error=str(e))
+
+    def submit(self, update, chat_key: Optional[int]) -> bool:
+        """Queue an update on its chat's worker; False when that worker is full"""
+        index = hash(chat_key if chat_key is not None else update.update_id) % self.workers
+        try:
+            self._queues[index].put_nowait(update)
+        except asyncio.QueueFull:
+            self.counters["rejected"] += 1
+            return False
+        self._enqueued_at[index].append(time.monotonic())
+        self.counters["enqueued"] += 1
+        return True
+
+    async def _worker(self, index: int):
+        queue = self._queues[index]
+        while True:
+            update = await queue.get()
+            lag = time.monotonic() - self._enqueued_at[index].popleft()
+            self._record_lag(lag)
+            try:
+                await self.handler(update)
+                self.counters["processed"] += 1
+            except Exception as e:
+                self.counters["failed"] += 1
+                logger.error("Error processing queued update", update_id=update.update_id, error=str(e), exc_info=True)
+            finally:
+                queue.task_done()
+
+    def _record_lag(self, lag: float):
+        self.last_lag = lag
+        second = int(time.monotonic())
+        if self._lag_maxima and self._lag_maxima[-1][0] == second:
+            self._lag_maxima[-1][1] = max(self._lag_maxima[-1][1], lag)
+            return
+        self._lag_maxima.append([second, lag])
+        while self._lag_maxima[0][0] <= second - LAG_WINDOW:
+            self._lag_maxima.popleft()
+
+    def max_lag(self) -> float:
+        """Highest lag of an update taken up in the last LAG_WINDOW seconds"""
+        since = int(time.monotonic()) - LAG_WINDOW
+        return max((lag for second, lag in self._lag_maxima if second > since), default=0.0)
+
+    def depth(self) -> int:
+        return sum(q.qsize() for q in self._queues)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        oldest = min((ts[0] for ts in self._enqueued_at if ts), default=None)
+        return {
+            "running": bool(self._tasks),
+            "workers": self.workers,
+            "depth": self.depth(),
+            "capacity": self.per_worker_size * self.workers,
+            "oldest_pending_seconds": round(now - oldest, 3) if oldest else 0.0,
+            "last_lag_seconds": round(self.last_lag, 3),
+            "max_lag_seconds": round(self.max_lag(), 3),
+            "lag_window_seconds": LAG_WINDOW,
+            **self.counters,
+        }
@@ -0,0 +1,138 @@
+import asyncio
+import secrets
+from typing import Optional
+
+import structlog
+from redis import asyncio as aioredis
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from CCOIN.config import REDIS_URL, RENDER_CACHE_TTL
+from CCOIN.models.airdrop import Airdrop
+from CCOIN.models.token_ledger import TokenLedger
+from CCOIN.models.user import User
+from CCOIN.models.usertask import UserTask
+
+logger = structlog.get_logger(__name__)
+
+# A user's state version is an opaque token. A write to the user deletes it and
+# the next read mints a fresh random one, so a version is never reused, even
+# after Redis loses its keys. Expiry acts as a bump, which bounds how long a
+# write made outside the hooks below can be hidden by a cached page. Versions
+# live in Redis only: a per-worker copy would miss the bumps of writes handled
+# by the other workers, so without Redis there is no version and no caching.
+VERSION_KEY = "user_state:{}"
+
+_redis = None
+_redis_loop = None  # an asyncio client belongs to the loop it was created on
+_pending_bumps = set()
+
+
+def _client():
+    global _redis, _redis_loop
+    loop = asyncio.get_running_loop()
+    if _redis is None or _redis_loop is not loop:
+        _redis = aioredis.from_url(REDIS_URL)
+        _redis_loop = loop
+    return _redis
+
+
+async def get_version(user_id: int) -> Optional[str]:
+    """Current state version of a user; None without Redis or when it cannot be read (don't cache then)"""
+    if not REDIS_URL:
+        return None
+    key = VERSION_KEY.format(user_id)
+    try:
+        # one round trip: mint a version unless there is one, then read whichever won
+        async with _client().pipeline(transaction=False) as pipe:
+            pipe.set(key, secrets.token_hex(8), ex=RENDER_CACHE_TTL, nx=True)
+            pipe.get(key)
+            _, version = await pipe.execute()
+        return version.decode() if version is not None else None
+    except Exception as e:
+        logger.warning("User state version unavailable", user_id=user_id, error=str(e))
+        return None
+
+
+async def _delete_versions(keys: list, client=None):
+    try:
+        await (client or _client()).delete(*keys)
+    except Exception as e:
+        logger.error("User state bump failed", users=len(keys), error=str(e))
+
+
+async def _delete_versions_once(keys: list):
+    client = aioredis.from_url(REDIS_URL)
+    try:
+        await _delete_versions(keys, client)
+    finally:
+        await client.aclose()
+
+
+async def close():
+    global _redis, _redis_loop
+    if _redis is not None:
+        await _redis.aclose()
+        _redis = _redis_loop = None
+
+
+def bump(*user_ids):
+    """
+    Invalidate the state version of every given user (None is ignored).
+    Commits call this from async handlers and from worker threads alike, so
+    the delete is handed to the event loop rather than waited for; a page
+    rendered meanwhile holds the committed data anyway. Where there is no
+    loop to hand it to (scripts, or a thread before the app's first read)
+    it runs to completion with a client of its own.
+    """
+    ids = {user_id for user_id in user_ids if user_id is not None}
+    if not ids or not REDIS_URL:
+        return
+    keys = [VERSION_KEY.format(user_id) for user_id in ids]
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    if loop is not None:
+        task = loop.create_task(_delete_versions(keys))
+        _pending_bumps.add(task)
+        task.add_done_callback(_pending_bumps.discard)
+    elif _redis_loop is not None and _redis_loop.is_running():
+        asyncio.run_coroutine_threadsafe(_delete_versions(keys), _redis_loop)
+    else:
+        asyncio.run(_delete_versions_once(keys))
+
+
+def touch(db: Session, *user_ids):
+    """
+    Mark users as changed by the current transaction; they are bumped once it
+    commits. ORM writes are picked up on flush, so this is only needed next to
+    Core insert/update statements.
+    """
+    db.info.setdefault("touched_users", set()).update(user_id for user_id in user_ids if user_id is not None)
+
+
+def _owner_id(obj) -> Optional[int]:
+    if isinstance(obj, User):
+        return obj.id
+    if isinstance(obj, (UserTask, TokenLedger, Airdrop)):
+        return obj.user_id
+    return None
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_flushed_users(session, flush_context):
+    changed = [obj for obj in session.dirty if session.is_modified(obj)]
+    touch(session, *(_owner_id(obj) for obj in (*session.new, *changed, *session.deleted)))
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_committed_users(session):
+    touched = session.info.pop("touched_users", None)
+    if touched:
+        bump(*touched)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back_users(session):
+    session.info.pop("touched_users", None)
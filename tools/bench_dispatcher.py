@@ -0,0 +1,121 @@
+"""
+Outbound messaging against a Bot API stub that enforces Telegram's flood limits.
+
+    python tools/bench_dispatcher.py --messages 300 --chats 100
+
+Modes:
+  direct     what the routers used to do: send_message straight away, all at once
+  dispatcher the shared TelegramDispatcher (global bucket + per-chat interval)
+  broadcast  dispatcher.broadcast("commission_unpaid") over seeded users
+
+Reports delivered/failed messages and how many 429s Telegram would have answered.
+Uses a throwaway SQLite database unless DATABASE_URL is set.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stubs import TelegramStub, run_in_thread
+
+
+def configure_env(port: int):
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+    os.environ.setdefault("BOT_TOKEN", "123456:bench")
+    os.environ.setdefault("REDIS_URL", "")
+    os.environ["TELEGRAM_API_BASE_URL"] = f"http://127.0.0.1:{port}"
+
+
+def seed_users(count: int):
+    from CCOIN.database import Base, engine, SessionLocal
+    from CCOIN.models.user import User
+    from CCOIN.models import airdrop, transaction, usertask  # noqa: F401  (User's relationships)
+
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        db.query(User).delete()
+        db.add_all([
+            User(telegram_id=str(50_000 + n), referral_code=f"b{n}", commission_paid=n % 4 == 0)
+            for n in range(count)
+        ])
+        db.commit()
+    return sum(1 for n in range(count) if n % 4)
+
+
+async def run_mode(mode: str, args, stub) -> dict:
+    from telegram.ext import ApplicationBuilder
+    from CCOIN.config import BOT_TOKEN, TELEGRAM_API_BASE_URL
+    from CCOIN.utils.telegram_dispatcher import TelegramDispatcher
+
+    telegram_app = ApplicationBuilder().token(BOT_TOKEN).base_url(f"{TELEGRAM_API_BASE_URL}/bot").build()
+    await telegram_app.initialize()
+    bot = telegram_app.bot
+    stub.flood_errors = 0
+    stub._last_chat_send.clear()
+    sent_before = len(stub.sent_messages)
+    result = {"mode": mode}
+    started = time.perf_counter()
+
+    if mode == "direct":
+        async def send(n):
+            try:
+                await bot.send_message(chat_id=10_000 + n % args.chats, text=f"m{n}")
+                return True
+            except Exception:
+                return False
+        outcomes = await asyncio.gather(*(send(n) for n in range(args.messages)))
+        result.update(delivered=sum(outcomes), failed=outcomes.count(False))
+    else:
+        dispatcher = TelegramDispatcher(rate=args.rate)
+        await dispatcher.start(bot)
+        if mode == "dispatcher":
+            for n in range(args.messages):
+                await dispatcher.send(10_000 + n % args.chats, f"m{n}")
+            while dispatcher.stats()["pending"]:
+                await asyncio.sleep(0.1)
+            result.update(delivered=dispatcher.counters["sent"], failed=dispatcher.counters["failed"])
+        else:
+            expected = seed_users(args.messages)
+            campaign_id = await dispatcher.broadcast("commission_unpaid", "Pay the commission to unlock your airdrop")
+            campaign = dispatcher.campaigns[campaign_id]
+            while campaign["status"] == "running" or campaign["sent"] + campaign["failed"] < campaign["queued"]:
+                await asyncio.sleep(0.1)
+            result.update(segment_size=expected, delivered=campaign["sent"], failed=campaign["failed"])
+        result["dispatcher"] = dispatcher.stats()
+        await dispatcher.stop()
+
+    elapsed = time.perf_counter() - started
+    await telegram_app.shutdown()
+    result.update(
+        seconds=round(elapsed, 2),
+        messages_per_second=round((len(stub.sent_messages) - sent_before) / elapsed, 1),
+        telegram_429s=stub.flood_errors,
+    )
+    return result
+
+
+async def main(args, stub):
+    results = [await run_mode(mode, args, stub) for mode in args.modes.split(",")]
+    print(json.dumps({"benchmark": "dispatcher", "flood_limit": args.flood_limit, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=300)
+    parser.add_argument("--chats", type=int, default=100, help="distinct recipients for direct/dispatcher modes")
+    parser.add_argument("--rate", type=float, default=25, help="dispatcher messages per second")
+    parser.add_argument("--flood-limit", type=int, default=30, help="stub's messages per second before 429")
+    parser.add_argument("--modes", default="direct,dispatcher,broadcast")
+    parser.add_argument("--stub-port", type=int, default=8082)
+    parser.add_argument("--stub-latency", type=float, default=0.02)
+    args = parser.parse_args()
+
+    configure_env(args.stub_port)
+    stub = TelegramStub(latency=args.stub_latency, flood_limit=args.flood_limit, chat_interval=1.0)
+    run_in_thread(stub.app(), args.stub_port)
+    asyncio.run(main(args, stub))
@@ -0,0 +1,296 @@
+"""
+Web tier benchmark: latency and throughput of the main pages under concurrent load.
+
+    python tools/bench_http.py --users 10000 --requests 500 --concurrency 20 --output bench.json
+    python tools/bench_http.py --users 10000 --compare bench.json
+
+Seeds the database at DATABASE_URL (a throwaway SQLite file by default;
+point it at a local Postgres for production-like numbers) with `--users`
+users in a referral tree, wallets, tasks and commission transactions,
+unless it already holds that many users. Then each endpoint gets
+`--requests` requests at `--concurrency`, spread over `--sessions`
+logged-in users:
+
+  home, leaders, friends, earn, airdrop   GET pages with a session cookie
+  check_status                             GET /commission/check_status
+  webhook                                  POST /telegram_webhook /start updates
+
+Telegram, Solana RPC and Redis are the local stubs from stubs.py, so the
+numbers are the app and its database. The per-router 10/minute rate limits
+and the social verifiers' quotas (X allows 15 checks a minute) are lifted
+for the run. Requests go in-process through httpx.ASGITransport.
+
+The JSON report is comparable between runs: with --compare, endpoints whose
+p95 or throughput got worse by more than --threshold are listed and the
+exit status is 1.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_webhook import start_update
+from stubs import RedisStub, SolanaRPCStub, TelegramStub, run_in_thread
+
+FIRST_TELEGRAM_ID = 1_000_000_000
+PLATFORMS = ("telegram", "instagram", "x", "youtube")
+ENDPOINTS = ("home", "leaders", "friends", "earn", "airdrop", "check_status", "webhook")
+
+
+def configure_env(args):
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+    os.environ.setdefault("BOT_TOKEN", "123456:bench")
+    os.environ.setdefault("WEBHOOK_TOKEN", "bench-webhook-token")
+    os.environ.setdefault("SECRET_KEY", "bench-secret")
+    os.environ.setdefault("ENV", "development")
+    os.environ["RATE_LIMIT_ENABLED"] = "false"
+    os.environ["RENDER_CACHE_ENABLED"] = "true" if args.render_cache else "false"
+    os.environ["TELEGRAM_API_BASE_URL"] = f"http://127.0.0.1:{args.stub_port}"
+    os.environ["SOLANA_RPC"] = f"http://127.0.0.1:{args.stub_port + 1}"
+    os.environ["REDIS_URL"] = f"redis://127.0.0.1:{args.stub_port + 2}/0"
+
+
+def seed(users: int, fanout: int, chunk: int = 10000) -> dict:
+    """
+    Users 1..n, where user i was referred by user i // fanout (a tree
+    `fanout` wide), a third with wallets, a tenth paid with a verified
+    transaction, and four tasks for every fifth user.
+    """
+    from sqlalchemy import func, insert, select
+    from CCOIN.database import SessionLocal
+    from CCOIN.models.transaction import Transaction
+    from CCOIN.models.user import User
+    from CCOIN.models.usertask import UserTask
+
+    with SessionLocal() as db:
+        existing = db.execute(select(func.count(User.id))).scalar()
+        if existing >= users:
+            return {"seeded": False, "users": existing}
+        if existing:
+            raise SystemExit(f"Database already has {existing} users; use an empty one or --users <= {existing}")
+
+    rng = random.Random(42)
+    now = datetime.now(timezone.utc)
+    started = time.perf_counter()
+    with SessionLocal() as db:
+        for low in range(1, users + 1, chunk):
+            ids = range(low, min(low + chunk, users + 1))
+            rows, tasks, transactions = [], [], []
+            for i in ids:
+                created = now - timedelta(minutes=users - i)
+                paid = i % 10 == 0
+                wallet = f"Wallet{i:038d}" if paid or i % 3 == 0 else None
+                rows.append({
+                    "id": i,
+                    "telegram_id": str(FIRST_TELEGRAM_ID + i),
+                    "username": f"user{i}",
+                    "first_name": "Bench",
+                    "last_name": "User",
+                    "tokens": rng.randint(0, 5000),
+                    "referral_code": f"R{i:07d}",
+                    "referred_by": i // fanout if i >= fanout else None,
+                    "wallet_address": wallet,
+                    "wallet_connected": wallet is not None,
+                    "wallet_connection_date": created if wallet else None,
+                    "first_login": False,
+                    "commission_paid": paid,
+                    "commission_payment_date": created if paid else None,
+                    "commission_transaction_hash": f"sig{i}" if paid else None,
+                    "created_at": created,
+                    "updated_at": created,
+                    "last_active": created,
+                })
+                if i % 5 == 0:
+                    tasks += [
+                        {"user_id": i, "platform": platform_name, "completed": rng.random() < 0.5, "attempt_count": 1}
+                        for platform_name in PLATFORMS
+                    ]
+                if paid:
+                    transactions.append({
+                        "user_id": i, "signature": f"sig{i}", "wallet_address": wallet, "amount": 0.001,
+                        "recipient": "Admin", "status": "verified", "transaction_type": "commission",
+                        "telegram_id": str(FIRST_TELEGRAM_ID + i), "created_at": created, "verified_at": created,
+                    })
+            db.execute(insert(User), rows)
+            if tasks:
+                db.execute(insert(UserTask), tasks)
+            if transactions:
+                db.execute(insert(Transaction), transactions)
+            db.commit()
+    return {"seeded": True, "users": users, "seconds": round(time.perf_counter() - started, 1)}
+
+
+def summarize(latencies: list, statuses: dict, seconds: float) -> dict:
+    latencies = sorted(latencies)
+
+    def percentile(p: float) -> float:
+        return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 2)
+
+    return {
+        "requests": len(latencies),
+        "seconds": round(seconds, 3),
+        "requests_per_second": round(len(latencies) / seconds, 1),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2),
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "max_ms": round(latencies[-1] * 1000, 2),
+        "statuses": statuses,
+    }
+
+
+async def run(args) -> dict:
+    import httpx
+    from CCOIN.main import app
+    from CCOIN.routers import airdrop, commission, earn, friends, home, leaders, usertasks, wallet
+    from CCOIN.tasks.verifiers import get_verifier, registered_platforms
+
+    for module in (airdrop, commission, earn, friends, home, leaders, usertasks, wallet):
+        limiter = getattr(module, "limiter", None)
+        if limiter is not None:
+            limiter.enabled = False
+    for platform_name in registered_platforms():
+        verifier = get_verifier(platform_name)
+        verifier.requests_per_minute = 1_000_000
+        verifier.daily_budget = None
+
+    rng = random.Random(7)
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    sessions = []
+    for n in range(min(args.sessions, args.users)):
+        telegram_id = FIRST_TELEGRAM_ID + rng.randint(1, args.users)
+        client = httpx.AsyncClient(transport=transport, base_url="http://localhost")
+        await client.get(f"/home/?telegram_id={telegram_id}")
+        sessions.append((client, telegram_id))
+
+    webhook_headers = {"X-Telegram-Bot-Api-Secret-Token": os.environ["WEBHOOK_TOKEN"]}
+    next_update = [0]
+
+    async def request(endpoint: str):
+        client, telegram_id = rng.choice(sessions)
+        if endpoint == "webhook":
+            next_update[0] += 1
+            return await client.post("/telegram_webhook", json=start_update(next_update[0], int(telegram_id)), headers=webhook_headers)
+        if endpoint == "check_status":
+            return await client.get(f"/commission/check_status?telegram_id={telegram_id}")
+        return await client.get(f"/{endpoint}/")
+
+    results = {}
+    for endpoint in args.endpoints.split(","):
+        semaphore = asyncio.Semaphore(args.concurrency)
+        latencies, statuses = [], {}
+
+        async def one():
+            async with semaphore:
+                started = time.perf_counter()
+                response = await request(endpoint)
+                latencies.append(time.perf_counter() - started)
+                statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+
+        for _ in range(min(args.warmup, args.requests)):
+            await one()
+        latencies.clear()
+        statuses.clear()
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(args.requests)))
+        results[endpoint] = summarize(latencies, statuses, time.perf_counter() - started)
+
+    for client, _ in sessions:
+        await client.aclose()
+    return results
+
+
+def compare(report: dict, previous: dict, threshold: float) -> list:
+    """Endpoints whose p95 rose or throughput fell by more than `threshold` (a fraction)"""
+    regressions = []
+    for endpoint, now in report["endpoints"].items():
+        before = previous.get("endpoints", {}).get(endpoint)
+        if not before:
+            continue
+        if now["p95_ms"] > before["p95_ms"] * (1 + threshold):
+            regressions.append({"endpoint": endpoint, "metric": "p95_ms", "before": before["p95_ms"], "now": now["p95_ms"]})
+        if now["requests_per_second"] < before["requests_per_second"] * (1 - threshold):
+            regressions.append({"endpoint": endpoint, "metric": "requests_per_second",
+                                "before": before["requests_per_second"], "now": now["requests_per_second"]})
+    return regressions
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+
+async def main(args):
+    from CCOIN.main import app
+    from CCOIN.database import Base, engine
+
+    started_at = datetime.now(timezone.utc).isoformat()
+    Base.metadata.create_all(bind=engine)
+    seeding = seed(args.users, args.fanout)
+    async with app.router.lifespan_context(app):
+        endpoints = await run(args)
+
+    report = {
+        "benchmark": "http",
+        "run": {
+            "started_at": started_at,
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "database": engine.dialect.name,
+            "users": args.users,
+            "sessions": args.sessions,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "render_cache": args.render_cache,
+            "seed": seeding,
+        },
+        "endpoints": endpoints,
+    }
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        report["regressions"] = regressions
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--fanout", type=int, default=5, help="referrals per user in the seeded tree")
+    parser.add_argument("--sessions", type=int, default=200, help="distinct logged-in users making the requests")
+    parser.add_argument("--requests", type=int, default=500, help="per endpoint")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=20, help="untimed requests per endpoint")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    parser.add_argument("--render-cache", action="store_true", help="serve pages from the per-user render cache")
+    parser.add_argument("--stub-port", type=int, default=8081, help="Telegram stub; Solana and Redis take the next two")
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="seconds added to every stubbed call")
+    parser.add_argument("--output", help="also write the report to this file")
+    parser.add_argument("--compare", help="previous report to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed p95/throughput change before failing")
+    args = parser.parse_args()
+
+    configure_env(args)
+    telegram = TelegramStub(default_member=True, latency=args.stub_latency)
+    run_in_thread(telegram.app(), args.stub_port)
+    run_in_thread(SolanaRPCStub(latency=args.stub_latency).app(), args.stub_port + 1)
+    RedisStub(latency=args.stub_latency).run_in_thread(args.stub_port + 2)
+    sys.exit(asyncio.run(main(args)))
@@ -0,0 +1,134 @@
+"""
+Middleware overhead: requests/second for /health and a static file through the full app.
+
+    python tools/bench_middleware.py --requests 3000 --concurrency 50
+
+Stacks:
+  legacy  StaticFilesCORSMiddleware plus the two @app.middleware("http")
+          functions, all BaseHTTPMiddleware, rebuilt here as they were
+  asgi    CCOIN.utils.middleware.ResponseHeadersMiddleware
+
+Requests go in-process through httpx.ASGITransport, so the numbers are
+framework overhead, not network. Uses a throwaway SQLite database unless
+DATABASE_URL is set.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def configure_env():
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+    os.environ.setdefault("BOT_TOKEN", "123456:bench")
+    os.environ.setdefault("SECRET_KEY", "bench-secret")
+    os.environ.setdefault("ENV", "development")
+
+
+def legacy_middleware() -> list:
+    from starlette.middleware import Middleware
+    from starlette.middleware.base import BaseHTTPMiddleware
+    from CCOIN.utils.middleware import SECURITY_HEADERS, STATIC_HEADERS
+
+    class StaticFilesCORSMiddleware(BaseHTTPMiddleware):
+        async def dispatch(self, request, call_next):
+            response = await call_next(request)
+            if request.url.path.startswith('/static/') or request.url.path == '/metadata.html':
+                for name, value in STATIC_HEADERS.items():
+                    response.headers[name] = value
+                response.headers['Cache-Control'] = 'public, max-age=31536000'
+            return response
+
+    async def add_security_headers(request, call_next):
+        response = await call_next(request)
+        for name, value in SECURITY_HEADERS.items():
+            response.headers[name] = value
+        return response
+
+    async def add_process_time_header(request, call_next):
+        start_time = time.time()
+        response = await call_next(request)
+        response.headers["X-Process-Time"] = str(time.time() - start_time)
+        return response
+
+    return [
+        Middleware(BaseHTTPMiddleware, dispatch=add_process_time_header),
+        Middleware(BaseHTTPMiddleware, dispatch=add_security_headers),
+        Middleware(StaticFilesCORSMiddleware),
+    ]
+
+
+def use_stack(app, stack: str, original: list):
+    """Swap ResponseHeadersMiddleware for the legacy layers and rebuild the stack"""
+    from CCOIN.utils.middleware import ResponseHeadersMiddleware
+
+    if stack == "asgi":
+        app.user_middleware = list(original)
+    else:
+        app.user_middleware = []
+        for middleware in original:
+            if middleware.cls is ResponseHeadersMiddleware:
+                app.user_middleware.extend(legacy_middleware())
+            else:
+                app.user_middleware.append(middleware)
+    app.middleware_stack = app.build_middleware_stack()
+
+
+async def run(app, path: str, requests: int, concurrency: int) -> dict:
+    import httpx
+
+    semaphore = asyncio.Semaphore(concurrency)
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://localhost")
+
+    async def hit(_):
+        async with semaphore:
+            response = await client.get(path)
+            response.raise_for_status()
+            assert "x-process-time" in response.headers
+
+    await hit(0)
+    started = time.perf_counter()
+    await asyncio.gather(*(hit(n) for n in range(requests)))
+    elapsed = time.perf_counter() - started
+    await client.aclose()
+    return {"path": path, "requests": requests, "seconds": round(elapsed, 3),
+            "requests_per_second": round(requests / elapsed, 1)}
+
+
+def first_static_file() -> str:
+    root = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "CCOIN", "static")
+    for directory, _, files in sorted(os.walk(root)):
+        for name in sorted(files):
+            if name.endswith((".css", ".js")):
+                return "/static/" + os.path.relpath(os.path.join(directory, name), root).replace(os.sep, "/")
+    raise SystemExit("no static css/js file found")
+
+
+async def main(args):
+    from CCOIN.main import app
+
+    original = list(app.user_middleware)
+    paths = ["/health", args.static_path or first_static_file()]
+    results = []
+    for stack in args.stacks.split(","):
+        use_stack(app, stack, original)
+        for path in paths:
+            results.append({"stack": stack, **await run(app, path, args.requests, args.concurrency)})
+    print(json.dumps({"benchmark": "middleware", "concurrency": args.concurrency, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--stacks", default="legacy,asgi")
+    parser.add_argument("--static-path", help="static URL to fetch (default: first css/js under CCOIN/static)")
+    args = parser.parse_args()
+
+    configure_env()
+    asyncio.run(main(args))
@@ -0,0 +1,56 @@
+"""
+Cold template cost per page: what the first request to each page pays to get its template.
+
+    python tools/bench_templates.py --repeat 5
+
+For every template under CCOIN/templates, in a fresh Environment each time:
+  source    parse + compile from the .html (no bytecode cache: the old per-router setup)
+  bytecode  load from a populated FileSystemBytecodeCache (a new worker after a warm one)
+  memory    already loaded by precompile_templates() at startup
+
+Reports the median milliseconds of --repeat runs.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def measure(make_env, name: str, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        env = make_env()
+        started = time.perf_counter()
+        env.get_template(name)
+        timings.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(timings), 3)
+
+
+def main(args):
+    from CCOIN.utils.templates import create_environment, precompile_templates
+
+    cache_dir = tempfile.mkdtemp(prefix="ccoin-jinja-bench-")
+    warm = create_environment(cache_dir=cache_dir, auto_reload=False)
+    precompile_templates(warm)  # also fills cache_dir
+
+    results = []
+    for name in warm.list_templates(extensions=["html"]):
+        results.append({
+            "template": name,
+            "source_ms": measure(lambda: create_environment(cache_dir="", auto_reload=False), name, args.repeat),
+            "bytecode_ms": measure(lambda: create_environment(cache_dir=cache_dir, auto_reload=False), name, args.repeat),
+            "memory_ms": measure(lambda: warm, name, args.repeat),
+        })
+    totals = {key: round(sum(row[key] for row in results), 3) for key in ("source_ms", "bytecode_ms", "memory_ms")}
+    print(json.dumps({"benchmark": "templates", "repeat": args.repeat, "totals": totals, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    main(parser.parse_args())
@@ -0,0 +1,118 @@
+"""
+Webhook throughput: updates/second for /start updates against a local Bot API stub.
+
+    python tools/bench_webhook.py --updates 500 --concurrency 20
+
+Modes:
+  per-update  what the webhook used to do: new Bot + initialize() (getMe) per update
+  shared      the process-wide get_application().bot, initialized in lifespan
+  endpoint    full POST /telegram_webhook through the ASGI stack; reports the
+              ack rate and the rate until the update queue has drained
+
+Uses a throwaway SQLite database unless DATABASE_URL is set.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stubs import TelegramStub, run_in_thread
+
+
+def configure_env(port: int):
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+    os.environ.setdefault("BOT_TOKEN", "123456:bench")
+    os.environ.setdefault("WEBHOOK_TOKEN", "bench-webhook-token")
+    os.environ.setdefault("SECRET_KEY", "bench-secret")
+    os.environ.setdefault("ENV", "development")
+    os.environ["TELEGRAM_API_BASE_URL"] = f"http://127.0.0.1:{port}"
+
+
+def start_update(update_id: int, user_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Bench"},
+            "text": "/start",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        },
+    }
+
+
+async def run_mode(mode: str, updates: int, concurrency: int, users: int, offset: int) -> dict:
+    import httpx
+    from telegram import Bot, Update
+    from CCOIN.main import app, update_queue
+    from CCOIN.utils.telegram_security import get_application
+
+    telegram_app = get_application()
+    from CCOIN.config import BOT_TOKEN, TELEGRAM_API_BASE_URL
+
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+    client = httpx.AsyncClient(transport=transport, base_url="http://localhost")
+    headers = {"X-Telegram-Bot-Api-Secret-Token": os.environ["WEBHOOK_TOKEN"]}
+
+    async def handle(n: int):
+        payload = start_update(offset + n, 10_000 + n % users)
+        async with semaphore:
+            if mode == "per-update":
+                bot = Bot(token=BOT_TOKEN, base_url=f"{TELEGRAM_API_BASE_URL}/bot")
+                await bot.initialize()
+                await telegram_app.process_update(Update.de_json(payload, bot=bot))
+                await bot.shutdown()
+            elif mode == "shared":
+                await telegram_app.process_update(Update.de_json(payload, bot=telegram_app.bot))
+            else:
+                response = await client.post("/telegram_webhook", json=payload, headers=headers)
+                response.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(handle(n) for n in range(updates)))
+    acked = time.perf_counter() - started
+    await update_queue.join()
+    elapsed = time.perf_counter() - started
+    await client.aclose()
+    result = {"mode": mode, "updates": updates, "seconds": round(elapsed, 3),
+              "updates_per_second": round(updates / elapsed, 1)}
+    if mode == "endpoint":
+        result["acks_per_second"] = round(updates / acked, 1)
+        result["queue"] = update_queue.stats()
+    return result
+
+
+async def main(args, stub):
+    from CCOIN.main import app
+    from CCOIN.database import Base, engine
+
+    Base.metadata.create_all(bind=engine)
+    results = []
+    async with app.router.lifespan_context(app):
+        for i, mode in enumerate(args.modes.split(",")):
+            results.append(await run_mode(mode, args.updates, args.concurrency, args.users, i * args.updates))
+    print(json.dumps({"benchmark": "webhook", "concurrency": args.concurrency, "results": results,
+                      "telegram_calls": stub.calls}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--users", type=int, default=100, help="distinct senders (first /start of each inserts a user)")
+    parser.add_argument("--modes", default="per-update,shared,endpoint")
+    parser.add_argument("--stub-port", type=int, default=8081)
+    parser.add_argument("--stub-latency", type=float, default=0.02, help="simulated Telegram round trip in seconds")
+    args = parser.parse_args()
+
+    configure_env(args.stub_port)
+    stub = TelegramStub(default_member=True, latency=args.stub_latency)
+    run_in_thread(stub.app(), args.stub_port)
+    asyncio.run(main(args, stub))
@@ -0,0 +1,235 @@
+"""
+Build step for /static: content-hashed copies, a manifest, and precompressed variants.
+
+    python tools/build_static.py
+
+For every file under CCOIN/static (except build/ itself) writes
+CCOIN/static/build/<dir>/<name>.<hash>.<ext>, plus .br (when the Brotli
+package is installed) and .gz siblings for text assets when they are
+smaller. build/manifest.json maps "js/airdrop.js" to
+"build/js/airdrop.<hash>.js"; templates resolve it through asset_url().
+
+With Pillow installed, PNG/JPEG images also get AVIF and WebP variants at
+RESPONSIVE_WIDTHS (never upscaled) and a resized PNG fallback, listed in
+build/images.json for the picture() template helper. The report at the
+end estimates bytes per page for a phone at --dpr.
+
+Run it before starting the app (the Dockerfile and Procfile do); with
+ENV=production the app refuses to start without the manifest.
+"""
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from PIL import Image, features
+except ImportError:
+    Image = None
+
+from CCOIN.utils.static_files import STATIC_DIR, BUILD_DIR, MANIFEST_PATH, IMAGES_MANIFEST_PATH
+from CCOIN.utils.templates import TEMPLATES_DIR
+
+COMPRESSIBLE = {".css", ".js", ".svg", ".json", ".html", ".txt", ".map", ".xml", ".ico"}
+HASH_LENGTH = 10
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg"}
+# CSS widths in use run from 32px icons to a 400px logo; these cover them at 1x-3x
+RESPONSIVE_WIDTHS = (64, 128, 200, 400, 800, 1200)
+IMAGE_FORMATS = (
+    # (Pillow format, media type, extension, save options), best first
+    ("AVIF", "image/avif", ".avif", {"quality": 50}),
+    ("WEBP", "image/webp", ".webp", {"quality": 80, "method": 6}),
+)
+
+
+def hashed_name(relative_path: str, content: bytes) -> str:
+    root, ext = os.path.splitext(relative_path)
+    return f"{root}.{hashlib.sha256(content).hexdigest()[:HASH_LENGTH]}{ext}"
+
+
+def write_variants(path: str, content: bytes) -> dict:
+    sizes = {}
+    # mtime=0 keeps the .gz byte-identical across builds
+    variants = [(".gz", gzip.compress(content, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append((".br", brotli.compress(content, quality=11)))
+    for suffix, compressed in variants:
+        if len(compressed) < len(content):
+            with open(path + suffix, "wb") as f:
+                f.write(compressed)
+            sizes[suffix[1:]] = len(compressed)
+    return sizes
+
+
+def write_hashed(relative_path: str, content: bytes) -> str:
+    target = "build/" + hashed_name(relative_path, content)
+    target_path = os.path.join(STATIC_DIR, *target.split("/"))
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    with open(target_path, "wb") as f:
+        f.write(content)
+    return target
+
+
+def encode(image, pillow_format: str, options: dict) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=pillow_format, **options)
+    return buffer.getvalue()
+
+
+def image_formats() -> list:
+    available = []
+    for pillow_format, media_type, ext, options in IMAGE_FORMATS:
+        if features.check(pillow_format.lower()):
+            available.append((pillow_format, media_type, ext, options))
+    return available
+
+
+def build_image_variants(relative_path: str, path: str, formats: list) -> dict:
+    with Image.open(path) as source:
+        source.load()
+        original_width, original_height = source.size
+        widths = sorted({min(width, original_width) for width in RESPONSIVE_WIDTHS})
+        root = os.path.splitext(relative_path)[0]
+        sources = {media_type: [] for _, media_type, _, _ in formats}
+        sizes = {media_type: {} for _, media_type, _, _ in formats}
+        fallback = None
+        for width in widths:
+            height = max(1, round(original_height * width / original_width))
+            resized = source if width == original_width else source.resize((width, height), Image.LANCZOS)
+            for pillow_format, media_type, ext, options in formats:
+                content = encode(resized, pillow_format, options)
+                sources[media_type].append([write_hashed(f"{root}.{width}w{ext}", content), width])
+                sizes[media_type][width] = len(content)
+            if width == widths[-1]:
+                fallback_ext = os.path.splitext(relative_path)[1].lower()
+                if fallback_ext == ".png":
+                    content = encode(resized, "PNG", {"optimize": True})
+                else:
+                    content = encode(resized.convert("RGB"), "JPEG", {"quality": 85, "optimize": True, "progressive": True})
+                fallback = write_hashed(f"{root}.{width}w{fallback_ext}", content)
+                sizes["fallback"] = {width: len(content)}
+    return {
+        "width": original_width,
+        "height": original_height,
+        "sources": sources,
+        "fallback": fallback,
+        "bytes": sizes,
+    }
+
+
+PICTURE_CALL = re.compile(r"""picture\(\s*'([^']+)'\s*(~\s*[\w.]+\s*)?,\s*(\d+)""")
+IMG_ASSET = re.compile(r"""asset_url\(\s*'(images/[^']+)'\s*(~\s*[\w.]+\s*)?\)""")
+
+
+def page_report(original_sizes: dict, images: dict, dpr: float) -> list:
+    """
+    Image bytes per template before and after: the original file against the
+    best format at the smallest width covering the shown width x dpr.
+    A path ending in `~ variable` counts every image under that prefix.
+    """
+    report = []
+    for name in sorted(os.listdir(TEMPLATES_DIR)):
+        if not name.endswith(".html"):
+            continue
+        with open(os.path.join(TEMPLATES_DIR, name), encoding="utf-8") as f:
+            html = f.read()
+        uses = [(path, bool(dynamic), int(width)) for path, dynamic, width in PICTURE_CALL.findall(html)]
+        uses += [(path, bool(dynamic), None) for path, dynamic in IMG_ASSET.findall(html)]
+        if not uses:
+            continue
+
+        before = after = 0
+        for path, dynamic, width in uses:
+            paths = [p for p in original_sizes if p.startswith(path)] if dynamic else [path]
+            for image_path in paths:
+                original = original_sizes.get(image_path, 0)
+                before += original
+                variant = images.get(image_path)
+                if not variant or width is None:
+                    after += original
+                    continue
+                needed = width * dpr
+                candidates = []
+                for per_width in variant["bytes"].values():
+                    fitting = [w for w in per_width if w >= needed] or [max(per_width)]
+                    candidates.append(per_width[min(fitting)])
+                after += min(candidates)
+        report.append({"page": name, "image_bytes": before, "optimized_bytes": after, "saved_bytes": before - after})
+    return report
+
+
+def source_files():
+    for directory, subdirs, files in os.walk(STATIC_DIR):
+        if os.path.realpath(directory) == os.path.realpath(STATIC_DIR) and "build" in subdirs:
+            subdirs.remove("build")
+        for name in sorted(files):
+            if name.startswith("."):
+                continue
+            path = os.path.join(directory, name)
+            yield os.path.relpath(path, STATIC_DIR).replace(os.sep, "/"), path
+
+
+def build(dpr: float = 2.0) -> dict:
+    shutil.rmtree(BUILD_DIR, ignore_errors=True)
+    manifest = {}
+    images = {}
+    original_sizes = {}
+    report = []
+    formats = image_formats() if Image is not None else []
+    for relative_path, path in source_files():
+        with open(path, "rb") as f:
+            content = f.read()
+        target = write_hashed(relative_path, content)
+        manifest[relative_path] = target
+        original_sizes[relative_path] = len(content)
+
+        entry = {"file": relative_path, "bytes": len(content)}
+        ext = os.path.splitext(relative_path)[1].lower()
+        if ext in COMPRESSIBLE:
+            entry.update(write_variants(os.path.join(STATIC_DIR, *target.split("/")), content))
+        elif ext in IMAGE_EXTENSIONS and formats:
+            images[relative_path] = build_image_variants(relative_path, path, formats)
+            entry["variants"] = sum(len(candidates) for candidates in images[relative_path]["sources"].values())
+        report.append(entry)
+
+    with open(MANIFEST_PATH, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    with open(IMAGES_MANIFEST_PATH, "w", encoding="utf-8") as f:
+        json.dump(images, f, indent=2, sort_keys=True)
+    return {
+        "files": len(manifest),
+        "brotli": brotli is not None,
+        "image_formats": [media_type for _, media_type, _, _ in formats],
+        "assets": report,
+        "pages": page_report(original_sizes, images, dpr),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quiet", action="store_true", help="print only the summary lines")
+    parser.add_argument("--dpr", type=float, default=2.0, help="device pixel ratio assumed by the page report")
+    args = parser.parse_args()
+
+    result = build(args.dpr)
+    if Image is None:
+        print("Pillow not installed: no responsive image variants built", file=sys.stderr)
+    if args.quiet:
+        print(f"built {result['files']} static files into {BUILD_DIR}")
+        for page in result["pages"]:
+            print(f"{page['page']}: {page['image_bytes']} -> {page['optimized_bytes']} image bytes")
+    else:
+        print(json.dumps(result, indent=2))
@@ -0,0 +1,173 @@
+"""
+Startup-time budget: how long `import CCOIN.main` takes in a fresh process,
+and what it costs.
+
+    python tools/measure_startup.py --runs 5 --budget-ms 1400 --max-modules 1000
+    python tools/measure_startup.py --startup
+
+Each run is a new interpreter against a throwaway SQLite database, so
+nothing is cached in-process between runs (the OS file cache is warm after
+the first). The report has the median and best wall time of the import,
+the number of modules it loads, the packages with the most import time of
+their own (from one more run under `-X importtime`, which slows the import
+down, so it is not timed), and LAZY_MODULES that were imported anyway:
+those are only needed at their call sites or once the app has started, and
+must stay off the import path.
+
+With --startup the app's lifespan also runs once (database init, Telegram
+Application init, template precompile, queue and scheduler start) against
+the local stubs from stubs.py, and its time to ready is reported.
+
+Exit status is 1 when the best import time exceeds --budget-ms, more than
+--max-modules modules are loaded, or a lazy module was imported. The best
+run is the one held to the budget because the median moves by a few
+hundred milliseconds with machine load; the module count does not move at
+all, so it catches a new eager import even where timings are noisy.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+# imported on first use only: python-telegram-bot when the Application is
+# built at startup, solana/solders/nacl by the endpoints that talk to the
+# chain or to Phantom, requests and pyinstrument by opt-in diagnostics
+LAZY_MODULES = ("telegram", "solana", "solders", "nacl", "requests", "pyinstrument")
+
+IMPORT_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import CCOIN.main
+seconds = time.perf_counter() - started
+print(json.dumps({"seconds": seconds, "modules": sorted(sys.modules)}))
+"""
+
+STARTUP_SCRIPT = """
+import asyncio, json, sys, time
+sys.path.insert(0, %(tools)r)
+from stubs import RedisStub, SolanaRPCStub, TelegramStub, run_in_thread
+run_in_thread(TelegramStub(default_member=True).app(), %(port)d)
+run_in_thread(SolanaRPCStub().app(), %(port)d + 1)
+RedisStub().run_in_thread(%(port)d + 2)
+started = time.perf_counter()
+from CCOIN.main import app
+imported = time.perf_counter()
+
+async def main():
+    async with app.router.lifespan_context(app):
+        ready = time.perf_counter()
+    print(json.dumps({"import": imported - started, "lifespan": ready - imported}))
+
+asyncio.run(main())
+"""
+
+
+def child_env(stub_port: int = None) -> dict:
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/startup.db")
+    env.setdefault("BOT_TOKEN", "123456:startup")
+    env.setdefault("SECRET_KEY", "startup-secret")
+    env.setdefault("ENV", "development")
+    env.setdefault("REDIS_URL", "redis://127.0.0.1:1/0")
+    env["PYTHONPATH"] = REPO + os.pathsep + env.get("PYTHONPATH", "")
+    if stub_port:
+        env["TELEGRAM_API_BASE_URL"] = f"http://127.0.0.1:{stub_port}"
+        env["SOLANA_RPC"] = f"http://127.0.0.1:{stub_port + 1}"
+        env["REDIS_URL"] = f"redis://127.0.0.1:{stub_port + 2}/0"
+    return env
+
+
+def last_json_line(output: str) -> dict:
+    """The app logs on import; the measurement is the last line printed"""
+    for line in reversed(output.strip().splitlines()):
+        if line.startswith("{") and line.endswith("}"):
+            return json.loads(line)
+    raise SystemExit("no measurement in child output:\n" + output[-2000:])
+
+
+def parse_importtime(stderr: str) -> dict:
+    """Self time per top-level package, in microseconds, from -X importtime"""
+    totals = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|", 2)
+        try:
+            self_us = int(self_us)
+        except ValueError:
+            continue  # the header line
+        package = name.strip().split(".")[0]
+        totals[package] = totals.get(package, 0) + self_us
+    return totals
+
+
+def measure_import(env: dict, importtime: bool = False) -> dict:
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", IMPORT_SCRIPT]
+    result = subprocess.run(command, capture_output=True, text=True, env=env, cwd=REPO)
+    if result.returncode != 0:
+        raise SystemExit("import CCOIN.main failed:\n" + result.stderr[-2000:])
+    measurement = last_json_line(result.stdout)
+    measurement["packages"] = parse_importtime(result.stderr) if importtime else {}
+    return measurement
+
+
+def measure_startup(env: dict, stub_port: int) -> dict:
+    script = STARTUP_SCRIPT % {"tools": os.path.join(REPO, "tools"), "port": stub_port}
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, env=env, cwd=REPO)
+    if result.returncode != 0:
+        raise SystemExit("lifespan run failed:\n" + result.stderr[-2000:])
+    measurement = last_json_line(result.stdout)
+    return {"import_ms": round(measurement["import"] * 1000, 1),
+            "lifespan_ms": round(measurement["lifespan"] * 1000, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=1400, help="allowed best import time; most of it is fastapi and sqlalchemy")
+    parser.add_argument("--max-modules", type=int, default=1000, help="allowed number of modules loaded by the import")
+    parser.add_argument("--top", type=int, default=15, help="packages to list by import self time")
+    parser.add_argument("--startup", action="store_true", help="also run the lifespan once against the stubs")
+    parser.add_argument("--stub-port", type=int, default=8091, help="Telegram stub; Solana and Redis take the next two")
+    args = parser.parse_args()
+
+    env = child_env()
+    runs = [measure_import(env) for _ in range(args.runs)]
+    seconds = [run["seconds"] for run in runs]
+    min_ms = round(min(seconds) * 1000, 1)
+    modules = max(len(run["modules"]) for run in runs)
+    breakdown = measure_import(env, importtime=True)
+    packages = breakdown["packages"]
+    imported_lazy = [name for name in LAZY_MODULES if name in breakdown["modules"]]
+
+    report = {
+        "import": {
+            "runs": args.runs,
+            "median_ms": round(statistics.median(seconds) * 1000, 1),
+            "min_ms": min_ms,
+            "budget_ms": args.budget_ms,
+            "modules": modules,
+            "max_modules": args.max_modules,
+        },
+        "top_packages_ms": {
+            name: round(us / 1000, 1)
+            for name, us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:args.top]
+        },
+        "lazy_modules_imported": imported_lazy,
+    }
+    if args.startup:
+        report["startup"] = measure_startup(child_env(args.stub_port), args.stub_port)
+    ok = min_ms <= args.budget_ms and modules <= args.max_modules and not imported_lazy
+    report["ok"] = ok
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+SQL statement budget per page: fails when an endpoint runs more statements
+than it is allowed, or repeats one statement (the N+1 shape).
+
+    python tools/query_budget.py --referrals 20
+
+Seeds one user with the given number of referrals and a task per platform in a throwaway
+SQLite database, opens a session through /home, then requests every
+endpoint in BUDGETS under CCOIN.utils.query_stats.assert_max_queries. The
+counts must not grow with the seeded rows, so run it with a few sizes.
+Requests go in-process through httpx.ASGITransport; the render cache is
+off so every request really builds its page. Redis is the in-memory stub
+from stubs.py unless REDIS_URL is set, since some endpoints cannot answer
+without it. An endpoint passes only with a 2xx response: the statements of
+an error page say nothing about the page's budget.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+TOOLS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TOOLS))
+sys.path.insert(0, TOOLS)
+
+TELEGRAM_ID = "900000001"
+NO_CODE_TELEGRAM_ID = "900000002"  # a user the friends page has to give a referral code
+
+# (method, path) -> max statements, including the session's own user lookup
+BUDGETS = {
+    ("GET", "/home/"): 3,
+    ("GET", "/friends/"): 2,  # the user, the invited users
+    ("GET", "/earn/"): 10,  # the social re-check may apply a penalty
+    ("GET", "/airdrop/"): 4,
+    ("GET", f"/usertasks/status?user_id={TELEGRAM_ID}"): 4,
+    # the user, the code's uniqueness check, its UPDATE, the user again after the commit, the invited users;
+    # last, since it switches the session to this user
+    ("GET", f"/friends/?telegram_id={NO_CODE_TELEGRAM_ID}"): 5,
+}
+MAX_REPEATS = 3  # earn reads the balance before and after its penalty check, then for the page
+
+
+def configure_env(redis_port: int):
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/budget.db")
+    os.environ.setdefault("BOT_TOKEN", "123456:budget")
+    os.environ.setdefault("SECRET_KEY", "budget-secret")
+    if not os.environ.get("REDIS_URL"):
+        from stubs import RedisStub
+        RedisStub().run_in_thread(redis_port)
+        os.environ["REDIS_URL"] = f"redis://127.0.0.1:{redis_port}/0"
+    os.environ["ENV"] = "development"
+    os.environ["RENDER_CACHE_ENABLED"] = "false"
+
+
+def seed(referrals: int):
+    from CCOIN.database import SessionLocal
+    from CCOIN.models.user import User
+    from CCOIN.models.usertask import UserTask
+
+    with SessionLocal() as db:
+        user = User(telegram_id=TELEGRAM_ID, username="budget", first_name="Budget", last_name="User", referral_code="BUDGET01",
+                    first_login=False)
+        db.add(user)
+        db.flush()
+        for i in range(referrals):
+            db.add(User(telegram_id=str(910000000 + i), username=f"friend{i}", first_name="F", last_name="R", referred_by=user.id))
+        for platform in ("telegram", "instagram", "x", "youtube"):
+            db.add(UserTask(user_id=user.id, platform=platform, completed=platform == "telegram"))
+        db.add(User(telegram_id=NO_CODE_TELEGRAM_ID, username="nocode", first_name="No", last_name="Code", first_login=False))
+        db.commit()
+
+
+async def run(max_repeats: int) -> dict:
+    import httpx
+    from CCOIN.main import app
+    from CCOIN.utils.query_stats import assert_max_queries
+
+    report = {}
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://localhost") as client:
+        await client.get(f"/home/?telegram_id={TELEGRAM_ID}")
+        for (method, path), budget in BUDGETS.items():
+            entry = report[path] = {"budget": budget}
+            try:
+                with assert_max_queries(budget, max_repeats) as stats:
+                    response = await client.request(method, path)
+                entry["ok"] = response.is_success
+                if not response.is_success:
+                    entry["error"] = f"HTTP {response.status_code}: {response.text[:200]}"
+            except AssertionError as e:
+                entry["ok"] = False
+                entry["error"] = str(e)
+            entry["status"] = response.status_code
+            entry["statements"] = stats.count
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--referrals", type=int, default=20)
+    parser.add_argument("--max-repeats", type=int, default=MAX_REPEATS)
+    parser.add_argument("--redis-port", type=int, default=8095, help="for the Redis stub when REDIS_URL is not set")
+    args = parser.parse_args()
+
+    configure_env(args.redis_port)
+    from CCOIN.main import app  # noqa: F401  (registers every model)
+    from CCOIN.database import init_db
+    init_db()
+
+    seed(args.referrals)
+    report = asyncio.run(run(args.max_repeats))
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if all(entry["ok"] for entry in report.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Concurrent /start storm against one referrer; exits non-zero if registration loses updates.
+
+    DATABASE_URL=postgresql://... python tools/stress_start.py --users 300 --repeats 2 --workers 4 --require-postgres
+
+Every new user sends /start with the same referral code `--repeats` times at
+once, all through telegram_app.process_update with the Bot API stubbed.
+With --workers N the storm runs in N processes at once, each with its own
+Application, registration writer and connection pool, all sending every
+user's /start: their multi-row upserts then race on the same telegram_ids
+the way several app workers do, which is what row locking, ON CONFLICT and
+lock ordering in register_batch have to get right.
+Checks afterwards:
+  - one row per new user, no errors replied to anyone
+  - the referrer's ledger balance grew by exactly REFERRAL_BONUS per new user
+
+Uses a throwaway SQLite database unless DATABASE_URL is set. SQLite locks
+the whole database for a write, so the upsert race only happens on
+Postgres; the report's "dialect" says which one ran, and
+--require-postgres makes anything else fail (exit status 2) so a CI job
+cannot pass on SQLite by accident.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stubs import TelegramStub, run_in_thread
+
+
+def configure_env(port: int):
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/stress.db")
+    os.environ.setdefault("BOT_TOKEN", "123456:stress")
+    os.environ["TELEGRAM_API_BASE_URL"] = f"http://127.0.0.1:{port}"
+
+
+def seed_referrer() -> tuple:
+    from CCOIN.database import Base, engine, SessionLocal
+    from CCOIN.models.user import User
+    from CCOIN.models import airdrop, transaction, usertask  # noqa: F401  (User's relationships)
+
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        db.query(User).filter(User.referred_by.isnot(None)).delete()
+        db.query(User).filter(User.telegram_id == "stress-referrer").delete()
+        referrer = User(telegram_id="stress-referrer", referral_code="STRESS01", tokens=1000)
+        db.add(referrer)
+        db.commit()
+        return referrer.id, referrer.tokens
+
+
+def start_update(update_id: int, user_id: int, referral_code: str) -> dict:
+    text = f"/start {referral_code}"
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Stress"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        },
+    }
+
+
+async def storm(args, start_at: float = 0.0) -> dict:
+    """Send every user's /start `repeats` times through this process's Application"""
+    from telegram import Update
+    from CCOIN.models import airdrop, transaction, usertask  # noqa: F401  (User's relationships, in a child)
+    from CCOIN.utils.registration import registration_writer
+    from CCOIN.utils.telegram_security import get_application
+
+    telegram_app = get_application()
+    await telegram_app.initialize()
+
+    updates = [
+        start_update(n, args.first_user_id + n % args.users, "STRESS01")
+        for n in range(args.users * args.repeats)
+    ]
+    await asyncio.sleep(max(0.0, start_at - time.time()))  # every worker starts together
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        telegram_app.process_update(Update.de_json(payload, bot=telegram_app.bot)) for payload in updates
+    ))
+    elapsed = time.perf_counter() - started
+    await telegram_app.shutdown()
+    return {"updates": len(updates), "seconds": elapsed, "registration_writer": registration_writer.stats}
+
+
+def run_workers(args) -> list:
+    """Storm from `workers` child processes at once; their reports, in order"""
+    start_at = time.time() + 3  # time for every child to import the app
+    command = [sys.executable, os.path.abspath(__file__), "--child", "--start-at", str(start_at),
+               "--users", str(args.users), "--repeats", str(args.repeats),
+               "--first-user-id", str(args.first_user_id), "--stub-port", str(args.stub_port)]
+    children = [subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+                for _ in range(args.workers)]
+    reports = []
+    for child in children:
+        stdout, stderr = child.communicate()
+        if child.returncode != 0:
+            raise SystemExit("stress worker failed:\n" + stderr[-2000:])
+        reports.append(json.loads(stdout.strip().splitlines()[-1]))
+    return reports
+
+
+async def main(args, stub) -> int:
+    from sqlalchemy import func
+    from CCOIN.database import SessionLocal, engine
+    from CCOIN.models.user import User
+    from CCOIN.utils import ledger
+    from CCOIN.utils.registration import REFERRAL_BONUS
+
+    dialect = engine.dialect.name
+    if args.require_postgres and dialect != "postgresql":
+        print(json.dumps({"dialect": dialect, "ok": False, "error": "--require-postgres: set DATABASE_URL to Postgres"}))
+        return 2
+
+    referrer_id, initial_tokens = seed_referrer()
+    if args.workers > 1:
+        workers = await asyncio.to_thread(run_workers, args)
+    else:
+        workers = [await storm(args)]
+    updates = sum(worker["updates"] for worker in workers)
+    elapsed = max(worker["seconds"] for worker in workers)
+
+    with SessionLocal() as db:
+        registered = db.query(func.count(User.id)).filter(User.referred_by == referrer_id).scalar()
+        referrer_tokens = ledger.get_balance(db, referrer_id)
+
+    errors = sum(1 for m in stub.sent_messages if "error occurred" in m.get("text", ""))
+    expected_tokens = initial_tokens + REFERRAL_BONUS * args.users
+    report = {
+        "dialect": dialect,
+        "workers": args.workers,
+        "updates": updates,
+        "seconds": round(elapsed, 2),
+        "updates_per_second": round(updates / elapsed, 1),
+        "new_users": registered,
+        "expected_new_users": args.users,
+        "referrer_tokens": referrer_tokens,
+        "expected_referrer_tokens": expected_tokens,
+        "error_replies": errors,
+        "registration_writer": [worker["registration_writer"] for worker in workers],
+    }
+    ok = registered == args.users and referrer_tokens == expected_tokens and errors == 0
+    report["ok"] = ok
+    print(json.dumps(report, indent=2))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=300, help="distinct new users")
+    parser.add_argument("--repeats", type=int, default=2, help="simultaneous /start updates per user")
+    parser.add_argument("--first-user-id", type=int, default=700_000)
+    parser.add_argument("--stub-port", type=int, default=8083)
+    parser.add_argument("--workers", type=int, default=1, help="processes storming at once, like app workers")
+    parser.add_argument("--require-postgres", action="store_true", help="fail unless DATABASE_URL is Postgres")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--start-at", type=float, default=0.0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    configure_env(args.stub_port)
+    if args.child:
+        # the parent seeded the database and serves the stub; report on the last line
+        print(json.dumps(asyncio.run(storm(args, args.start_at))))
+        sys.exit(0)
+    stub = TelegramStub()
+    run_in_thread(stub.app(), args.stub_port)
+    sys.exit(asyncio.run(main(args, stub)))
@@ -0,0 +1,374 @@
+"""
+Local stand-ins for external services, for running the app without network.
+
+    python tools/stubs.py --port 8081 --members 100,101
+    python tools/stubs.py --service redis --port 6390
+    python tools/stubs.py --service solana --port 8899
+
+then start the app with TELEGRAM_API_BASE_URL=http://127.0.0.1:8081 so the
+verifier plugins, the sweeper and the bot talk to the stub instead of
+api.telegram.org (REDIS_URL=redis://127.0.0.1:6390/0 and
+SOLANA_RPC=http://127.0.0.1:8899 for the other two). Benchmarks import
+`run_in_thread` and `RedisStub.run_in_thread` to do the same in-process.
+"""
+import argparse
+import asyncio
+import os
+import re
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+
+class TelegramStub:
+    """Minimal Bot API: channel membership, getMe, sendMessage (with optional flood limits) and webhook calls"""
+
+    def __init__(self, members=None, latency: float = 0.0, default_member: bool = False,
+                 flood_limit: int = 0, chat_interval: float = 0.0):
+        self.members = set(str(m) for m in (members or []))
+        self.left = set()
+        self.default_member = default_member
+        self.latency = latency
+        self.calls = {}
+        self.sent_messages = []
+        self._message_id = 0
+        self.flood_limit = flood_limit
+        self.chat_interval = chat_interval
+        self.flood_errors = 0
+        self._window = (0, 0)
+        self._last_chat_send = {}
+
+    async def _params(self, request: Request) -> dict:
+        params = dict(request.query_params)
+        if request.method == "POST":
+            content_type = request.headers.get("content-type", "")
+            if "json" in content_type:
+                params.update(await request.json())
+            else:
+                params.update(dict(await request.form()))
+        return params
+
+    def _flooded(self, chat_id: str) -> bool:
+        """Emulate Telegram's per-bot messages/second and per-chat limits when configured"""
+        now = time.monotonic()
+        second, count = self._window
+        if int(now) != second:
+            second, count = int(now), 0
+        last = self._last_chat_send.get(chat_id)
+        if (self.flood_limit and count >= self.flood_limit) or (
+                self.chat_interval and last is not None and now - last < self.chat_interval):
+            self.flood_errors += 1
+            return True
+        self._window = (second, count + 1)
+        self._last_chat_send[chat_id] = now
+        return False
+
+    def _is_member(self, user_id: str) -> bool:
+        if user_id in self.left:
+            return False
+        return user_id in self.members or self.default_member
+
+    async def handle(self, request: Request):
+        method = request.path_params["method"]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        params = await self._params(request)
+
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "CCoin", "username": "CTG_COIN_BOT",
+                      "can_join_groups": False, "can_read_all_group_messages": False,
+                      "supports_inline_queries": False}
+        elif method == "getChatMember":
+            user_id = str(params.get("user_id"))
+            status = "member" if self._is_member(user_id) else "left"
+            result = {"status": status, "user": {"id": int(user_id), "is_bot": False, "first_name": "Stub"}}
+        elif method == "sendMessage":
+            if self._flooded(str(params.get("chat_id"))):
+                return JSONResponse({"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                                     "parameters": {"retry_after": 1}}, 429)
+            self._message_id += 1
+            self.sent_messages.append(params)
+            result = {"message_id": self._message_id, "date": int(time.time()),
+                      "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+                      "text": params.get("text", "")}
+        elif method == "getWebhookInfo":
+            result = {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+        elif method in ("setWebhook", "setChatMenuButton", "deleteWebhook"):
+            result = True
+        else:
+            return JSONResponse({"ok": False, "error_code": 404, "description": "Not Found: method not stubbed"}, 404)
+
+        return JSONResponse({"ok": True, "result": result})
+
+    def app(self) -> Starlette:
+        return Starlette(routes=[Route("/bot{token}/{method}", self.handle, methods=["GET", "POST"])])
+
+
+class SolanaRPCStub:
+    """JSON-RPC answers for the calls the app makes: no transactions, no signatures, empty balances"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = {}
+
+    def _result(self, method: str):
+        context = {"slot": 1, "apiVersion": "1.18.0"}
+        if method in ("getTransaction", "getAccountInfo"):
+            return None
+        if method == "getSignaturesForAddress":
+            return []
+        if method == "getLatestBlockhash":
+            return {"context": context, "value": {"blockhash": "11111111111111111111111111111111", "lastValidBlockHeight": 1}}
+        if method in ("getBalance", "getTokenAccountBalance"):
+            return {"context": context, "value": 0}
+        if method == "getTokenAccountsByOwner":
+            return {"context": context, "value": []}
+        if method == "getHealth":
+            return "ok"
+        raise KeyError(method)
+
+    async def handle(self, request: Request):
+        payload = await request.json()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        answers = []
+        for call in payload if isinstance(payload, list) else [payload]:
+            method = call.get("method")
+            self.calls[method] = self.calls.get(method, 0) + 1
+            try:
+                answers.append({"jsonrpc": "2.0", "id": call.get("id"), "result": self._result(method)})
+            except KeyError:
+                answers.append({"jsonrpc": "2.0", "id": call.get("id"), "error": {"code": -32601, "message": "Method not found"}})
+        return JSONResponse(answers if isinstance(payload, list) else answers[0])
+
+    def app(self) -> Starlette:
+        return Starlette(routes=[Route("/", self.handle, methods=["POST"])])
+
+
+# if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('<command>', KEYS[1], ...)
+COMPARE_AND_ACT = re.compile(r"redis\.call\('get', KEYS\[1\]\) == ARGV\[1\].*?redis\.call\('(\w+)', KEYS\[1\]", re.S)
+
+
+class RedisStub:
+    """
+    In-memory RESP server with the commands the app uses: strings with
+    expiry, counters, hashes, MULTI/EXEC pipelines and the compare-and-act
+    EVAL scripts of the leader lock. Unknown commands get an error reply,
+    like a Redis that lacks them.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.data = {}
+        self.expires = {}
+        self.calls = {}
+
+    def _alive(self, key):
+        expires = self.expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    def _expire(self, key, seconds):
+        self.expires[key] = time.monotonic() + seconds
+
+    def _int(self, key) -> int:
+        return int(self.data[key]) if self._alive(key) else 0
+
+    def _hash(self, key) -> dict:
+        if not self._alive(key):
+            self.data[key] = {}
+        return self.data[key]
+
+    def execute(self, name: str, args: list):
+        if name == "PING":
+            return "+PONG"
+        if name in ("SELECT", "CLIENT", "FLUSHDB"):
+            if name == "FLUSHDB":
+                self.data.clear()
+                self.expires.clear()
+            return "+OK"
+        if name in ("GET", "GETDEL"):
+            value = self.data[args[0]] if self._alive(args[0]) else None
+            if name == "GETDEL":
+                self.data.pop(args[0], None)
+                self.expires.pop(args[0], None)
+            return value
+        if name == "MGET":
+            return [self.data[key] if self._alive(key) else None for key in args]
+        if name in ("SET", "SETEX", "PSETEX"):
+            if name == "SET":
+                key, value, options = args[0], args[1], [a.decode().upper() for a in args[2::]]
+            else:
+                key, value, options = args[0], args[2], ["EX" if name == "SETEX" else "PX", args[1].decode()]
+            exists = self._alive(key)
+            if ("NX" in options and exists) or ("XX" in options and not exists):
+                return None
+            self.data[key] = value
+            if "KEEPTTL" not in options:
+                self.expires.pop(key, None)
+            for unit, scale in (("EX", 1), ("PX", 0.001)):
+                if unit in options:
+                    self._expire(key, float(options[options.index(unit) + 1]) * scale)
+            return "+OK"
+        if name in ("DEL", "UNLINK"):
+            removed = sum(1 for key in args if self._alive(key))
+            for key in args:
+                self.data.pop(key, None)
+                self.expires.pop(key, None)
+            return removed
+        if name == "EXISTS":
+            return sum(1 for key in args if self._alive(key))
+        if name in ("INCR", "INCRBY", "DECR", "DECRBY"):
+            step = int(args[1]) if len(args) > 1 else 1
+            value = self._int(args[0]) + (-step if name.startswith("DECR") else step)
+            self.data[args[0]] = str(value).encode()
+            return value
+        if name in ("EXPIRE", "PEXPIRE"):
+            if not self._alive(args[0]):
+                return 0
+            self._expire(args[0], int(args[1]) * (1 if name == "EXPIRE" else 0.001))
+            return 1
+        if name in ("TTL", "PTTL"):
+            if not self._alive(args[0]):
+                return -2
+            expires = self.expires.get(args[0])
+            if expires is None:
+                return -1
+            return int((expires - time.monotonic()) * (1 if name == "TTL" else 1000))
+        if name == "HSET":
+            fields = self._hash(args[0])
+            added = sum(1 for field in args[1::2] if field not in fields)
+            fields.update(zip(args[1::2], args[2::2]))
+            return added
+        if name == "HGET":
+            return self._hash(args[0]).get(args[1])
+        if name == "HGETALL":
+            return [item for pair in self._hash(args[0]).items() for item in pair]
+        if name == "HDEL":
+            fields = self._hash(args[0])
+            return sum(1 for field in args[1:] if fields.pop(field, None) is not None)
+        if name == "HLEN":
+            return len(self._hash(args[0]))
+        if name == "EVAL":
+            # only the compare-and-act scripts the app runs (leader lock renew/release)
+            match = COMPARE_AND_ACT.search(args[0].decode())
+            if not match or int(args[1]) != 1:
+                return Exception("ERR script not supported by the stub")
+            key, expected, rest = args[2], args[3], args[4:]
+            if not self._alive(key) or self.data[key] != expected:
+                return 0
+            return self.execute(match.group(1).upper(), [key] + rest)
+        return Exception(f"ERR unknown command '{name}'")
+
+    @staticmethod
+    def encode(value) -> bytes:
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, str):
+            return value.encode() + b"\r\n"
+        if isinstance(value, Exception):
+            return f"-{value}\r\n".encode()
+        if isinstance(value, int):
+            return f":{value}\r\n".encode()
+        if isinstance(value, list):
+            return f"*{len(value)}\r\n".encode() + b"".join(RedisStub.encode(item) for item in value)
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+
+    @staticmethod
+    async def read_command(reader: asyncio.StreamReader) -> list:
+        header = await reader.readline()
+        if not header:
+            raise ConnectionResetError
+        args = []
+        for _ in range(int(header[1:])):
+            length = int((await reader.readline())[1:])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    async def serve_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        queued = None
+        try:
+            while True:
+                args = await self.read_command(reader)
+                name = args[0].decode().upper()
+                self.calls[name] = self.calls.get(name, 0) + 1
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                if name == "MULTI":
+                    queued, reply = [], "+OK"
+                elif name == "EXEC":
+                    reply, queued = [self.execute(cmd[0].decode().upper(), cmd[1:]) for cmd in queued or []], None
+                elif name == "DISCARD":
+                    queued, reply = None, "+OK"
+                elif queued is not None:
+                    queued.append(args)
+                    reply = "+QUEUED"
+                else:
+                    reply = self.execute(name, args[1:])
+                writer.write(self.encode(reply))
+                await writer.drain()
+        except (ConnectionResetError, asyncio.IncompleteReadError, BrokenPipeError):
+            pass
+        finally:
+            writer.close()
+
+    def run_in_thread(self, port: int):
+        """Serve on 127.0.0.1:port from a daemon thread and wait until it is up"""
+        ready = threading.Event()
+
+        async def serve():
+            server = await asyncio.start_server(self.serve_client, "127.0.0.1", port)
+            ready.set()
+            async with server:
+                await server.serve_forever()
+
+        threading.Thread(target=asyncio.run, args=(serve(),), daemon=True).start()
+        ready.wait()
+
+
+def run_in_thread(app, port: int) -> uvicorn.Server:
+    """Serve an ASGI app on 127.0.0.1:port from a daemon thread and wait until it is up"""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--service", choices=("telegram", "redis", "solana"), default="telegram")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--members", default="", help="comma separated telegram ids that are channel members")
+    parser.add_argument("--default-member", action="store_true", help="treat unknown users as members")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every call")
+    parser.add_argument("--flood-limit", type=int, default=0, help="sendMessage calls per second before 429s")
+    parser.add_argument("--chat-interval", type=float, default=0.0, help="minimum seconds between messages to one chat")
+    args = parser.parse_args()
+
+    if args.service == "redis":
+        RedisStub(latency=args.latency).run_in_thread(args.port)
+        threading.Event().wait()
+    elif args.service == "solana":
+        uvicorn.run(SolanaRPCStub(latency=args.latency).app(), host="127.0.0.1", port=args.port, log_level="info")
+    else:
+        stub = TelegramStub(
+            members=[m for m in args.members.split(",") if m],
+            latency=args.latency,
+            default_member=args.default_member,
+            flood_limit=args.flood_limit,
+            chat_interval=args.chat_interval
+        )
+        uvicorn.run(stub.app(), host="127.0.0.1", port=args.port, log_level="info")